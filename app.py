@@ -37,6 +37,7 @@ split across two different apps).
 import uuid
 import os
 import re
+import threading
 import sgtk
 import datetime
 import pprint
@@ -56,11 +57,6 @@ class FlameExport(Application):
         """
         self.log_debug("%s: Initializing" % self)
                 
-        # shot metadata. As the exporter steps through its various callbacks,
-        # this data structure will be populated and used to pass information
-        # down between methods.
-        self._shots = {}
-        
         # create a submit helper
         # because parts of this app runs on the farm, which doesn't have a UI,
         # there are two distinct modules on disk, one which is QT dependent and
@@ -68,21 +64,30 @@ class FlameExport(Application):
         tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
         self._sg_submit_helper = tk_flame_export_no_ui.ShotgunSubmitter()
         
+        # export session state. Flame passes a session id to all of its export hooks. 
+        # For each session, a metadata structure is populated as the exporter steps 
+        # through its various callbacks and used to pass information down between methods. 
+        self._export_sessions = tk_flame_export_no_ui.ExportSessionRegistry()
+        
         # batch render tracking - when doing a batch render, 
         # this is used to indicate that the user wants to send the render to review.
         self._send_batch_render_to_review = False
+        self._batch_user_comments = None
+        # follower for a render which is being transcoded while it renders, see pre_batch_render_checks
+        self._batch_follower = None
         
-        # Shot export user UI input
-        self._user_comments = ""
-        self._export_preset_name = None
-        
-        # flag to indicate that something was actually submitted by the export process
-        self._reached_post_asset_phase = False
+        # batch renders waiting to be submitted together, see post_batch_render_sg_process
+        self._pending_batch_renders = []
+        self._pending_batch_renders_lock = threading.Lock()
+        self._pending_batch_renders_timer = None
         
         # load up our export presets
         # this wrapper class is used later on to access export presets in various ways
         self.export_preset_handler = tk_flame_export_no_ui.ExportPresetHandler()
         
+        # local job runner, created on demand if the job_runner setting asks for it
+        self._local_job_runner = None
+        
         # register our desired interaction with Flame hooks
         # set up callbacks for the engine to trigger 
         # when this profile is being triggered
@@ -101,6 +106,39 @@ class FlameExport(Application):
         batch_callbacks["batchExportBegin"] = self.pre_batch_render_checks
         self.engine.register_batch_hook(batch_callbacks)
 
+    def destroy_app(self):
+        """
+        Called as the application is being torn down.
+        """
+        self.log_debug("%s: Destroying" % self)
+        
+        # don't leave any batch renders behind
+        self.__submit_pending_batch_renders()
+        
+        if self._local_job_runner:
+            # let any work running locally complete
+            self._local_job_runner.close()
+            self._local_job_runner = None
+
+    @property
+    def job_runner(self):
+        """
+        The object which runs the backburner callbacks of this app. This is normally
+        the engine, which submits them to backburner. If the job_runner setting is 
+        'local', callbacks are instead run in a pool of processes on this machine, 
+        except for those which depend on a backburner job.
+        
+        Either way, jobs are submitted via its create_local_backburner_job() method.
+        """
+        if self.get_setting("job_runner") != "local":
+            return self.engine
+        
+        if self._local_job_runner is None:
+            tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+            self._local_job_runner = tk_flame_export_no_ui.LocalJobRunner(self.get_setting("local_job_runner_processes"),
+                                                                          self.get_setting("local_job_timeout"))
+        return self._local_job_runner
+
 
     ##############################################################################################################
     # Flame shot export integration
@@ -111,6 +149,8 @@ class FlameExport(Application):
         until this function returns. This can be used to fill information that would
         have normally been extracted from the export window.
         
+        :param session_id: String which identifies which export session is being referred to
+        
         :param info: Dictionary with info about the export. Contains the keys
                      - destinationHost: Host name where the exported files will be written to.
                      - destinationPath: Export path root.
@@ -122,9 +162,8 @@ class FlameExport(Application):
         # rather than going through the sgtk wrappers.         
         from PySide import QtGui
         
-        # reset export session data
-        self._shots = {}
-        self._reached_post_asset_phase = False
+        # set up data for this export session
+        session = self._export_sessions.start_session(session_id)
         
         # pop up a UI asking the user for description
         tk_flame_export = self.import_module("tk_flame_export")  
@@ -136,16 +175,17 @@ class FlameExport(Application):
         
         if return_code == QtGui.QDialog.Rejected:
             # user pressed cancel
+            self._export_sessions.end_session(session_id)
             info["abort"] = True
             info["abortMessage"] = "User cancelled the operation."
                    
         else:
             # get comments from user
-            self._user_comments = widget.get_comments()
+            session.user_comments = widget.get_comments()
             # get export preset name
             export_preset_name = widget.get_video_preset()
             # resolve this to an object
-            self._export_preset = self.export_preset_handler.get_preset_by_name(export_preset_name)
+            session.export_preset = self.export_preset_handler.get_preset_by_name(export_preset_name)
             
             # populate the host to use for the export. Currently hard coded to local
             info["destinationHost"] = self.engine.get_server_hostname()
@@ -154,8 +194,10 @@ class FlameExport(Application):
             info["destinationPath"] = self.sgtk.project_path
             
             # pick up the xml export profile from the configuration
-            info["presetPath"] = self._export_preset.get_xml_path()    
-            self.log_debug("%s: Starting custom export session with preset '%s'" % (self, info["presetPath"]))
+            info["presetPath"] = session.export_preset.get_xml_path()    
+            self.log_debug("%s: Starting custom export session %s with preset '%s'" % (self, 
+                                                                                      session_id, 
+                                                                                      info["presetPath"]))
                 
     def pre_export_sequence(self, session_id, info):
         """
@@ -179,6 +221,7 @@ class FlameExport(Application):
         # Note - Since Flame is a PySide only environment, we import it directly
         # rather than going through the sgtk wrappers.         
         from PySide import QtGui
+        session = self._export_sessions.get_session(session_id)
         sequence_name = info["sequenceName"]
         shot_names = info["shotNames"]
         
@@ -206,8 +249,13 @@ class FlameExport(Application):
         # create entities in Shotgun, create folders on disk and compute shot contexts.
         sequence_data = self._sg_submit_helper.create_shotgun_structure(sequence_name, shot_names)
         
+        # record how many segments we are expecting for each shot. Flame passes one
+        # shot name per segment, so a shot made up of several segments appears several times.
+        for shot_metadata in sequence_data[sequence_name].values():
+            shot_metadata.expected_segments = list(shot_names).count(shot_metadata.name)
+        
         # add it to the full dictionary of things to export
-        self._shots.update(sequence_data)
+        session.shots.update(sequence_data)
 
     
     def pre_export_asset(self, session_id, info):
@@ -254,6 +302,7 @@ class FlameExport(Application):
         asset_name = info["assetName"]
         shot_name = info["shotName"]
         sequence_name = info["sequenceName"]
+        session = self._export_sessions.get_session(session_id)
 
         if asset_type not in ["video", "batch", "batchOpenClip", "openClip"]:
             # the review system ignores any other assets. The export profiles are defined
@@ -282,12 +331,12 @@ class FlameExport(Application):
         
         # first, calculate cut data fields
         if asset_type == "video":
-            self._shots[sequence_name][shot_name].update_new_cut_info(int(info["recordIn"]), int(info["recordOut"]))
+            session.shots[sequence_name][shot_name].update_new_cut_info(int(info["recordIn"]), int(info["recordOut"]))
                 
         # get the appropriate file system template
         if asset_type == "video":
             # exported plates or video
-            template = self._export_preset.get_render_template()
+            template = session.export_preset.get_render_template()
             
         elif asset_type == "batch":
             # batch file
@@ -304,7 +353,7 @@ class FlameExport(Application):
         self.log_debug("Attempting to resolve template %s..." % template)
         
         # resolve the template via the context
-        context = self._shots[sequence_name][shot_name].context
+        context = session.shots[sequence_name][shot_name].context
 
         # resolve the fields out of the context
         self.log_debug("Resolving template %s using context %s" % (template, context))
@@ -403,12 +452,13 @@ class FlameExport(Application):
         segment_name = info["assetName"]
         shot_name = info["shotName"]
         sequence_name = info["sequenceName"]        
+        session = self._export_sessions.get_session(session_id)
         
         if asset_type not in ["video", "batch"]:
             # ignore anything that isn't video or batch
             return
         
-        metadata = self._shots[sequence_name][shot_name]
+        metadata = session.shots[sequence_name][shot_name]
         
         if asset_type == "video":
             # this is a video export for a segment.
@@ -419,15 +469,27 @@ class FlameExport(Application):
             
             # now cache the info for this segment
             segment_metadata = metadata.segment_metadata[segment_name]
-            segment_metadata.video_info = info
+            segment_metadata.set_video_info(info)
             
         elif asset_type == "batch":
             # this is a batch export. These are per *shot*, even in the case of a shot
             # with multiple clips, only one batch file gets output.
-            metadata.batch_info = info
+            metadata.set_batch_info(info)
                 
         # indicate that the export has reached its last stage
-        self._reached_post_asset_phase = True
+        session.reached_post_asset_phase = True
+        
+        # in incremental mode, push the shot to Shotgun and backburner as soon as 
+        # all of its assets have arrived rather than waiting for the whole export
+        # to complete. Cut information is reconciled at the end of the session.
+        if self.get_setting("incremental_submission") and metadata.is_export_complete():
+            self.log_debug("All assets for shot %s have been exported. Submitting..." % shot_name)
+            session.scheduler_lock.acquire()
+            try:
+                self.__submit_shots(session, [metadata])
+                self.__submit_scheduled_jobs(session, only_if_due=True)
+            finally:
+                session.scheduler_lock.release()
 
 
     def do_submission_and_summary(self, session_id, info):
@@ -447,10 +509,14 @@ class FlameExport(Application):
         """
         tk_flame_export = self.import_module("tk_flame_export")
         
+        # this is the last hook of the export session, so release its state here.
+        # the data for the session is only referenced locally from this point on.
+        session = self._export_sessions.end_session(session_id)
+        
         # if we haven't reached the post export stage, that means that something
         # has gone wrong along the way. Display the "oops, something went wrong" 
         # dialog.
-        if not self._reached_post_asset_phase:
+        if session is None or not session.reached_post_asset_phase:
             self.engine.show_modal("Submission Failed", self, tk_flame_export.SubmissionFailedDialog) 
             return
                 
@@ -459,9 +525,9 @@ class FlameExport(Application):
         # Stage 1 - Cut calculations
         #
         num_created_shots = 0
-        for seq in self._shots:
+        for seq in session.shots:
             # get a list of metadata objects for this sequence
-            shot_metadata_list = self._shots[seq].values()
+            shot_metadata_list = session.shots[seq].values()
             # sort it by cut in
             shot_metadata_list.sort(key=lambda x: x.new_cut_in)
             # now loop over all items and set an incrementing cut order
@@ -474,52 +540,20 @@ class FlameExport(Application):
 
         ##########################################################################################
         #
-        # Stage 2 - Creating Shotgun versions and run potential cut updates to shots.
-        #           This happens as a single Shotgun batch call.
+        # Stage 2 - Compute cut updates to shots. These are pushed to Shotgun as part of the 
+        #           same batch call that creates versions for any segments that have not yet
+        #           been submitted.
         # 
-        
-        # we push all changes to Shotgun as a single batch call
         shotgun_batch_items = []
-        version_path_lookup = {}
-                
-        # loop over all shots in our metadata data structure
-        self.log_debug("Looping over all shots and segments to submit Shotgun data...")
+        
+        self.log_debug("Looping over all shots to compute cut changes...")
         num_cut_changes = 0
-        for seq in self._shots:
-            for shot_metadata in self._shots[seq].values():
+        for seq in session.shots:
+            for shot_metadata in session.shots[seq].values():
                 
                 self.log_debug("Looking at shot %s" % shot_metadata.name)
                 
-                # First, create versions for all video segments.
-                #
-                # register all versions that we should submit for review
-                # for each shot. Note that a shot may have multiple video segments
-                for segment_metadata in shot_metadata.segment_metadata.values():
-                    
-                    # it is possible that the user has manually cancelled the process, so
-                    # it's possible that a segment doesn't have a video export associated
-                    # this can happen if for example a user chooses not to overwrite an 
-                    # existing file on disk. 
-                    if segment_metadata.has_render_export():
-                        
-                        # we have a video submission associated with this segment!
-                        # compute a version-create Shotgun batch dictionary
-                        sg_version_batch = self._sg_submit_helper.create_version_batch(shot_metadata.context, 
-                                                                                       segment_metadata.get_render_path(), 
-                                                                                       self._user_comments, 
-                                                                                       None, 
-                                                                                       segment_metadata.video_info["aspectRatio"])                
-                        # append to our main batch listing
-                        self.log_debug("Registering version: %s" % pprint.pformat(sg_version_batch))
-                        shotgun_batch_items.append(sg_version_batch)
-                        
-                        # once the batch has been executed and the versions have been created in Shotgun,
-                        # we need to update our segment metadata with the Shotgun version id.
-                        # in order to do that, maintain a lookup dictionary:
-                        path_to_frames = sg_version_batch["data"]["sg_path_to_frames"]
-                        version_path_lookup[path_to_frames] = segment_metadata
-                
-                # Now update frame ranges to make sure Shotgun matches Flame.
+                # Update frame ranges to make sure Shotgun matches Flame.
                 #
                 # ensure that we actually have frame ranges for this shot
                 # it seems sometimes there are shots that don't actually contain any clips.
@@ -553,6 +587,131 @@ class FlameExport(Application):
                 else:
                     self.log_debug("No frame changes detected. Shotgun and Flame are already in sync.")
         
+        ##########################################################################################
+        #
+        # Stage 3 - Submit everything that hasn't already been submitted incrementally
+        #           as part of the post export asset hook.
+        #
+        all_shots = []
+        for seq in session.shots:
+            all_shots.extend(session.shots[seq].values())
+        session.scheduler_lock.acquire()
+        try:
+            self.__submit_shots(session, all_shots, shotgun_batch_items)
+        finally:
+            session.scheduler_lock.release()
+
+        ##########################################################################################
+        #
+        # Stage 4 - Register the cuts for which a review movie should be assembled from
+        #           the review quicktimes of their segments, if enabled. This is done before
+        #           handing the remaining work to backburner, so that its upload jobs only 
+        #           keep the review quicktimes needed for a cut.
+        #
+        session.scheduler_lock.acquire()
+        try:
+            if session.cut_review:
+                self.__register_cut_review_movies(session)
+            
+            self.__submit_scheduled_jobs(session)
+        finally:
+            session.scheduler_lock.release()
+
+        ##########################################################################################
+        #
+        # Stage 5 - Pop up a summary UI!
+        #
+        
+        # now, as a very last step, show a summary UI to the user, including a 
+        # very brief overview of what changes have been carried out.
+        comments = "Your export has been pushed to the Backburner queue for processing.<br><br>"
+        
+        if num_created_shots == 1:
+            comments += "- A new Shot was created in Shotgun. <br>"
+        elif num_created_shots > 1:
+            comments += "- %d new Shots were created in Shotgun. <br>" % num_created_shots 
+            
+        num_cut_updates = (num_cut_changes - num_created_shots)
+        if num_cut_updates == 1:
+            comments += "- One Shot had its cut information updated. <br>"
+        elif num_cut_updates > 1:
+            comments += "- %d Shots had their cut information updated. <br>" % num_cut_updates 
+                
+        self.engine.show_modal("Submission Complete", self, tk_flame_export.SubmissionCompleteDialog, comments)
+        
+    def __submit_shots(self, session, shot_metadata_list, shotgun_batch_items=None):
+        """
+        Pushes versions to Shotgun and submits backburner jobs for publishes and 
+        media for all segments and batch files of the given shots that haven't 
+        already been submitted. 
+        
+        This is called either incrementally, as the assets for a shot arrive, or 
+        at the end of the export session for anything that remains.
+        
+        The backburner work is added to the session's job scheduler, and handed to
+        backburner by __submit_scheduled_jobs().
+        
+        :param session: ExportSession object for the export
+        :param shot_metadata_list: List of ShotMetadata objects to submit
+        :param shotgun_batch_items: Optional list of additional Shotgun batch items
+                                    to push as part of the same batch call as the 
+                                    version creation.
+        """
+        
+        # pick out all the things that need submitting
+        pending_segments = []
+        pending_batch_shots = []
+        for shot_metadata in shot_metadata_list:
+            
+            if shot_metadata.has_batch_export() and not shot_metadata.batch_submitted:
+                pending_batch_shots.append(shot_metadata)
+            
+            # it is possible that the user has manually cancelled the process, so
+            # it's possible that a segment doesn't have a video export associated
+            # this can happen if for example a user chooses not to overwrite an 
+            # existing file on disk. 
+            for segment_metadata in shot_metadata.segment_metadata.values():
+                if segment_metadata.has_render_export() and not segment_metadata.submitted:
+                    pending_segments.append((shot_metadata, segment_metadata))
+        
+        ##########################################################################################
+        #
+        # Stage A - Creating Shotgun versions, together with any additional batch items.
+        #           This happens as a single Shotgun batch call.
+        # 
+        
+        # we push all changes to Shotgun as a single batch call
+        shotgun_batch_items = list(shotgun_batch_items or [])
+        version_path_lookup = {}
+        
+        # all renders in this session were generated by the render template of the 
+        # export preset, so pass that to the version creation rather than having 
+        # it resolved from each path.
+        render_template = session.export_preset.get_render_template()
+        
+        # register all versions that we should submit for review
+        # for each shot. Note that a shot may have multiple video segments
+        self.log_debug("Looping over %s segments to submit Shotgun data..." % len(pending_segments))
+        for (shot_metadata, segment_metadata) in pending_segments:
+            
+            # we have a video submission associated with this segment!
+            # compute a version-create Shotgun batch dictionary
+            sg_version_batch = self._sg_submit_helper.create_version_batch(shot_metadata.context, 
+                                                                           segment_metadata.get_render_path(), 
+                                                                           session.user_comments, 
+                                                                           None, 
+                                                                           segment_metadata.aspect_ratio,
+                                                                           render_template)
+            # append to our main batch listing
+            self.log_debug("Registering version: %s" % pprint.pformat(sg_version_batch))
+            shotgun_batch_items.append(sg_version_batch)
+            
+            # once the batch has been executed and the versions have been created in Shotgun,
+            # we need to update our segment metadata with the Shotgun version id.
+            # in order to do that, maintain a lookup dictionary:
+            path_to_frames = sg_version_batch["data"]["sg_path_to_frames"]
+            version_path_lookup[path_to_frames] = segment_metadata
+        
         # now push all new versions and cut changes to Shotgun in a single batch call.
         sg_data = []
         if len(shotgun_batch_items) > 0:
@@ -565,10 +724,19 @@ class FlameExport(Application):
                 # kill progress indicator
                 self.engine.clear_busy()
 
+        # from this point on, the items are considered submitted
+        for shot_metadata in pending_batch_shots:
+            shot_metadata.batch_submitted = True
+        for (shot_metadata, segment_metadata) in pending_segments:
+            segment_metadata.submitted = True
+
+        if len(pending_segments) == 0 and len(pending_batch_shots) == 0:
+            # nothing to publish
+            return
                 
         ##########################################################################################
         #
-        # Stage 3 - Update metadata with created Shotgun version ids so we can access it later
+        # Stage B - Update metadata with created Shotgun version ids so we can access it later
         #                 
                 
         # now update the shot metadata with version ids
@@ -578,253 +746,361 @@ class FlameExport(Application):
                 segment_metadata = version_path_lookup[sg_entity["sg_path_to_frames"]]
                 segment_metadata.shotgun_version = sg_entity
         
-        # also, find out the highest backburner ID so that we can create a dependency later on
-        # because the various Flame exports may be running in backburner jobs, we need to figure out 
-        # the last backburner job id and create a dependency from our jobs to this job. This is 
-        # because stuff such as thumbnails etc are extracted as part of publishing and other jobs
-        # and we cannot do that before the actual render export has completed.
-        # 
-        # assume that the highest backburner job id is the last one to run.
+        # Because the various Flame exports may be running in backburner jobs, each job we 
+        # create needs to run after the backburner job that exports the media it operates on. 
+        # This is because stuff such as thumbnails etc are extracted as part of publishing and 
+        # other jobs and we cannot do that before the actual render export has completed.
+        #
+        # The scheduler ties each piece of work to the render job of its own segment, so 
+        # that processing can start as soon as each individual render is done. Work that 
+        # is processed in bulk (publishes and thumbnails) is grouped into one job per render job.
         #
-        prev_backburner_id = None
-        for seq in self._shots:
-            for shot_metadata in self._shots[seq].values():
-                for segment_metadata in shot_metadata.segment_metadata.values():
-                    if segment_metadata.video_info.get("isBackground"):
-                        job_id = segment_metadata.video_info.get("backgroundJobId")
-                        if prev_backburner_id is None or job_id > prev_backburner_id:
-                            prev_backburner_id = job_id        
+        # In incremental mode, the work for several shots is collected in the same scheduler
+        # before it is handed to backburner, so that the priority lanes apply across shots.
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        if session.scheduler is None:
+            session.scheduler = tk_flame_export_no_ui.JobScheduler()
+        scheduler = session.scheduler
+        
+        # Rather than passing a full copy of the data each job needs as job arguments, 
+        # everything is written once to the session manifest that the scheduler saves
+        # to disk on submission. Jobs are passed the path to the manifest and the ids 
+        # of the records they should process. Values shared by the whole session, such 
+        # as the export preset, the user comments and the shot contexts, are only 
+        # stored once.
+        manifest = scheduler.manifest
+        manifest.set_setting("export_preset", session.export_preset.get_name())
+        manifest.set_setting("comments", session.user_comments)
+        
+        if self.get_setting("cut_review_movie") and session.export_preset.upload_quicktime():
+            # keep the review quicktimes so that they can be assembled into a movie 
+            # of the whole cut at the end of the session.
+            if session.cut_review is None:
+                session.cut_review = tk_flame_export_no_ui.CutReviewMovie.create()
+            manifest.set_setting("cut_folder", session.cut_review.folder)
+        
+        segment_ids = {}
+        for (shot_metadata, segment_metadata) in pending_segments:
+            
+            # maybe this is overly cautious? Technically speaking there should be a version
+            # for every render at this point.
+            version_id = None
+            if segment_metadata.has_shotgun_version():
+                version_id = segment_metadata.get_shotgun_version_id()
+            
+            # check if we should also generate a quicktime for local playback.
+            quicktime_path = None
+            if session.export_preset.make_highres_quicktime():
+                render_path = segment_metadata.get_render_path()
+                quicktime_path = session.export_preset.quicktime_path_from_render_path(render_path)
+            
+            segment = {"path": segment_metadata.get_render_path(),
+                       "quicktime_path": quicktime_path,
+                       "width": segment_metadata.width,
+                       "height": segment_metadata.height,
+                       "fps": segment_metadata.fps,
+                       "version_id": version_id,
+                       "version": segment_metadata.get_render_version_number(),
+                       "context": manifest.add_context(shot_metadata.context)}
+            segment_ids[segment_metadata] = manifest.add_segment(segment)
         
         ##########################################################################################
         #
-        # Stage 4 - Submit single backburner job to register all batch and render publishes
+        # Stage C - Register all batch and render publishes. Publishes are grouped into
+        #           a backburner job for each render job they depend on.
         #                 
-        # first, push a backburner job that will register all publishes in Shotgun given our shot metadata
-        sg_publishes = []
-        
-        for seq in self._shots:
-            for shot_metadata in self._shots[seq].values():
-                
-                # first see if we have a batch file being exported for this shot
-                if shot_metadata.has_batch_export():
-                    # there is a batch publish associated with this segment! Add a publish request
-                    sg_publishes.append({"type": "batch",
-                                          "path": shot_metadata.get_batch_path(),
-                                          "comments": self._user_comments,
-                                          "serialized_context": sgtk.context.serialize(shot_metadata.context),
-                                          "version": shot_metadata.get_batch_version_number() })
-                                
-                for segment_metadata in shot_metadata.segment_metadata.values():
-
-                    if segment_metadata.has_render_export():
-                        # there is a video publish associated with this segment!
-                        # create a publish in Shotgun.
-                        
-                        # figure out if this shot is new. In that case, upload a thumbnail to the shot
-                        # at the same time as we push the publish
-                        push_thumbnail_to_shot = False
-                        if shot_metadata.created_this_session and not shot_metadata.thumbnail_uploaded:
-                            shot_metadata.thumbnail_uploaded = False
-                            push_thumbnail_to_shot = True
-
-                        # maybe this is overly cautious? Technically speaking there should be a version
-                        # for every render at this point.
-                        version_id = None
-                        if segment_metadata.has_shotgun_version():
-                            version_id = segment_metadata.get_shotgun_version_id()
-                            
-                        # check if we should also generate a quicktime. In that case, we make a publish for
-                        # that too at the same time.
-                        quicktime_path = None
-                        if self._export_preset.make_highres_quicktime():
-                            render_path = segment_metadata.get_render_path()
-                            quicktime_path = self._export_preset.quicktime_path_from_render_path(render_path)
-                        
-                        sg_publishes.append({"type": "video",
-                                              "width": segment_metadata.video_info.get("width"),
-                                              "height": segment_metadata.video_info.get("height"),
-                                              "path": segment_metadata.get_render_path(),
-                                              "quicktime_path": quicktime_path,
-                                              "comments": self._user_comments,
-                                              "shot_thumbnail": push_thumbnail_to_shot,
-                                              "version_id": version_id,
-                                              "serialized_context": sgtk.context.serialize(shot_metadata.context),
-                                              "version": segment_metadata.get_render_version_number() })                        
+        publish_job_title = "Shotgun Publish"
+        publish_job_desc = "Generates publishes in Shotgun."
+        manifest_args = {"manifest_path": manifest.path}
+        
+        for shot_metadata in pending_batch_shots:
+            # there is a batch publish associated with this shot! Add a publish request
+            request = {"type": "batch",
+                       "path": shot_metadata.get_batch_path(),
+                       "context": manifest.add_context(shot_metadata.context),
+                       "version": shot_metadata.get_batch_version_number() }
+            
+            scheduler.add_batched_task("publish",
+                                       publish_job_title, 
+                                       publish_job_desc, 
+                                       shot_metadata.batch_background_job_id, 
+                                       "backburner_register_publishes", 
+                                       "item_ids", 
+                                       manifest.add_item(request), 
+                                       manifest_args)
                         
-                                                
-        # push all publish requests as a single job
-        args = {"publish_requests": sg_publishes, 
-                "export_preset": self._export_preset.get_name()
-                }
-        self.engine.create_local_backburner_job("Shotgun Publish", 
-                                                "Generates publishes in Shotgun.", 
-                                                prev_backburner_id, 
-                                                self, 
-                                                "backburner_register_publishes", 
-                                                args)
-        
+        for (shot_metadata, segment_metadata) in pending_segments:
+            # there is a video publish associated with this segment!
+            # create a publish in Shotgun.
+            
+            # figure out if this shot is new. In that case, upload a thumbnail to the shot
+            # at the same time as we push the publish
+            push_thumbnail_to_shot = False
+            if shot_metadata.created_this_session and not shot_metadata.thumbnail_uploaded:
+                shot_metadata.thumbnail_uploaded = True
+                push_thumbnail_to_shot = True
+            
+            request = {"type": "video",
+                       "segment": segment_ids[segment_metadata],
+                       "shot_thumbnail": push_thumbnail_to_shot }
+            
+            scheduler.add_batched_task("publish",
+                                       publish_job_title, 
+                                       publish_job_desc, 
+                                       segment_metadata.background_job_id, 
+                                       "backburner_register_publishes", 
+                                       "item_ids", 
+                                       manifest.add_item(request), 
+                                       manifest_args)
         
         ##########################################################################################
         #
-        # Stage 5 - If no transcoding is happening (either because we are running with it off
+        # Stage D - If no transcoding is happening (either because we are running with it off
         #           or because we are not uploading any quicktimes to Shotgun), instead explicitly
-        #           push thumbnails for versions.
+        #           push thumbnails for versions. Thumbnails are grouped into a backburner job
+        #           for each render job they depend on.
         #                 
                 
-        if self._export_preset.upload_quicktime() == False or self.get_setting("bypass_shotgun_transcoding"):
-        
-            # Create a single backburner job to handle this.
-            job_title = "Shotgun Thumbnails"
-            job_desc = "Generating thumbnails for review versions."
-            
-            items = []
-            for seq in self._shots:
-                for shot_metadata in self._shots[seq].values():
-                    for segment_metadata in shot_metadata.segment_metadata.values():   
-                        
-                        if segment_metadata.has_shotgun_version():
-                            # this segment has video and has a version!
-                            item = {"path": segment_metadata.get_render_path(), 
-                                    "width": segment_metadata.video_info.get("width"),
-                                    "height": segment_metadata.video_info.get("height"),
-                                    "version_id": segment_metadata.get_shotgun_version_id()}
-                            items.append(item)
-            
-            args = {"items": items}
-                            
-            # kick off backburner job
-            self.engine.create_local_backburner_job(job_title,
-                                                    job_desc,
-                                                    prev_backburner_id,
-                                                    self,
-                                                    "backburner_upload_version_thumbnails",
-                                                    args)
-            
+        if session.export_preset.upload_quicktime() == False or self.get_setting("bypass_shotgun_transcoding"):
+        
+            for (shot_metadata, segment_metadata) in pending_segments:
+                if segment_metadata.has_shotgun_version():
+                    # this segment has video and has a version!
+                    scheduler.add_batched_task("thumbnails",
+                                               "Shotgun Thumbnails", 
+                                               "Generating thumbnails for review versions.", 
+                                               segment_metadata.background_job_id, 
+                                               "backburner_upload_version_thumbnails", 
+                                               "segment_ids", 
+                                               segment_ids[segment_metadata],
+                                               manifest_args)
             
         ##########################################################################################
         #
-        # Stage 6 - For each segment, generate and upload a quicktime to Shotgun.
+        # Stage E - For each segment, generate and upload a quicktime to Shotgun.
         #           Each item will be processed in a separate backburner job.
         #                 
         
-        if self._export_preset.upload_quicktime():
+        if session.export_preset.upload_quicktime():
             
             # let's create quicktimes suitable for Shotgun and upload these.
             # create one separate backburner job for each upload for parallelisation  
-            for seq in self._shots:
-                for shot_metadata in self._shots[seq].values():
-                    for segment_metadata in shot_metadata.segment_metadata.values():
-                                                    
-                        if segment_metadata.has_shotgun_version():
-                            # this segment has video and has a version!
-                            # schedule quicktime generation!
-                            
-                            job_title = "Shot %s - Shotgun Quicktime Upload" % shot_metadata.name
-                            job_desc = "Generating quicktimes and uploading to Shotgun."         
-                            
-                            # if the video media is generated in a backburner job, make sure that 
-                            # our quicktime job is executed *after* this job has finished                        
-                            if segment_metadata.video_info.get("isBackground"):
-                                run_after_job_id = segment_metadata.video_info.get("backgroundJobId")
-                            else:
-                                run_after_job_id = None
-            
-                            render_path = segment_metadata.get_render_path()
-                            
-                            args = {"version_id": segment_metadata.get_shotgun_version_id(), 
-                                    "path": render_path,
-                                    "width": segment_metadata.video_info.get("width"),
-                                    "height": segment_metadata.video_info.get("height"),
-                                    "fps": segment_metadata.video_info.get("fps")
-                                    }
-            
-                            # kick off backburner job
-                            self.engine.create_local_backburner_job(job_title, 
-                                                                    job_desc, 
-                                                                    run_after_job_id, 
-                                                                    self, 
-                                                                    "backburner_upload_quicktime", 
-                                                                    args)
+            for (shot_metadata, segment_metadata) in pending_segments:
+                                            
+                if segment_metadata.has_shotgun_version():
+                    # this segment has video and has a version!
+                    # schedule quicktime generation!
+                    
+                    job_title = "Shot %s - Shotgun Quicktime Upload" % shot_metadata.name
+                    job_desc = "Generating quicktimes and uploading to Shotgun."         
+                    
+                    args = {"manifest_path": manifest.path, 
+                            "segment_id": segment_ids[segment_metadata]}
+    
+                    # if the video media is generated in a backburner job, make sure that 
+                    # our quicktime job is executed *after* this job has finished                        
+                    self.__schedule_media_job(scheduler,
+                                              job_title, 
+                                              job_desc, 
+                                              segment_metadata.background_job_id, 
+                                              "backburner_upload_quicktime", 
+                                              args,
+                                              scheduler.LANE_REVIEW)
 
         ##########################################################################################
         #
-        # Stage 7 - Submit multiple backburner jobs, one for each *local* (high res) quicktime
+        # Stage F - Submit multiple backburner jobs, one for each *local* (high res) quicktime
         #
         
-        # note that this happens in a separate loop after the upload loop to ensure that 
-        # these tasks happen last.
+        # note that these jobs are scheduled in the local media lane, which is handed to 
+        # backburner after the Shotgun and review lanes and made to wait for the review
+        # upload of the same render, to ensure that these tasks happen last.
+        #
+        # even if quicktimes are uploaded to Shotgun, the local quicktimes are generated in 
+        # jobs of their own rather than from the same read of the frames as the review 
+        # quicktimes. This costs another read of the media, but keeps the heavy high res
+        # encode from holding up the review uploads of other shots.
 
-        if self._export_preset.make_highres_quicktime():
+        if session.export_preset.make_highres_quicktime():
             # let's create quicktimes suitable for local playback (for example in RV)
             # create one separate backburner job for each upload for parallelisation 
             # this are pushed onto the queue after any Shotgun transcoding jobs. 
-            for seq in self._shots:
-                for shot_metadata in self._shots[seq].values():
-                    for segment_metadata in shot_metadata.segment_metadata.values():
-                                                    
-                        if segment_metadata.has_shotgun_version():
-                            # this segment has video and has a version!
-                            # schedule quicktime generation!
-                            
-                            job_title = "Shot %s - Local Quicktime Render" % shot_metadata.name
-                            job_desc = "Generating quicktimes for local playback."         
-
-                            # get the render path
-                            render_path = segment_metadata.get_render_path()
-                            
-                            # convert it to the equivalent quicktime path
-                            quicktime_path = self._export_preset.quicktime_path_from_render_path(render_path)
-                            
-                            # if the video media is generated in a backburner job, make sure that 
-                            # our quicktime job is executed *after* this job has finished                        
-                            if segment_metadata.video_info.get("isBackground"):
-                                run_after_job_id = segment_metadata.video_info.get("backgroundJobId")
-                            else:
-                                run_after_job_id = None
-            
-                            args = {"export_preset_name": self._export_preset.get_name(),
-                                    "version_id": segment_metadata.get_shotgun_version_id(), 
-                                    "path": render_path,
-                                    "quicktime_path": quicktime_path,
-                                    "width": segment_metadata.video_info.get("width"),
-                                    "height": segment_metadata.video_info.get("height"),
-                                    "fps": segment_metadata.video_info.get("fps")
-                                    }
-            
-                            # kick off backburner job
-                            self.engine.create_local_backburner_job(job_title, 
-                                                                    job_desc, 
-                                                                    run_after_job_id, 
-                                                                    self, 
-                                                                    "backburner_generate_local_quicktime", 
-                                                                    args)
-        
+            for (shot_metadata, segment_metadata) in pending_segments:
+                                            
+                if segment_metadata.has_shotgun_version():
+                    # this segment has video and has a version!
+                    # schedule quicktime generation!
+                    
+                    job_title = "Shot %s - Local Quicktime Render" % shot_metadata.name
+                    job_desc = "Generating quicktimes for local playback."         
 
-        ##########################################################################################
-        #
-        # Stage 8 - Pop up a summary UI!
-        #
+                    args = {"manifest_path": manifest.path, 
+                            "segment_id": segment_ids[segment_metadata]}
+    
+                    # if the video media is generated in a backburner job, make sure that 
+                    # our quicktime job is executed *after* this job has finished                        
+                    self.__schedule_media_job(scheduler,
+                                              job_title, 
+                                              job_desc, 
+                                              segment_metadata.background_job_id, 
+                                              "backburner_generate_local_quicktime", 
+                                              args,
+                                              scheduler.LANE_LOCAL_MEDIA)
+        
+        # only count the shots which actually added work
+        shots_with_work = set([id(x) for x in pending_batch_shots])
+        shots_with_work.update([id(shot_metadata) for (shot_metadata, segment_metadata) in pending_segments])
+        session.num_scheduled_shots += len(shots_with_work)
+
+    def __submit_scheduled_jobs(self, session, only_if_due=False):
+        """
+        Hands the work collected by __submit_shots() to backburner.
         
-        # now, as a very last step, show a summary UI to the user, including a 
-        # very brief overview of what changes have been carried out.
-        comments = "Your export has been pushed to the Backburner queue for processing.<br><br>"
-        
-        if num_created_shots == 1:
-            comments += "- A new Shot was created in Shotgun. <br>"
-        elif num_created_shots > 1:
-            comments += "- %d new Shots were created in Shotgun. <br>" % num_created_shots 
-            
-        num_cut_updates = (num_cut_changes - num_created_shots)
-        if num_cut_updates == 1:
-            comments += "- One Shot had its cut information updated. <br>"
-        elif num_cut_updates > 1:
-            comments += "- %d Shots had their cut information updated. <br>" % num_cut_updates 
-                
-        self.engine.show_modal("Submission Complete", self, tk_flame_export.SubmissionCompleteDialog, comments)
+        The caller must hold the session's scheduler lock.
         
+        :param session: ExportSession object for the export
+        :param only_if_due: If True, the work is only submitted once the scheduler holds
+                            the number of shots given by the incremental_submission_batch_size
+                            setting. Until then, a timer submits it once the oldest work in it 
+                            has waited for the number of seconds given by the 
+                            incremental_submission_window setting.
+        """
+        if session.scheduler is None or session.num_scheduled_shots == 0:
+            return
         
+        if only_if_due and session.num_scheduled_shots < self.get_setting("incremental_submission_batch_size"):
+            window = self.get_setting("incremental_submission_window")
+            if window > 0:
+                if session.submit_timer is None:
+                    self.log_debug("Holding back work for %s shots for up to %s seconds." % (session.num_scheduled_shots, 
+                                                                                            window))
+                    session.submit_timer = threading.Timer(window, 
+                                                           self.__submit_held_back_jobs, 
+                                                           args=(session,))
+                    session.submit_timer.daemon = True
+                    session.submit_timer.start()
+                return
+        
+        if session.submit_timer:
+            session.submit_timer.cancel()
+            session.submit_timer = None
+        
+        # and push everything to backburner
+        self.log_debug("Submitting work for %s shots to backburner..." % session.num_scheduled_shots)
+        session.scheduler.submit()
+        session.scheduler = None
+        session.num_scheduled_shots = 0
+    
+    def __submit_held_back_jobs(self, session):
+        """
+        Timer callback. Hands the work held back by __submit_scheduled_jobs() to backburner
+        once the incremental_submission_window has expired.
         
+        :param session: ExportSession object for the export
+        """
+        session.scheduler_lock.acquire()
+        try:
+            if session.submit_timer is not threading.current_thread():
+                # the work was submitted by another shot while the timer fired, 
+                # and any work scheduled since has a timer of its own.
+                return
+            session.submit_timer = None
+            self.__submit_scheduled_jobs(session)
+        except Exception, e:
+            # the work is submitted with the next shot or at the end of the export
+            self.log_exception("Could not submit held back work: %s" % e)
+        finally:
+            session.scheduler_lock.release()
 
+    def __register_cut_review_movies(self, session):
+        """
+        Registers a cut review movie for each sequence in an export session. The movie
+        is assembled from the review quicktimes of the sequence's segments, in cut order,
+        by the upload job which completes the set, and published as a version for the 
+        sequence. If all quicktimes are already available, a backburner job is submitted
+        to assemble the movie.
+        
+        :param session: ExportSession object for the export
+        """
+        for seq in session.shots:
+            # shots in cut order, as calculated at the start of the submission
+            shot_metadata_list = session.shots[seq].values()
+            shot_metadata_list.sort(key=lambda x: x.new_cut_order)
+            
+            version_ids = []
+            resolutions = set()
+            version_number = 0
+            for shot_metadata in shot_metadata_list:
+                segments = [x for x in shot_metadata.segment_metadata.values() if x.has_shotgun_version()]
+                segments.sort(key=lambda x: x.record_in)
+                for segment_metadata in segments:
+                    version_ids.append(segment_metadata.get_shotgun_version_id())
+                    resolutions.add((segment_metadata.width, segment_metadata.height))
+                    version_number = max(version_number, segment_metadata.get_render_version_number())
+            
+            if len(version_ids) == 0:
+                continue
+            
+            if len(resolutions) > 1:
+                # the quicktimes can't be joined without re-encoding
+                self.log_warning("Sequence %s contains segments with different resolutions. "
+                                 "No cut review movie will be generated." % seq)
+                continue
+            
+            # the shot parent is the same for all the shots in a sequence
+            shot_metadata = shot_metadata_list[0]
+            if shot_metadata.shotgun_parent is None:
+                self.log_warning("Sequence %s has no parent entity in Shotgun. "
+                                 "No cut review movie will be generated." % seq)
+                continue
+            
+            # this name will be visible in Shotgun
+            name = "%s_cut_v%03d" % (re.sub("[^A-Za-z0-9_.-]", "_", seq), version_number)
+            
+            session.cut_review.add_cut(name,
+                                       version_ids,
+                                       sgtk.context.serialize(shot_metadata.context),
+                                       {"type": shot_metadata.shotgun_parent["type"],
+                                        "id": shot_metadata.shotgun_parent["id"]},
+                                       session.user_comments)
+        
+        # in incremental mode, the quicktimes for some cuts may all have been uploaded already
+        for name in session.cut_review.finalize():
+            self.job_runner.create_local_backburner_job("Cut %s - Shotgun Cut Review Movie" % name, 
+                                                        "Assembling a review movie for the cut.", 
+                                                        None, # run_after_job_id 
+                                                        self, 
+                                                        "backburner_create_cut_review_movie", 
+                                                        {"cut_folder": session.cut_review.folder,
+                                                         "name": name})
+    
+    def __schedule_media_job(self, scheduler, title, description, run_after_job_id, method_name, args, lane):
+        """
+        Schedules media processing for a segment. By default, each segment is processed
+        in its own backburner job. If the media_worker_pool_size setting is non-zero, 
+        segments are instead processed by a pool of worker jobs, each handling several
+        segments concurrently inside a single toolkit session.
+        
+        :param scheduler: JobScheduler object to add the work to
+        :param title: Title of the backburner job
+        :param description: Description of the backburner job
+        :param run_after_job_id: Id of the backburner job the work depends on, None 
+                                 if it can run straight away.
+        :param method_name: Name of the app method to process the segment with
+        :param args: Dictionary of arguments to pass to the method 
+        :param lane: Priority lane of the work, e.g. JobScheduler.LANE_REVIEW
+        """
+        if self.get_setting("media_worker_pool_size") > 0:
+            scheduler.add_pooled_task("media",
+                                      "Shotgun Media Worker",
+                                      "Generating quicktimes for review and local playback.",
+                                      run_after_job_id,
+                                      method_name,
+                                      args,
+                                      lane)
+        else:
+            scheduler.add_job(title, description, run_after_job_id, method_name, args, lane)
+        
 
     ##############################################################################################################
     # Flare / batch mode integration
@@ -869,9 +1145,10 @@ class FlameExport(Application):
         
         # these member variables are used to pass data down the pipeline, to post_batch_render_sg_process()
         self._send_batch_render_to_review = False
-        self._user_comments = None
+        self._batch_user_comments = None
         self._batch_export_preset = None
         self._batch_context = None
+        self._batch_follower = None
         
         render_path = os.path.join(info.get("exportPath"), info.get("resolvedPath"))
         batch_path = info.get("setupResolvedPath")
@@ -913,7 +1190,44 @@ class FlameExport(Application):
         if return_code != QtGui.QDialog.Rejected:
             # user wants review!
             self._send_batch_render_to_review = True
-            self._user_comments = widget.get_comments()
+            self._batch_user_comments = widget.get_comments()
+            
+            if self.get_setting("render_follow_mode"):
+                self.__start_render_follow_job(info, render_path)
+    
+    def __start_render_follow_job(self, info, render_path):
+        """
+        Starts a job which transcodes the frames of a batch render while Flare is 
+        still rendering, so that the quicktimes are ready shortly after the last frame 
+        has been rendered. See RenderFollower for details.
+        
+        :param info: Dictionary with render parameters, see pre_batch_render_checks
+        :param render_path: Flame style path to the frames being rendered
+        """
+        if not (self._batch_export_preset.upload_quicktime() or self._batch_export_preset.make_highres_quicktime()):
+            # no quicktimes to generate
+            return
+        
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        
+        if tk_flame_export_no_ui.RenderFollower.get_frame_paths(render_path, 
+                                                                info.get("firstFrame"), 
+                                                                info.get("lastFrame")) is None:
+            self.log_debug("Render path '%s' is not a frame sequence. Quicktimes will be "
+                           "generated once the render has completed." % render_path)
+            return
+        
+        self._batch_follower = tk_flame_export_no_ui.RenderFollower.create()
+        
+        self.log_debug("Starting render follow job for '%s'" % render_path)
+        self.job_runner.create_local_backburner_job("Render %s - Shotgun Transcode" % info.get("nodeName"), 
+                                                    "Generating quicktimes while rendering.", 
+                                                    None, # run_after_job_id 
+                                                    self, 
+                                                    "backburner_follow_batch_render", 
+                                                    {"info": info,
+                                                     "export_preset": self._batch_export_preset.get_name(),
+                                                     "follow_folder": self._batch_follower.folder})
 
 
     def post_batch_render_sg_process(self, info):
@@ -953,6 +1267,10 @@ class FlameExport(Application):
             aborted:              Indicate if the export has been aborted by the user.
         """
         
+        if self._batch_follower:
+            # let the render follow job know that there are no more frames to wait for
+            self._batch_follower.set_render_finished(info.get("aborted"))
+        
         if info.get("aborted"):
             self.log_debug("Rendering was aborted. Will not push to Shotgun.")
             return 
@@ -964,23 +1282,77 @@ class FlameExport(Application):
 
         
         # now start preparing a remote job
-        args = {"info": info, 
-                "export_preset": self._batch_export_preset.get_name(),
-                "serialized_context": sgtk.context.serialize(self._batch_context),
-                "comments": self._user_comments,
-                "send_to_review": self._send_batch_render_to_review }
+        render = {"info": info, 
+                  "export_preset": self._batch_export_preset.get_name(),
+                  "serialized_context": sgtk.context.serialize(self._batch_context),
+                  "comments": self._batch_user_comments,
+                  "send_to_review": self._send_batch_render_to_review,
+                  "follow_folder": self._batch_follower.folder if self._batch_follower else None }
+        
+        coalescing_window = self.get_setting("batch_render_coalescing_window")
+        if coalescing_window <= 0:
+            # submit straight away
+            self.__submit_batch_renders([render])
+            return
         
-        # and populate backburner job parameters
-        job_title = "Render %s - Shotgun Upload" % info.get("nodeName")
-        job_desc = "Generating quicktime and uploading to Shotgun."
+        # Artists often fire off several renders in quick succession. Rather than 
+        # submitting a job per render, hold on to the render for a little while and
+        # process all renders that arrive within the window in a single job.
+        self._pending_batch_renders_lock.acquire()
+        try:
+            self._pending_batch_renders.append(render)
+            if self._pending_batch_renders_timer is None:
+                self.log_debug("Holding batch renders for %s seconds before submitting." % coalescing_window)
+                self._pending_batch_renders_timer = threading.Timer(coalescing_window, 
+                                                                    self.__submit_pending_batch_renders)
+                self._pending_batch_renders_timer.daemon = True
+                self._pending_batch_renders_timer.start()
+        finally:
+            self._pending_batch_renders_lock.release()
+    
+    def __submit_pending_batch_renders(self):
+        """
+        Submits all batch renders held back by post_batch_render_sg_process.
+        """
+        self._pending_batch_renders_lock.acquire()
+        try:
+            if self._pending_batch_renders_timer:
+                self._pending_batch_renders_timer.cancel()
+                self._pending_batch_renders_timer = None
+            renders = self._pending_batch_renders
+            self._pending_batch_renders = []
+        finally:
+            self._pending_batch_renders_lock.release()
+        
+        if len(renders) > 0:
+            self.__submit_batch_renders(renders)
+    
+    def __submit_batch_renders(self, renders):
+        """
+        Submits a backburner job which processes a number of batch renders.
+        
+        :param renders: List of dictionaries with keys info, export_preset, serialized_context, 
+                        comments and send_to_review. See backburner_process_rendered_batch.
+        """
+        if len(renders) == 1:
+            job_title = "Render %s - Shotgun Upload" % renders[0]["info"].get("nodeName")
+            job_desc = "Generating quicktime and uploading to Shotgun."
+            method_name = "backburner_process_rendered_batch"
+            args = renders[0]
+        else:
+            job_title = "%s Renders - Shotgun Upload" % len(renders)
+            job_desc = "Generating quicktimes and uploading to Shotgun for renders %s." % ", ".join(
+                [x["info"].get("nodeName") for x in renders])
+            method_name = "backburner_process_rendered_batches"
+            args = {"renders": renders}
         
         # kick off async job
-        self.engine.create_local_backburner_job(job_title, 
-                                                job_desc, 
-                                                None, # run_after_job_id 
-                                                self, 
-                                                "backburner_process_rendered_batch", 
-                                                args)
+        self.job_runner.create_local_backburner_job(job_title, 
+                                                    job_desc, 
+                                                    None, # run_after_job_id 
+                                                    self, 
+                                                    method_name, 
+                                                    args)
 
 
 
@@ -990,108 +1362,361 @@ class FlameExport(Application):
     # backburner callbacks. These methods are executed as backburner jobs and not inside the main Flame UI.
     # at this point, there is no access to any UI.
 
-    def backburner_register_publishes(self, publish_requests, export_preset):
+    def backburner_register_publishes(self, manifest_path, item_ids):
         """
-        Generate publishes in Shotgun for a list of publish requests.
+        Generate publishes in Shotgun for a list of publish requests stored in 
+        a session manifest.
         
-        There are two types of data in the publish_requests list:
+        There are two types of publish requests in the manifest:
         
         { "type": "batch",
           "path": "/foo/bar",
-          "comments": "Some user comments",
-          "serialized_context": "xxxxx",
+          "context": "0",                     # id of context in the manifest
           "version": 123}
                                             
         { "type": "video",
-          "width": 1234,
-          "height": 1234,
-          "path": "/foo/bar",
-          "quicktime_path": "/path/to/quicktime.mov" # optional, may be None
-          "comments": "Some user comments",
-          "shot_thumbnail": True,             # should a thumbnail be pushed to the shot?
-          "version_id": 121323,               # associate publish with review version
-          "serialized_context": "xxxxx", 
-          "version": 13})
+          "segment": "12",                    # id of segment in the manifest
+          "shot_thumbnail": True}             # should a thumbnail be pushed to the shot?
 
-        :param publish_requests: List of things to publish, see above
-        :param export_preset: The export preset associated with the session
+        The export preset and user comments are stored as session settings in the manifest.
+        
+        Progress is recorded in a journal next to the manifest. If the job is retried 
+        after a failure, requests which were completed by the previous attempt are 
+        skipped, so that no duplicate publishes are created in Shotgun.
+
+        :param manifest_path: Path to the session manifest
+        :param item_ids: List of ids of publish requests in the manifest, see above
         """
         self.log_debug("Creating publishes for all export items.")
 
-        for request in publish_requests:
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        manifest = tk_flame_export_no_ui.SessionManifest.load(manifest_path)
+        journal = tk_flame_export_no_ui.WorkJournal(manifest_path, "publishes")
+        export_preset = manifest.get_setting("export_preset")
+        comments = manifest.get_setting("comments")
+
+        for item_id in item_ids:
 
-            self.log_debug("Registering %s for %s" % (request["type"], request["path"]))
-            context = sgtk.context.deserialize(request["serialized_context"])
+            if journal.is_done(item_id):
+                self.log_debug("Publish request %s was completed by a previous run. Skipping." % item_id)
+                continue
+
+            request = manifest.get_item(item_id)
+            record = journal.get_record(item_id)
             
             if request["type"] == "batch":    
-                self._sg_submit_helper.register_batch_publish(context, 
-                                                              request["path"], 
-                                                              request["comments"], 
-                                                              request["version"])
+                self.log_debug("Registering batch for %s" % request["path"])
+                sg_data = self._sg_submit_helper.register_batch_publish(manifest.get_context(request["context"]), 
+                                                                        request["path"], 
+                                                                        comments, 
+                                                                        request["version"])
+                journal.mark_done(item_id, publish={"type": sg_data["type"], "id": sg_data["id"]})
 
             elif request["type"] == "video":
-                sg_data = self._sg_submit_helper.register_video_publish(export_preset,
-                                                                        context,
-                                                                        request["width"], 
-                                                                        request["height"],                                                                        
-                                                                        request["path"], 
-                                                                        request["quicktime_path"],
-                                                                        request["comments"], 
-                                                                        request["version"],
-                                                                        request["shot_thumbnail"])
+                segment = manifest.get_segment(request["segment"])
+                
+                if "publish" in record:
+                    # the publish was registered by a previous run which then failed
+                    # to update the version. Pick up from there.
+                    self.log_debug("Video for %s already registered as %s" % (segment["path"], record["publish"]))
+                    sg_data = record["publish"]
+                    
+                else:
+                    self.log_debug("Registering video for %s" % segment["path"])
+                    sg_data = self._sg_submit_helper.register_video_publish(export_preset,
+                                                                            manifest.get_context(segment["context"]),
+                                                                            segment["width"], 
+                                                                            segment["height"],                                                                        
+                                                                            segment["path"], 
+                                                                            segment["quicktime_path"],
+                                                                            comments, 
+                                                                            segment["version"],
+                                                                            request["shot_thumbnail"])
+                    sg_data = {"type": sg_data["type"], "id": sg_data["id"]}
+                    journal.record(item_id, publish=sg_data)
 
-                if request["version_id"]:
-                    self._sg_submit_helper.update_version_dependencies(request["version_id"], sg_data)
+                if segment["version_id"]:
+                    self._sg_submit_helper.update_version_dependencies(segment["version_id"], sg_data)
+                
+                journal.mark_done(item_id)
 
             
         self.log_debug("Publish complete!")
     
-    def backburner_upload_quicktime(self, version_id, path, width, height, fps):
+    def backburner_upload_quicktime(self, manifest_path, segment_id):
         """
         Backburner job. Generates a quicktime and uploads it to Shotgun.
         
-        :param version_id: Shotgun version id
-        :param path: Path to source media
-        :param width: Width of source
-        :param height: Height of source
-        :param fps: The fps for the source media
+        Progress is recorded in a journal next to the manifest. If the upload fails 
+        and the job is retried by backburner, the quicktime generated by the failed 
+        run is uploaded rather than generated again, and segments which have already 
+        been uploaded are skipped.
+        
+        :param manifest_path: Path to the session manifest
+        :param segment_id: Id of the segment in the manifest
+        """
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        manifest = tk_flame_export_no_ui.SessionManifest.load(manifest_path)
+        segment = manifest.get_segment(segment_id)
+        journal = tk_flame_export_no_ui.WorkJournal(manifest_path, "quicktimes")
+        
+        if journal.is_done(segment_id):
+            self.log_debug("Quicktime for segment %s has already been uploaded." % segment_id)
+            return
+        
+        review_quicktime_path = journal.get_record(segment_id).get("review_quicktime")
+        if review_quicktime_path and os.path.exists(review_quicktime_path):
+            self.log_debug("Resuming upload of quicktime '%s' from a previous run." % review_quicktime_path)
+        else:
+            proxy_upload = None
+            if self.get_setting("progressive_review_upload"):
+                if self.get_setting("bypass_shotgun_transcoding"):
+                    # a proxy can't be uploaded without going through Shotgun transcoding
+                    self.log_debug("Bypassing Shotgun transcoding. No proxy quicktime will be uploaded.")
+                else:
+                    # get something in front of the reviewers quickly
+                    proxy_upload = self._sg_submit_helper.start_proxy_upload(segment["version_id"],
+                                                                             segment["path"], 
+                                                                             segment["width"], 
+                                                                             segment["height"], 
+                                                                             segment["fps"])
+            
+            self.log_debug("Starting to upload media to Shotgun. A quicktime will be generated.")
+            # the additional renditions are generated alongside the local quicktime, 
+            # unless no local quicktime is generated for this preset.
+            review_quicktime_path = self._sg_submit_helper.generate_quicktimes(segment["path"], 
+                                                                               segment["width"], 
+                                                                               segment["height"], 
+                                                                               segment["fps"],
+                                                                               export_preset_name=manifest.get_setting("export_preset"),
+                                                                               renditions=segment["quicktime_path"] is None)
+            journal.record(segment_id, review_quicktime=review_quicktime_path)
+            
+            if proxy_upload:
+                # make sure that the proxy upload can't replace the full quality quicktime
+                proxy_upload.join()
+        
+        completed_cuts = []
+        if manifest.get_setting("cut_folder"):
+            # keep a copy for the cut review movie
+            cut_review = tk_flame_export_no_ui.CutReviewMovie(manifest.get_setting("cut_folder"))
+            completed_cuts = cut_review.add_segment_movie(segment["version_id"], review_quicktime_path)
+        
+        uploaded = False
+        try:
+            self._sg_submit_helper.upload_review_quicktime(segment["version_id"],
+                                                           review_quicktime_path,
+                                                           segment["width"], 
+                                                           segment["height"],
+                                                           keep_on_failure=True)
+            journal.mark_done(segment_id)
+            uploaded = True
+        finally:
+            if completed_cuts and not uploaded:
+                # leave the cuts to the retry of this job, which adds the segment
+                # quicktime again and completes them once the upload has gone through.
+                cut_review.release_cuts(completed_cuts)
+        
+        # this was the last quicktime for these cuts, so assemble them here rather
+        # than having a separate job wait for them.
+        for name in completed_cuts:
+            try:
+                self.backburner_create_cut_review_movie(manifest.get_setting("cut_folder"), name)
+            except Exception, e:
+                self.log_exception("Could not create cut review movie %s: %s" % (name, e))
+
+    def backburner_generate_local_quicktime(self, manifest_path, segment_id):
+        """
+        Backburner job. Generates a quicktime suitable for local playback, together 
+        with the additional renditions configured in the settings hook.
+        
+        Completed quicktimes are recorded in a journal next to the manifest,
+        so that they are not generated again if the job is retried.
+        
+        :param manifest_path: Path to the session manifest
+        :param segment_id: Id of the segment in the manifest
+        """
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        manifest = tk_flame_export_no_ui.SessionManifest.load(manifest_path)
+        segment = manifest.get_segment(segment_id)
+        journal = tk_flame_export_no_ui.WorkJournal(manifest_path, "local_quicktimes")
+        
+        if journal.is_done(segment_id):
+            self.log_debug("Local quicktime for segment %s has already been generated." % segment_id)
+            return
+        
+        self._sg_submit_helper.create_local_quicktime(manifest.get_setting("export_preset"), 
+                                                      segment["version_id"], 
+                                                      segment["path"], 
+                                                      segment["quicktime_path"], 
+                                                      segment["width"], 
+                                                      segment["height"], 
+                                                      segment["fps"],
+                                                      renditions=True)
+        journal.mark_done(segment_id)
+
+
+    def backburner_create_cut_review_movie(self, cut_folder, name):
+        """
+        Backburner job. Joins the review quicktimes of all segments in a cut into a 
+        single movie and publishes it as a version for the shot parent. Also called
+        directly by the upload job which completes the cut, see backburner_upload_quicktime.
+        
+        :param cut_folder: Folder of the CutReviewMovie holding the segment quicktimes
+        :param name: Name of the cut version
         """
-        self._sg_submit_helper.upload_quicktime(version_id, path, width, height, fps)        
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        cut_review = tk_flame_export_no_ui.CutReviewMovie(cut_folder)
+        cut = cut_review.get_cut(name)
+        
+        try:
+            movie_path = cut_review.assemble(name)
+            self._sg_submit_helper.create_cut_version(sgtk.context.deserialize(cut["context"]),
+                                                      cut["entity"],
+                                                      name,
+                                                      cut["comments"],
+                                                      movie_path)
+        finally:
+            cut_review.clean_up(name)
 
-    def backburner_generate_local_quicktime(self, export_preset_name, version_id, path, quicktime_path, width, height, fps):
+    def backburner_invoke(self, method_name, args):
         """
-        Backburner job. Generates a quicktime suitable for local playback
+        Backburner job. Hands a backburner callback over to the worker daemon running 
+        on this node. If no worker daemon is running, one is started in the background
+        for the jobs that follow, and the callback is executed directly.
         
-        :param export_preset_name: Export preset name associated with this export
-        :param version_id: Shotgun version id
-        :param path: Path to source media
-        :param quicktime_path: The path to the quicktime that should be generated
-        :param width: Width of source
-        :param height: Height of source
-        :param fps: The fps for the source media
+        :param method_name: Name of the backburner callback to execute
+        :param args: Dictionary of arguments to pass to the callback
         """
-        self._sg_submit_helper.create_local_quicktime(export_preset_name, 
-                                                      version_id, 
-                                                      path, 
-                                                      quicktime_path, 
-                                                      width, 
-                                                      height, 
-                                                      fps)
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        if not tk_flame_export_no_ui.WorkerClient().invoke(method_name, args):
+            tk_flame_export_no_ui.WorkerDaemon.spawn(self.get_setting("worker_daemon_idle_timeout"),
+                                                     self.get_setting("media_worker_concurrency"))
+            self.log_debug("No worker daemon available. Executing %s in this job." % method_name)
+            getattr(self, method_name)(**args)
 
+    def backburner_run_session_job(self, manifest_path, job_id, method_name, args):
+        """
+        Backburner job. Executes a backburner callback which belongs to an export session
+        and reports back to the session manifest once it has finished, successfully or 
+        not, so that the session files can be removed after the last job of the session.
+        
+        :param manifest_path: Path to the session manifest
+        :param job_id: Id of the job in the session
+        :param method_name: Name of the backburner callback to execute
+        :param args: Dictionary of arguments to pass to the callback
+        """
+        failed = True
+        try:
+            getattr(self, method_name)(**args)
+            failed = False
+        finally:
+            try:
+                tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+                manifest = tk_flame_export_no_ui.SessionManifest.load(manifest_path)
+                manifest.mark_job_done(job_id, failed=failed)
+            except Exception, e:
+                if not failed:
+                    raise
+                # don't hide the error which failed the job
+                self.log_exception("Could not report failed job %s to session "
+                                   "manifest '%s': %s" % (job_id, manifest_path, e))
 
-    def backburner_upload_version_thumbnails(self, items):
+    def backburner_process_media_pool(self, manifest_path, pool_id, concurrency):
         """
-        Backburner job. Upload thumbnails for a list of versions.
+        Backburner job. Pulls media work items from a pool in the session manifest
+        shared with other worker jobs and processes several of them concurrently.
         
-        Each version is represented by a dictionary with keys path, width, height and version_id, 
-        where the path is a path to an exported Flame item 
+        :param manifest_path: Path to the session manifest
+        :param pool_id: Id of the pool of work items in the manifest
+        :param concurrency: Number of items to process concurrently
+        """
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        manifest = tk_flame_export_no_ui.WorkManifest(manifest_path, pool_id)
+        pool = tk_flame_export_no_ui.MediaWorkerPool(manifest, concurrency)
+        pool.run()
+
+    def backburner_upload_version_thumbnails(self, manifest_path, segment_ids):
+        """
+        Backburner job. Upload thumbnails for the versions of a list of segments
+        stored in a session manifest.
+        
+        Uploaded thumbnails are recorded in a journal next to the manifest, so that a 
+        retry of the job only extracts and uploads the thumbnails that are missing.
         
-        :param items: List of dictionaries. See above
+        :param manifest_path: Path to the session manifest
+        :param segment_ids: List of ids of segments in the manifest
         """
-        self._sg_submit_helper.upload_version_thumbnails(items)
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        manifest = tk_flame_export_no_ui.SessionManifest.load(manifest_path)
+        journal = tk_flame_export_no_ui.WorkJournal(manifest_path, "thumbnails")
+        
+        for segment_id in segment_ids:
+            
+            if journal.is_done(segment_id):
+                self.log_debug("Thumbnail for segment %s was uploaded by a previous run. Skipping." % segment_id)
+                continue
+            
+            segment = manifest.get_segment(segment_id)
+            item = {"path": segment["path"], 
+                    "width": segment["width"],
+                    "height": segment["height"],
+                    "version_id": segment["version_id"]}
+        
+            self._sg_submit_helper.upload_version_thumbnails([item])
+            journal.mark_done(segment_id, version_id=segment["version_id"])
 
 
-    def backburner_process_rendered_batch(self, info, export_preset, serialized_context, comments, send_to_review):
+    def backburner_follow_batch_render(self, info, export_preset, follow_folder):
+        """
+        Backburner job. Generates the quicktimes for a batch render while Flare is 
+        rendering it, by feeding the frames into the encoder as they are written to disk.
+        
+        If the transcode can't be completed, for example because the render was aborted,
+        the job exits quietly and the quicktimes are generated from scratch by 
+        backburner_process_rendered_batch once the render has completed.
+        
+        :param info: Dictionary with render parameters, see pre_batch_render_checks
+        :param export_preset: Export preset associated with the render
+        :param follow_folder: Folder of the RenderFollower for the render
+        """
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        follower = tk_flame_export_no_ui.RenderFollower(follow_folder)
+        
+        if not follower.start():
+            self.log_debug("Render has already been processed. Nothing to do.")
+            return
+        
+        export_preset_obj = self.export_preset_handler.get_preset_by_name(export_preset)
+        full_flame_plate_path = os.path.join(info.get("exportPath"), info.get("resolvedPath"))
+        frame_paths = follower.get_frame_paths(full_flame_plate_path, info.get("firstFrame"), info.get("lastFrame"))
+        
+        quicktime_path = None
+        if export_preset_obj.make_highres_quicktime():
+            quicktime_path = export_preset_obj.quicktime_path_from_render_path(full_flame_plate_path)
+        
+        try:
+            frames = follower.follow_frames(frame_paths, self.get_setting("render_follow_timeout"))
+            review_quicktime_path = self._sg_submit_helper.generate_quicktimes(full_flame_plate_path,
+                                                                               info["width"], 
+                                                                               info["height"],
+                                                                               info["fps"],
+                                                                               review_quicktime=export_preset_obj.upload_quicktime(),
+                                                                               export_preset_name=export_preset,
+                                                                               quicktime_path=quicktime_path,
+                                                                               frames=frames,
+                                                                               renditions=True)
+        except Exception, e:
+            self.log_warning("Could not generate quicktimes while rendering: %s. They will be "
+                             "generated once the render has completed." % e)
+            follower.fail()
+            return
+        
+        if not follower.finish(review_quicktime_path) and review_quicktime_path:
+            # the render job gave up on us and is generating the quicktimes itself
+            self._sg_submit_helper.discard_review_quicktime(review_quicktime_path)
+    
+    def backburner_process_rendered_batch(self, info, export_preset, serialized_context, comments, send_to_review, follow_folder=None):
         """
         Backburner job. Takes a newly generated render and processes it for Shotgun:
         
@@ -1135,71 +1760,237 @@ class FlameExport(Application):
                                    is associated with, in serialized form.
         :param comments: User comments, as a string
         :param send_to_review: Boolean to indicate that we should send to sg review.            
+        :param follow_folder: Folder of the RenderFollower for the render, if its 
+                              quicktimes are being generated while rendering.
         """
-        context = sgtk.context.deserialize(serialized_context)
-        version_number = int(info["versionNumber"])
-        description = comments or "Automatic Flame batch render"
-        export_preset_obj = self.export_preset_handler.get_preset_by_name(export_preset)
-        
-        # first register the batch file as a publish in Shotgun
-        batch_path = info.get("setupResolvedPath")
-        self._sg_submit_helper.register_batch_publish(context, batch_path, description, version_number)
+        self.backburner_process_rendered_batches([{"info": info,
+                                                   "export_preset": export_preset,
+                                                   "serialized_context": serialized_context,
+                                                   "comments": comments,
+                                                   "send_to_review": send_to_review,
+                                                   "follow_folder": follow_folder}])
 
-        # Now register the rendered images as a published plate in Shotgun
-        full_flame_plate_path = os.path.join(info.get("exportPath"), info.get("resolvedPath"))
+    def backburner_process_rendered_batches(self, renders):
+        """
+        Backburner job. Processes a number of newly generated renders for Shotgun. 
+        For each render, the same steps are carried out as in backburner_process_rendered_batch, 
+        but the renders are processed together: 
+        
+        - publishes are registered concurrently for all renders
+        - versions for all renders are created in a single Shotgun batch call
+        - quicktimes for all renders are generated concurrently, while the 
+          publishes and versions are being created
+        - each quicktime is uploaded as soon as it is ready, while the 
+          quicktimes for the other renders are still being encoded
+        
+        :param renders: List of dictionaries with keys info, export_preset, serialized_context, 
+                        comments and send_to_review. See backburner_process_rendered_batch.
+        """
+        tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        concurrency = self.get_setting("media_worker_concurrency")
         
-        quicktime_path = None
-        if export_preset_obj.make_highres_quicktime() and send_to_review:
-            # note 1: Only if the send to review button is clicked, a quicktime will be generated. 
-            # note 2: at this point we have already validated the path and know it conforms with the toolkit templates.
-            quicktime_path = export_preset_obj.quicktime_path_from_render_path(full_flame_plate_path)
+        # any errors are collected and reported at the end, so that a failing 
+        # render doesn't prevent the others from being processed.
+        errors = []
         
-        sg_data = self._sg_submit_helper.register_video_publish(export_preset_obj.get_name(),
-                                                                context, 
-                                                                info["width"], 
-                                                                info["height"],                                                                
-                                                                full_flame_plate_path, 
-                                                                quicktime_path,
-                                                                description,
-                                                                version_number, 
-                                                                make_shot_thumb=False)
-        
-        # Finally, create a version record in Shotgun, generate a quicktime and upload it
-        # only do this if the user clicked "send to review" in the UI.
-        if send_to_review:
-                        
-            # Step 1 - Create Shotgun Version
-            sg_version_data = self._sg_submit_helper.create_version(context, 
-                                                                    full_flame_plate_path,
-                                                                    description,
-                                                                    sg_data, 
-                                                                    info["aspectRatio"])     
+        items = []
+        for render in renders:
+            info = render["info"]
+            export_preset_obj = self.export_preset_handler.get_preset_by_name(render["export_preset"])
+            full_flame_plate_path = os.path.join(info.get("exportPath"), info.get("resolvedPath"))
             
-            # step 2 - See if we should push a thumbnail
-            if export_preset_obj.upload_quicktime() == False or self.get_setting("bypass_shotgun_transcoding"):            
+            quicktime_path = None
+            if export_preset_obj.make_highres_quicktime() and render["send_to_review"]:
+                # note 1: Only if the send to review button is clicked, a quicktime will be generated. 
+                # note 2: at this point we have already validated the path and know it conforms with the toolkit templates.
+                quicktime_path = export_preset_obj.quicktime_path_from_render_path(full_flame_plate_path)
+            
+            items.append({"info": info,
+                          "context": sgtk.context.deserialize(render["serialized_context"]),
+                          "version_number": int(info["versionNumber"]),
+                          "description": render["comments"] or "Automatic Flame batch render",
+                          "export_preset": export_preset_obj,
+                          "send_to_review": render["send_to_review"],
+                          "path": full_flame_plate_path,
+                          "quicktime_path": quicktime_path,
+                          "follow_folder": render.get("follow_folder")})
+        
+        # The work for the renders is carried out as a small task graph:
+        #
+        # - The Shotgun registration (publishes and versions) runs concurrently 
+        #   with the media generation. For each render, the review quicktime and 
+        #   the high res local quicktime are encoded from a single read of the frames.
+        # - As soon as the media for a render is ready and its version has been created, 
+        #   the media is attached to the version. Uploads are therefore pipelined with 
+        #   the encodes of the other renders, rather than waiting for the last encode.
+        #
+        registered = threading.Event()
+        
+        # one thread for the registration, which the media tasks wait for
+        tasks = tk_flame_export_no_ui.TaskGroup(concurrency + 1)
+        tasks.add("Register renders in Shotgun", self.__register_rendered_batches, items, concurrency, registered)
+        
+        for item in items:
+            if item["send_to_review"]:
+                tasks.add("Process media for %s" % item["info"].get("nodeName"),
+                          self.__process_rendered_media,
+                          item,
+                          registered)
+        try:
+            tasks.run()
+        except TankError, e:
+            errors.append("%s" % e)
+        
+        if errors:
+            raise TankError("\n".join(errors))
+    
+    def __process_rendered_media(self, item, registered):
+        """
+        Generates the quicktimes for a render and attaches them, along with a thumbnail 
+        if needed, to the render's version once it has been created.
+        
+        :param item: Render item, see backburner_process_rendered_batches
+        :param registered: threading.Event which is set once the versions have been created
+        """
+        info = item["info"]
+        export_preset_obj = item["export_preset"]
+        review_quicktime = export_preset_obj.upload_quicktime()
+        
+        review_quicktime_path = None
+        quicktime_generated = False
+        media_error = None
+        if review_quicktime or item["quicktime_path"]:
+            try:
+                review_quicktime_path = self.__generate_rendered_quicktimes(item, review_quicktime)
+                quicktime_generated = item["quicktime_path"] is not None
+            except Exception, e:
+                # still attach a thumbnail to the version below
+                self.log_exception("Quicktime generation failed for %s" % info.get("nodeName"))
+                media_error = e
+        
+        registered.wait()
+        sg_version_data = item.get("sg_version")
+        
+        if sg_version_data is None:
+            # the version could not be created
+            if review_quicktime_path:
+                self._sg_submit_helper.discard_review_quicktime(review_quicktime_path)
+        
+        else:
+            # See if we should push a thumbnail
+            if review_quicktime == False or self.get_setting("bypass_shotgun_transcoding"):            
                 # there will be no transcoding happening on the server so pass a manual thumbnail
                 version_info = {"version_id": sg_version_data["id"], 
                                 "width": info["width"],
                                 "height": info["height"],
-                                "path": full_flame_plate_path}
-                self._sg_submit_helper.upload_version_thumbnails([version_info])                
-                
-            # Step 3 - Generate and upload quicktime
-            if export_preset_obj.upload_quicktime():
-                # and upload a quicktime to Shotgun
-                self._sg_submit_helper.upload_quicktime(sg_version_data["id"], 
-                                                        full_flame_plate_path, 
-                                                        info["width"], 
-                                                        info["height"],
-                                                        info["fps"])
+                                "path": item["path"]}
+                self._sg_submit_helper.upload_version_thumbnails([version_info])
             
-            # Step 4 - Generate high res local quicktime
-            if export_preset_obj.make_highres_quicktime():
-                self._sg_submit_helper.create_local_quicktime(export_preset_obj.get_name(),
-                                                              sg_version_data["id"], 
-                                                              full_flame_plate_path, 
-                                                              quicktime_path, 
-                                                              info["width"], 
-                                                              info["height"],
-                                                              info["fps"])
-                
+            # Upload review quicktime
+            if review_quicktime_path:
+                self._sg_submit_helper.upload_review_quicktime(sg_version_data["id"], 
+                                                               review_quicktime_path, 
+                                                               info["width"], 
+                                                               info["height"])
+            
+            # Link high res local quicktime
+            if quicktime_generated:
+                self._sg_submit_helper.set_version_movie_path(sg_version_data["id"], item["quicktime_path"])
+        
+        if media_error:
+            raise media_error
+    
+    def __generate_rendered_quicktimes(self, item, review_quicktime):
+        """
+        Generates the quicktimes for a render, or picks them up from the render follow
+        job if they were generated while rendering.
+        
+        :param item: Render item, see backburner_process_rendered_batches
+        :param review_quicktime: True if a quicktime for Shotgun review should be generated
+        :returns: Path to the review quicktime, None if no review quicktime was requested.
+        """
+        if item["follow_folder"]:
+            tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+            follower = tk_flame_export_no_ui.RenderFollower(item["follow_folder"])
+            (done, review_quicktime_path) = follower.take_result(self.get_setting("render_follow_timeout"))
+            if done:
+                self.log_debug("Using quicktimes generated while rendering %s." % item["info"].get("nodeName"))
+                return review_quicktime_path
+            self.log_debug("Quicktimes were not generated while rendering %s. "
+                           "Generating them now." % item["info"].get("nodeName"))
+        
+        return self._sg_submit_helper.generate_quicktimes(item["path"], 
+                                                          item["info"]["width"], 
+                                                          item["info"]["height"],
+                                                          item["info"]["fps"],
+                                                          review_quicktime=review_quicktime,
+                                                          export_preset_name=item["export_preset"].get_name(),
+                                                          quicktime_path=item["quicktime_path"],
+                                                          renditions=True)
+    
+    def __register_rendered_batches(self, items, concurrency, registered):
+        """
+        Registers publishes for a number of batch renders and creates versions for 
+        the renders which should be sent to review. The Shotgun version data is 
+        stored in each item under the sg_version key.
+        
+        :param items: List of render dictionaries, as prepared by backburner_process_rendered_batches
+        :param concurrency: Number of publishes to register concurrently
+        :param registered: threading.Event to set once registration has completed,
+                           successfully or not.
+        :raises: TankError if any publishes failed. Versions are still created for 
+                 the renders which were published successfully.
+        """
+        try:
+            tk_flame_export_no_ui = self.import_module("tk_flame_export_no_ui")
+        
+            # Register the batch files and the rendered images as publishes in Shotgun.
+            tasks = tk_flame_export_no_ui.TaskGroup(concurrency)
+            for item in items:
+                tasks.add("Register batch publish for %s" % item["info"].get("nodeName"),
+                          self._sg_submit_helper.register_batch_publish,
+                          item["context"], 
+                          item["info"].get("setupResolvedPath"), 
+                          item["description"], 
+                          item["version_number"])
+            
+                item["publish_task"] = tasks.add("Register render publish for %s" % item["info"].get("nodeName"),
+                                                 self._sg_submit_helper.register_video_publish,
+                                                 item["export_preset"].get_name(),
+                                                 item["context"], 
+                                                 item["info"]["width"], 
+                                                 item["info"]["height"],                                                                
+                                                 item["path"], 
+                                                 item["quicktime_path"],
+                                                 item["description"],
+                                                 item["version_number"], 
+                                                 make_shot_thumb=False)
+            publish_error = None
+            try:
+                tasks.run()
+            except TankError, e:
+                publish_error = e
+        
+            # Create Shotgun Versions in a single batch call. 
+            # only do this if the user clicked "send to review" in the UI.
+            review_items = [x for x in items if x["send_to_review"] and x["publish_task"]["error"] is None]
+            if len(review_items) > 0:
+                sg_version_batch = []
+                for item in review_items:
+                    sg_version_batch.append(self._sg_submit_helper.create_version_batch(item["context"], 
+                                                                                        item["path"],
+                                                                                        item["description"],
+                                                                                        item["publish_task"]["result"], 
+                                                                                        item["info"]["aspectRatio"],
+                                                                                        item["export_preset"].get_render_template()))
+                self.log_debug("Creating %s versions in Shotgun..." % len(sg_version_batch))
+                sg_versions = self.shotgun.batch(sg_version_batch)
+            
+                for (item, sg_version_data) in zip(review_items, sg_versions):
+                    item["sg_version"] = sg_version_data
+        
+            if publish_error:
+                raise publish_error
+        finally:
+            # let the media tasks proceed
+            registered.set()
@@ -120,6 +120,29 @@ class ExportSettings(HookBaseClass):
         """
         return None
         
+    def get_ffmpeg_thread_count(self, cpu_count, max_encodes, num_outputs):
+        """
+        Control how many threads ffmpeg uses for each quicktime it encodes.
+        
+        The number of concurrent encodes on a node is capped by the max_concurrent_encodes
+        app setting. Each encode reads the media once and may write several quicktimes at 
+        the same time, e.g. a quicktime for Shotgun review and one for local playback, 
+        each with its own encoder threads.
+        
+        The thread count is passed to ffmpeg ahead of the parameters returned by the 
+        encode parameter methods below, so a -threads parameter returned by those 
+        takes precedence.
+        
+        :param cpu_count: The number of cores on the node running the encode
+        :param max_encodes: The maximum number of concurrent encodes on the node
+        :param num_outputs: The number of quicktimes written by this encode
+        :returns: Number of threads for each quicktime
+        """
+        # give each encode slot an equal share of the cores, so that the node isn't 
+        # oversubscribed when all slots are busy, and split it between the quicktimes 
+        # written by the encode.
+        return max(1, cpu_count / max(1, max_encodes) / max(1, num_outputs))
+        
     def get_ffmpeg_quicktime_encode_parameters(self):
         """
         Control how quicktimes are generated before being uploaded to Shotgun.
@@ -128,6 +151,8 @@ class ExportSettings(HookBaseClass):
         and be careful to test that all parameters and traits you wish to customize
         are included and supported in this particular build of ffmpeg.
         
+        The number of threads is set by get_ffmpeg_thread_count.
+        
         :returns: string of ffmpeg parameters which will be appended to the ffmpeg command line
         """
         
@@ -142,7 +167,7 @@ class ExportSettings(HookBaseClass):
         # https://support.shotgunsoftware.com/entries/26303513-Transcoding
         
         params = ""         
-        params += "-threads 2 -vcodec libx264 -me_method umh -directpred 3 -coder ac -me_range 16 -g 250 "
+        params += "-vcodec libx264 -me_method umh -directpred 3 -coder ac -me_range 16 -g 250 "
         params += "-rc_eq 'blurCplx^(1-qComp)' -keyint_min 25 -sc_threshold 40 -i_qfactor 0.71428572 "
         params += "-b_qfactor 0.76923078 -b_strategy 1 -qcomp 0.6 -qmin 10 -qmax 51 -qdiff 4  -trellis 1 "
         params += "-subq 6 -partitions +parti8x8+parti4x4+partp8x8+partp4x4+partb8x8 -bidir_refine 1 "
@@ -162,6 +187,29 @@ class ExportSettings(HookBaseClass):
         
         return params
             
+    def get_ffmpeg_proxy_quicktime_encode_parameters(self):
+        """
+        Control how proxy quicktimes are generated when the progressive_review_upload 
+        setting is enabled. The proxy is a small quicktime which is uploaded to Shotgun 
+        ahead of the full quality quicktime, so it should be as fast as possible to 
+        encode. Image quality is secondary, since it will be replaced shortly after.
+        
+        These quicktimes are generated inside Flame using ffmpeg version SVN-r17733.
+        See get_ffmpeg_quicktime_encode_parameters for details.
+        
+        :returns: string of ffmpeg parameters which will be appended to the ffmpeg command line
+        """
+        
+        # the cheapest settings of the H264 encoder: diamond motion search, no sub-pixel 
+        # refinement, a single reference frame, no b-frames and no trellis quantization.
+        params = ""
+        params += "-vcodec libx264 -me_method dia -subq 1 -refs 1 -bf 0 -trellis 0 "
+        params += "-partitions -parti8x8-parti4x4-partp8x8-partp4x4-partb8x8 -coder 0 -g 250 "
+        params += "-keyint_min 25 -sc_threshold 40 -qmin 10 -qmax 51 "
+        params += "-crf 32 "
+        
+        return params
+            
     def get_local_quicktime_prescale(self, preset_name, width, height):
         """
         Control the scaling that happens before the media is passed to ffmpeg.
@@ -186,6 +234,8 @@ class ExportSettings(HookBaseClass):
         and be careful to test that all parameters and traits you wish to customize
         are included and supported in this particular build of ffmpeg.
         
+        The number of threads is set by get_ffmpeg_thread_count.
+        
         :param preset_name: The name of the export preset that the user has selected in the 
                             export UI dialog.        
         :returns: string of ffmpeg parameters which will be appended to the ffmpeg command line
@@ -201,7 +251,7 @@ class ExportSettings(HookBaseClass):
         # https://support.shotgunsoftware.com/entries/26303513-Transcoding
         
         params = ""         
-        params += "-threads 2 -vcodec libx264 -me_method umh -directpred 3 -coder ac -me_range 16 -g 250 "
+        params += "-vcodec libx264 -me_method umh -directpred 3 -coder ac -me_range 16 -g 250 "
         params += "-rc_eq 'blurCplx^(1-qComp)' -keyint_min 25 -sc_threshold 40 -i_qfactor 0.71428572 "
         params += "-b_qfactor 0.76923078 -b_strategy 1 -qcomp 0.6 -qmin 10 -qmax 51 -qdiff 4  -trellis 1 "
         params += "-subq 6 -partitions +parti8x8+parti4x4+partp8x8+partp4x4+partb8x8 -bidir_refine 1 "
@@ -220,3 +270,54 @@ class ExportSettings(HookBaseClass):
         
         return params
     
+
+    def get_quicktime_renditions(self, preset_name, path, width, height):
+        """
+        Control which additional quicktime renditions, for example a small proxy for 
+        mobile devices, are generated alongside the quicktimes for Shotgun review and 
+        local playback.
+        
+        All quicktimes for a render are encoded from a single read of the frames, with 
+        each rendition scaled down separately, so adding renditions adds encode time 
+        but doesn't add another read of the media.
+        
+        Each rendition is a dictionary with the following keys:
+        
+            name:   Name of the rendition. This is passed to 
+                    get_quicktime_rendition_encode_parameters.
+            height: The desired height of the rendition. The width is derived from the 
+                    aspect ratio of the frames, see get_local_quicktime_prescale.
+            path:   Path to write the rendition to.
+        
+        Example, generating a 270 pixel high proxy next to the frames:
+        
+            base_path = os.path.splitext(os.path.splitext(path)[0])[0]
+            return [{"name": "mobile", "height": 270, "path": "%s_mobile.mov" % base_path}]
+        
+        :param preset_name: The name of the export preset that the user has selected in the 
+                            export UI dialog.
+        :param path: Path to the frames, Flame style path with [1234-1234] sequence marker.
+        :param width: The width in pixels of the input images 
+        :param height: The height in pixels of the input images
+        :returns: List of rendition dictionaries. 
+        """
+        return []
+    
+    def get_quicktime_rendition_encode_parameters(self, rendition_name):
+        """
+        Control how the quicktime renditions returned by get_quicktime_renditions are generated.
+        
+        These quicktimes are generated inside Flame using ffmpeg version SVN-r17733.
+        See get_ffmpeg_quicktime_encode_parameters for details.
+        
+        :param rendition_name: The name of the rendition
+        :returns: string of ffmpeg parameters which will be appended to the ffmpeg command line
+        """
+        # small renditions play back on devices with limited decoding capabilities, 
+        # so stick to the simpler parts of the H264 toolset.
+        params = ""
+        params += "-vcodec libx264 -me_method hex -subq 5 -refs 1 -bf 0 -coder 0 -g 250 "
+        params += "-keyint_min 25 -sc_threshold 40 -qmin 10 -qmax 51 "
+        params += "-crf 26 "
+        
+        return params
@@ -12,3 +12,17 @@
 from .shotgun_submit import ShotgunSubmitter
 from .export_preset import ExportPresetHandler, ExportPreset
 from .shot_metadata import SegmentMetadata, ShotMetadata
+from .export_session import ExportSession, ExportSessionRegistry
+from .session_manifest import SessionManifest
+from .work_journal import WorkJournal
+from .encode_slots import EncodeSlots
+from .upload_bandwidth import UploadBandwidthScheduler
+from .job_scheduler import JobScheduler
+from .local_job_runner import LocalJobRunner
+from .media_pool import WorkManifest, MediaWorkerPool
+from .task_group import TaskGroup
+from .render_follower import RenderFollower
+from .cut_review import CutReviewMovie
+from .filmstrip import FilmstripBuilder
+from .temp_space import TempSpaceManager
+from .worker_daemon import WorkerDaemon, WorkerClient
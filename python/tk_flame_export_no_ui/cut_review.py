@@ -0,0 +1,345 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import uuid
+import json
+import errno
+import shutil
+import subprocess
+
+import sgtk
+from sgtk import TankError
+
+from .temp_space import TempSpaceManager
+from .util import subprocess_check_output, SubprocessCalledProcessError
+
+class CutReviewMovie(object):
+    """
+    Review movie for a whole cut, assembled from the review quicktimes of its segments.
+
+    As the review quicktime for each segment is uploaded, a copy is kept in a folder
+    shared by the export session, named after the version it was uploaded to. Once
+    the quicktimes for all segments in the cut are available, they are joined in cut
+    order with ffmpeg's concat demuxer. The media is copied rather than re-encoded, so
+    assembling the cut only costs the time it takes to read and write the files.
+
+    All segment quicktimes are generated with the same encode settings, which is
+    what makes it possible to join them without re-encoding. Segments with different
+    resolutions can't be joined this way.
+
+    The folder is shared by all the cuts (sequences) in an export session. Flame
+    registers the cuts once all shots have been submitted, see add_cut() and finalize().
+    Whoever completes a cut, either the upload job which keeps its last segment 
+    quicktime or Flame when registering it, claims it and has it assembled, so the
+    assembly never waits for quicktimes in a backburner slot. Once the cuts are final,
+    segment quicktimes which aren't part of any cut are no longer kept, and the folder
+    is removed after the last cut has been assembled.
+
+    The folder is covered by a temp space lease, so that it is reclaimed eventually
+    even if some of the segment quicktimes never arrive, e.g. because an upload failed.
+    """
+
+    # number of seconds the folder is kept if its cuts are never completed
+    LEASE_DURATION = 7 * 24 * 3600
+
+    def __init__(self, folder):
+        """
+        Constructor. Use CutReviewMovie.create() to set up a new cut.
+
+        :param folder: Folder holding the segment quicktimes
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._folder = folder
+
+    @classmethod
+    def create(cls):
+        """
+        Sets up a folder for the segment quicktimes in the backburner temp location.
+
+        :returns: CutReviewMovie object
+        """
+        app = sgtk.platform.current_bundle()
+        temp_space = TempSpaceManager(app.engine.get_backburner_tmp())
+        folder = temp_space.allocate_folder("tk_flame_export_cuts_",
+                                            duration=cls.LEASE_DURATION,
+                                            shared=True)
+        return cls(folder)
+
+    @property
+    def folder(self):
+        """
+        The folder holding the segment quicktimes
+        """
+        return self._folder
+
+    def add_cut(self, name, version_ids, serialized_context, entity, comments):
+        """
+        Registers a cut. Called from the Flame session once all shots have been submitted.
+
+        :param name: Name of the cut movie, without extension
+        :param version_ids: Ids of the segment versions, in cut order
+        :param serialized_context: Context of one of the shots in the cut, in serialized form
+        :param entity: Shotgun entity dictionary for the shot parent
+        :param comments: User comments, as a string
+        """
+        cut = {"version_ids": version_ids,
+               "context": serialized_context,
+               "entity": entity,
+               "comments": comments}
+
+        # write to a temp file and rename into place, so that the upload jobs
+        # never see a partial cut
+        cut_path = self.__get_cut_path(name)
+        tmp_path = "%s.%s.tmp" % (cut_path, uuid.uuid4().hex)
+        fh = open(tmp_path, "wt")
+        try:
+            json.dump(cut, fh)
+        finally:
+            fh.close()
+        os.rename(tmp_path, cut_path)
+
+    def finalize(self):
+        """
+        Records that all cuts have been registered. Segment quicktimes which have been
+        kept for segments which are not part of any cut are removed.
+
+        :returns: List of names of the cuts which are already complete. These have been
+                  claimed by the caller, who should assemble them.
+        """
+        open(os.path.join(self._folder, "cuts.final"), "a").close()
+
+        used_version_ids = self.__get_used_version_ids()
+        for name in os.listdir(self._folder):
+            if name.startswith("version_") and name.endswith(".mov"):
+                if name[len("version_"):-len(".mov")] not in used_version_ids:
+                    self.__remove_file(os.path.join(self._folder, name))
+
+        claimed_cuts = self.__claim_completed_cuts()
+        self.__remove_if_finished()
+        return claimed_cuts
+
+    def add_segment_movie(self, version_id, path):
+        """
+        Keeps a copy of the review quicktime for a segment, unless the cuts have
+        been registered and the segment isn't part of any of them.
+
+        :param version_id: Id of the version the quicktime belongs to
+        :param path: Path to the review quicktime
+        :returns: List of names of the cuts completed by the quicktime. These have been
+                  claimed by the caller, who should assemble them.
+        """
+        if self.__is_final() and str(version_id) not in self.__get_used_version_ids():
+            self._app.log_debug("Version %s is not part of a cut review movie." % version_id)
+            return []
+
+        target_path = self.__get_segment_movie_path(version_id)
+        tmp_path = "%s.%s.tmp" % (target_path, uuid.uuid4().hex)
+
+        # the quicktime is deleted once it has been uploaded, so link it rather
+        # than copying it if possible. Rename into place, so that the cut is never
+        # assembled from a partial file.
+        try:
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copyfile(path, tmp_path)
+            os.rename(tmp_path, target_path)
+        except (IOError, OSError), e:
+            if e.errno == errno.ENOENT and not os.path.exists(self._folder):
+                # all cuts have been assembled and none of them needs this quicktime
+                self._app.log_debug("Version %s is not part of a cut review movie." % version_id)
+                return []
+            raise
+
+        if self.__is_final() and str(version_id) not in self.__get_used_version_ids():
+            # the cuts were registered in the meantime
+            self.__remove_file(target_path)
+            return []
+
+        self._app.log_debug("Kept review quicktime for version %s for the cut." % version_id)
+        return self.__claim_completed_cuts()
+
+    def release_cuts(self, names):
+        """
+        Gives up claims on completed cuts without assembling them, so that they are
+        claimed again the next time a segment quicktime is added, for example by the
+        retry of a failed upload job.
+
+        :param names: List of names of cuts, as returned by add_segment_movie()
+        """
+        for name in names:
+            self._app.log_debug("Releasing claim on cut %s." % name)
+            self.__remove_file(os.path.join(self._folder, "%s.claim" % name))
+
+    def get_cut(self, name):
+        """
+        :param name: Name of the cut movie, as passed to add_cut()
+        :returns: Dictionary with keys version_ids, context, entity and comments
+        """
+        fh = open(self.__get_cut_path(name), "rt")
+        try:
+            return json.load(fh)
+        finally:
+            fh.close()
+
+    def assemble(self, name):
+        """
+        Joins the review quicktimes for the versions in a cut into a single movie,
+        without re-encoding them.
+
+        :param name: Name of the cut movie, as passed to add_cut()
+        :returns: Path to the movie
+        """
+        ffmpeg_executable = self._app.execute_hook_method("settings_hook", "get_external_ffmpeg_location")
+        if ffmpeg_executable is None:
+            # the ffmpeg that comes with Flame predates the concat demuxer
+            raise TankError("Cut review movies require an external ffmpeg. Please configure one "
+                            "via the get_external_ffmpeg_location method in the settings hook.")
+
+        list_path = os.path.join(self._folder, "%s.txt" % name)
+        fh = open(list_path, "wt")
+        try:
+            for version_id in self.get_cut(name)["version_ids"]:
+                # quote the path as per the concat demuxer syntax
+                segment_path = self.__get_segment_movie_path(version_id).replace("'", "'\\''")
+                fh.write("file '%s'\n" % segment_path)
+        finally:
+            fh.close()
+
+        movie_path = os.path.join(self._folder, "%s.mov" % name)
+
+        # ./ffmpeg
+        #  -f concat           <-- read a list of files to join
+        #  -safe 0             <-- allow absolute paths in the list
+        #  -i list.txt         <-- the list of files
+        #  -c copy             <-- copy the streams rather than re-encoding them
+        #  -y                  <-- overwrite existing files
+        #  /output/file.mov    <-- target file
+        full_cmd = "%s -f concat -safe 0 -i \"%s\" -c copy -y \"%s\"" % (ffmpeg_executable, list_path, movie_path)
+
+        self._app.log_debug("Assembling cut review movie: %s" % full_cmd)
+        try:
+            cmd_output = subprocess_check_output(full_cmd, shell=True, stderr=subprocess.STDOUT)
+            self._app.log_debug("Cut review movie successfully created! Command output:\n%s" % cmd_output)
+        except SubprocessCalledProcessError, e:
+            raise TankError("Cut review movie assembly failed!\nError code: %s\nOutput:\n%s" % (e.returncode,
+                                                                                                  e.output))
+        return movie_path
+
+    def clean_up(self, name):
+        """
+        Removes the files for a cut and records that it has been processed. The folder
+        itself is removed once all cuts have been processed.
+
+        :param name: Name of the cut movie, as passed to add_cut()
+        """
+        paths = [self.__get_segment_movie_path(x) for x in self.get_cut(name)["version_ids"]]
+        paths.append(os.path.join(self._folder, "%s.txt" % name))
+        paths.append(os.path.join(self._folder, "%s.mov" % name))
+
+        for path in paths:
+            self.__remove_file(path)
+
+        open(os.path.join(self._folder, "%s.done" % name), "a").close()
+        self.__remove_if_finished()
+
+    def __is_final(self):
+        """
+        :returns: True if all cuts have been registered
+        """
+        return os.path.exists(os.path.join(self._folder, "cuts.final"))
+
+    def __get_cut_names(self):
+        """
+        :returns: List of names of the registered cuts
+        """
+        return [x[:-len(".cut")] for x in os.listdir(self._folder) if x.endswith(".cut")]
+
+    def __get_used_version_ids(self):
+        """
+        :returns: Set of ids, as strings, of the versions which are part of a registered cut
+        """
+        version_ids = set()
+        try:
+            for name in self.__get_cut_names():
+                version_ids.update([str(x) for x in self.get_cut(name)["version_ids"]])
+        except (IOError, OSError):
+            # the folder has been removed
+            pass
+        return version_ids
+
+    def __claim_completed_cuts(self):
+        """
+        Claims the registered cuts for which all segment quicktimes are available.
+        Each cut is only claimed once, no matter how many jobs try to claim it.
+
+        :returns: List of names of the cuts claimed
+        """
+        claimed_cuts = []
+        for name in self.__get_cut_names():
+            version_ids = self.get_cut(name)["version_ids"]
+            if not all(os.path.exists(self.__get_segment_movie_path(x)) for x in version_ids):
+                continue
+            if self.__claim(os.path.join(self._folder, "%s.claim" % name)):
+                self._app.log_debug("All %s segment quicktimes are available for cut %s." % (len(version_ids), name))
+                claimed_cuts.append(name)
+        return claimed_cuts
+
+    def __remove_if_finished(self):
+        """
+        Removes the folder once all cuts have been registered and processed.
+        """
+        if not self.__is_final():
+            return
+        if not all(os.path.exists(os.path.join(self._folder, "%s.done" % x)) for x in self.__get_cut_names()):
+            return
+        if self.__claim(os.path.join(self._folder, "cuts.remove")):
+            self._app.log_debug("Removing cut folder '%s'." % self._folder)
+            TempSpaceManager(self._app.engine.get_backburner_tmp()).remove(self._folder)
+
+    def __claim(self, path):
+        """
+        Atomically creates a marker file.
+
+        :param path: Path to the marker file
+        :returns: True if the marker was created, False if it already existed
+        """
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+        return True
+
+    def __remove_file(self, path):
+        """
+        Removes a file, if it exists.
+
+        :param path: Path to remove
+        """
+        try:
+            os.remove(path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                self._app.log_warning("Could not remove temporary file '%s': %s" % (path, e))
+
+    def __get_cut_path(self, name):
+        """
+        :returns: path to the file describing a cut
+        """
+        return os.path.join(self._folder, "%s.cut" % name)
+
+    def __get_segment_movie_path(self, version_id):
+        """
+        :returns: path to the kept review quicktime for a version
+        """
+        return os.path.join(self._folder, "version_%s.mov" % version_id)
@@ -0,0 +1,120 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+import errno
+import fcntl
+import tempfile
+import multiprocessing
+
+import sgtk
+
+class EncodeSlots(object):
+    """
+    Node-local semaphore which caps the number of concurrent ffmpeg encodes.
+
+    Encodes may run in separate backburner jobs, in separate worker threads or in the
+    worker daemon, so the semaphore is implemented with a fixed number of slot files
+    in the local temp folder. An encode holds an exclusive lock on one of the slot
+    files while it runs. Locks are released by the operating system if a process
+    dies, so a crashed job never leaves a slot blocked.
+
+    The cap is passed to the settings hook, so that the ffmpeg thread count can be
+    chosen to make the encodes add up to the number of cores on the node when all
+    slots are busy.
+    """
+
+    def __init__(self, max_encodes):
+        """
+        Constructor
+
+        :param max_encodes: Maximum number of concurrent encodes on this node.
+                            If 0, one encode per two cores is allowed.
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._cpu_count = multiprocessing.cpu_count()
+
+        if max_encodes > 0:
+            self._max_encodes = max_encodes
+        else:
+            self._max_encodes = max(1, self._cpu_count / 2)
+
+        self._folder = os.path.join(tempfile.gettempdir(), "tk_flame_export_encode_slots_%s" % os.getuid())
+        if not os.path.exists(self._folder):
+            try:
+                os.makedirs(self._folder)
+            except OSError, e:
+                # another job may have created it in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+
+        # file handle for the slot we are holding
+        self._slot_handle = None
+
+    @property
+    def cpu_count(self):
+        """
+        The number of cores on this node
+        """
+        return self._cpu_count
+
+    @property
+    def max_encodes(self):
+        """
+        The maximum number of concurrent encodes on this node
+        """
+        return self._max_encodes
+
+    def acquire(self, poll_interval=1.0):
+        """
+        Waits for a free encode slot and claims it.
+
+        :param poll_interval: Number of seconds to wait between attempts
+        """
+        waiting = False
+        while True:
+            for idx in range(self._max_encodes):
+                fh = self.__try_lock(idx)
+                if fh:
+                    self._slot_handle = fh
+                    self._app.log_debug("Acquired encode slot %s of %s." % (idx + 1, self._max_encodes))
+                    return
+            if not waiting:
+                self._app.log_debug("All %s encode slots on this node are busy. "
+                                    "Waiting for a free slot..." % self._max_encodes)
+                waiting = True
+            time.sleep(poll_interval)
+
+    def release(self):
+        """
+        Releases the slot claimed by acquire().
+        """
+        if self._slot_handle:
+            fcntl.flock(self._slot_handle, fcntl.LOCK_UN)
+            self._slot_handle.close()
+            self._slot_handle = None
+
+    def __try_lock(self, idx):
+        """
+        Attempts to lock a slot file without blocking.
+
+        :param idx: Index of slot
+        :returns: Open file handle holding the lock, None if the slot is busy.
+        """
+        fh = open(os.path.join(self._folder, "slot_%d.lock" % idx), "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, e:
+            fh.close()
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return None
+        return fh
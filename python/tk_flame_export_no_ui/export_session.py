@@ -0,0 +1,111 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+
+from sgtk import TankError
+
+class ExportSession(object):
+    """
+    Simple value wrapper class which holds the state of a single Flame export session.
+    
+    As the exporter steps through its various callbacks, this data structure
+    is populated and used to pass information down between methods.
+    """
+    
+    __slots__ = ["session_id", 
+                 "shots", 
+                 "export_preset", 
+                 "user_comments", 
+                 "reached_post_asset_phase",
+                 "cut_review",
+                 "scheduler",
+                 "num_scheduled_shots",
+                 "scheduler_lock",
+                 "submit_timer"]
+    
+    def __init__(self, session_id):
+        """
+        Constructor
+        
+        :param session_id: String which identifies the Flame export session
+        """
+        self.session_id = session_id
+        
+        self.shots = {}                         # shot metadata, keyed by sequence name and shot name
+        self.export_preset = None               # ExportPreset object selected by the user
+        self.user_comments = ""                 # comments entered by the user
+        self.reached_post_asset_phase = False   # flag to indicate that something was actually 
+                                                # submitted by the export process
+        self.cut_review = None                  # CutReviewMovie collecting review quicktimes for
+                                                # the cut, None if no cut movie is generated
+        self.scheduler = None                   # JobScheduler holding work which hasn't been
+                                                # handed to backburner yet
+        self.num_scheduled_shots = 0            # number of shots with work in the scheduler
+        self.scheduler_lock = threading.Lock()  # serializes access to the scheduler between
+                                                # the export hooks and the submit timer
+        self.submit_timer = None                # timer submitting held back work, see 
+                                                # incremental_submission_window
+
+
+class ExportSessionRegistry(object):
+    """
+    Keeps track of all the export sessions currently running in Flame, keyed by 
+    the session id that Flame passes to each of its export hooks. This makes it 
+    possible for several export sessions to overlap without affecting each other.
+    """
+    
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._sessions = {}
+    
+    def start_session(self, session_id):
+        """
+        Creates a new session. If a session with the same id already exists, 
+        for example because a previous export was aborted, it is replaced.
+        
+        :param session_id: String which identifies the Flame export session
+        :returns: ExportSession object
+        """
+        session = ExportSession(session_id)
+        self._sessions[session_id] = session
+        return session
+    
+    def get_session(self, session_id):
+        """
+        Returns the session for a given session id.
+        
+        :param session_id: String which identifies the Flame export session
+        :raises: TankError if the session is not known
+        :returns: ExportSession object
+        """
+        if session_id not in self._sessions:
+            raise TankError("Cannot find export session '%s'!" % session_id)
+        return self._sessions[session_id]
+    
+    def has_session(self, session_id):
+        """
+        Checks if a session exists.
+        
+        :param session_id: String which identifies the Flame export session
+        :returns: True if the session exists, False if not
+        """
+        return session_id in self._sessions
+    
+    def end_session(self, session_id):
+        """
+        Removes a session from the registry and returns it.
+        
+        :param session_id: String which identifies the Flame export session
+        :returns: ExportSession object or None if the session is not known
+        """
+        return self._sessions.pop(session_id, None)
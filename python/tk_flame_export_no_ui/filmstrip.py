@@ -0,0 +1,128 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import subprocess
+
+import sgtk
+from sgtk import TankError
+
+class FilmstripBuilder(object):
+    """
+    Builds a filmstrip thumbnail from the raw RGB frames streamed into a transcode.
+
+    Shotgun uses filmstrip thumbnails for hover scrubbing. A filmstrip is a single
+    image with a number of frames tiled horizontally, each frame FRAME_WIDTH pixels
+    wide. Every Nth frame of the stream is scaled down and kept as a tile, so the
+    filmstrip comes for free with the quicktime rather than requiring another read
+    of the media.
+
+    If the number of frames in the stream isn't known up front, or turns out to be
+    larger than expected, every other tile is dropped whenever the filmstrip is full
+    and the sampling interval is doubled, so the tiles are always spread evenly
+    across the frames seen so far.
+    """
+
+    # width in pixels of each frame in the filmstrip, as expected by Shotgun
+    FRAME_WIDTH = 240
+
+    def __init__(self, width, height, max_tiles, num_frames=None):
+        """
+        Constructor
+
+        :param width: Width in pixels of the frames in the stream
+        :param height: Height in pixels of the frames in the stream
+        :param max_tiles: Maximum number of frames in the filmstrip
+        :param num_frames: Number of frames in the stream, None if not known
+        """
+        self._app = sgtk.platform.current_bundle()
+
+        self._max_tiles = max(1, max_tiles)
+        self._tiles = []
+
+        # pick an interval which spreads the tiles across the whole stream
+        self._interval = 1
+        if num_frames:
+            self._interval = max(1, (num_frames + self._max_tiles - 1) / self._max_tiles)
+
+        self._width = width
+        self._height = height
+        self._tile_width = min(self.FRAME_WIDTH, width)
+        self._tile_height = max(1, int(round(float(height) * self._tile_width / width)))
+
+        # nearest neighbour lookup tables from tile pixels to source pixels. The
+        # rows are byte offsets into the frame, the columns byte offsets into a row.
+        self._row_offsets = [(y * height / self._tile_height) * width * 3 for y in range(self._tile_height)]
+        self._column_offsets = [(x * width / self._tile_width) * 3 for x in range(self._tile_width)]
+
+    @property
+    def frame_size(self):
+        """
+        The size in bytes of a frame in the stream
+        """
+        return self._width * self._height * 3
+
+    def add_frame(self, frame_idx, frame_data):
+        """
+        Passes a frame from the stream to the builder. Only every Nth frame is kept.
+
+        :param frame_idx: Zero based index of the frame in the stream
+        :param frame_data: Raw rgb24 data for the frame
+        """
+        if frame_idx % self._interval != 0:
+            return
+
+        if len(self._tiles) == self._max_tiles:
+            # full - keep every other tile and sample half as often
+            self._tiles = self._tiles[::2]
+            self._interval *= 2
+            if frame_idx % self._interval != 0:
+                return
+
+        rows = []
+        for row_offset in self._row_offsets:
+            row = frame_data[row_offset:row_offset + self._width * 3]
+            rows.append("".join([row[x:x + 3] for x in self._column_offsets]))
+        self._tiles.append(rows)
+
+    def save(self, path, ffmpeg_executable):
+        """
+        Writes the filmstrip to disk as a jpeg.
+
+        :param path: Path to the jpeg to write
+        :param ffmpeg_executable: Path to the ffmpeg executable used to encode the jpeg
+        :returns: True if the filmstrip was written, False if no frames were added
+        """
+        if len(self._tiles) == 0:
+            return False
+
+        # lay the tiles out next to each other, row by row
+        image_data = "".join(["".join([tile[y] for tile in self._tiles]) for y in range(self._tile_height)])
+
+        # ./ffmpeg
+        #  -f rawvideo -pix_fmt rgb24 -s 2400x134 -i -   <-- raw image on stdin, see ShotgunSubmitter
+        #  -vframes 1                                    <-- a single image
+        #  -qscale 2                                     <-- high quality jpeg
+        #  -y /output/file.jpg                           <-- target file
+        full_cmd = "%s -f rawvideo -pix_fmt rgb24 -s %sx%s -i - -vframes 1 -qscale 2 -y \"%s\"" % (ffmpeg_executable,
+                                                                                                 self._tile_width * len(self._tiles),
+                                                                                                 self._tile_height,
+                                                                                                 path)
+
+        self._app.log_debug("Encoding filmstrip with %s frames: %s" % (len(self._tiles), full_cmd))
+        process = subprocess.Popen(full_cmd,
+                                   shell=True,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        cmd_output = process.communicate(image_data)[0]
+        if process.returncode != 0:
+            raise TankError("Filmstrip encode failed!\nError code: %s\nOutput:\n%s" % (process.returncode,
+                                                                                      cmd_output))
+        return True
@@ -0,0 +1,269 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+
+from .session_manifest import SessionManifest
+
+class JobScheduler(object):
+    """
+    Helper class which collects backburner work for an export and submits it 
+    as a dependency graph. 
+    
+    Each piece of work declares the backburner job it depends on (typically
+    the background job which renders the media it operates on), and work which 
+    can be processed in bulk is grouped into a single backburner job per 
+    dependency. This way, processing for a segment can start as soon as the 
+    render for that particular segment has completed, rather than after the 
+    last render of the export.
+    
+    Work can also be pooled: pooled work items which share a dependency are 
+    written to a work manifest which is processed by a small number of worker 
+    jobs, rather than by one backburner job per item.
+    
+    The data needed by the jobs is written to a single SessionManifest which is 
+    saved to disk right before the jobs are submitted. Rather than carrying a full 
+    copy of their data, job arguments should refer to records in the manifest.
+    Each job reports back to the manifest once it has completed, and the session 
+    files are removed after the last job, see backburner_run_session_job.
+    
+    Each job belongs to a priority lane. Jobs are handed to backburner lane by lane,
+    so that cheap, latency critical work such as publishes and thumbnails is queued 
+    ahead of review uploads, which in turn are queued ahead of bulk encoding of 
+    high res quicktimes. Workers processing pooled items pick them up in the same order.
+    
+    Queue order alone doesn't stop backburner from running the jobs side by side, so
+    the local media lane is also gated on the review lane: a local media job is made
+    to run after the last review job which waits for the same render. As backburner
+    only supports a single dependency, the review job takes the place of the render
+    in the dependency chain - it depends on the render itself, so the local media
+    job still runs after it. The flip side is that if that review job fails, the
+    local media job doesn't run until the review job has been retried successfully.
+    """
+    
+    # priority lanes, in order of priority
+    LANE_SHOTGUN = 0        # publishes, versions and thumbnails
+    LANE_REVIEW = 1         # quicktimes uploaded to Shotgun for review
+    LANE_LOCAL_MEDIA = 2    # high res quicktimes for local playback
+    
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._app = sgtk.platform.current_bundle()
+        
+        # data shared by all the jobs in the graph
+        self._manifest = SessionManifest.create()
+        
+        # list of jobs to submit, in submission order. Each job is a dictionary
+        # with keys title, description, run_after_job_id, method_name, args and lane
+        self._jobs = []
+        
+        # batched jobs, keyed by (batch_name, run_after_job_id)
+        self._batched_jobs = {}
+        
+        # pooled jobs, keyed by (pool_name, run_after_job_id)
+        self._pooled_jobs = {}
+    
+    @property
+    def manifest(self):
+        """
+        The SessionManifest shared by all the jobs in the graph
+        """
+        return self._manifest
+        
+    def add_job(self, title, description, run_after_job_id, method_name, args, lane=LANE_SHOTGUN):
+        """
+        Adds a single backburner job to the graph.
+        
+        :param title: Title of the backburner job
+        :param description: Description of the backburner job
+        :param run_after_job_id: Id of the backburner job this job depends on, None 
+                                 if it can run straight away.
+        :param method_name: Name of the app method to execute in the job
+        :param args: Dictionary of arguments to pass to the method 
+        :param lane: Priority lane of the job, e.g. JobScheduler.LANE_REVIEW
+        """
+        self._jobs.append({"title": title, 
+                           "description": description, 
+                           "run_after_job_id": run_after_job_id,
+                           "method_name": method_name, 
+                           "args": args,
+                           "lane": lane})
+    
+    def add_batched_task(self, batch_name, title, description, run_after_job_id, method_name, list_arg, item, args=None, lane=LANE_SHOTGUN):
+        """
+        Adds a work item to a batched backburner job. All work items with the same 
+        batch name and dependency are processed by a single backburner job which
+        receives all the items as a list.
+        
+        :param batch_name: Name identifying the kind of batched work
+        :param title: Title of the backburner job
+        :param description: Description of the backburner job
+        :param run_after_job_id: Id of the backburner job this item depends on, None 
+                                 if it can be processed straight away.
+        :param method_name: Name of the app method to execute in the job
+        :param list_arg: Name of the method argument which holds the list of items
+        :param item: Work item to append to the list
+        :param args: Additional arguments to pass to the method
+        :param lane: Priority lane of the job, e.g. JobScheduler.LANE_SHOTGUN
+        """
+        key = (batch_name, run_after_job_id)
+        
+        if key not in self._batched_jobs:
+            job_args = dict(args or {})
+            job_args[list_arg] = []
+            job = {"title": title, 
+                   "description": description, 
+                   "run_after_job_id": run_after_job_id,
+                   "method_name": method_name, 
+                   "args": job_args,
+                   "lane": lane}
+            self._batched_jobs[key] = job
+            self._jobs.append(job)
+        
+        self._batched_jobs[key]["args"][list_arg].append(item)
+        
+    def add_pooled_task(self, pool_name, title, description, run_after_job_id, method_name, args, lane=LANE_SHOTGUN):
+        """
+        Adds a work item to a pool of worker jobs. All work items with the same
+        pool name and dependency are written to a shared work manifest which is 
+        processed by a number of worker jobs, as defined by the media_worker_pool_size
+        setting. Each worker processes several items concurrently, as defined by the 
+        media_worker_concurrency setting.
+        
+        :param pool_name: Name identifying the pool
+        :param title: Title of the worker jobs
+        :param description: Description of the worker jobs
+        :param run_after_job_id: Id of the backburner job this item depends on, None 
+                                 if it can be processed straight away.
+        :param method_name: Name of the app method to process the item with
+        :param args: Dictionary of arguments to pass to the method
+        :param lane: Priority lane of the item. Workers pick up items in lane order, 
+                     and the worker jobs are submitted in the lane of their most
+                     urgent item.
+        """
+        key = (pool_name, run_after_job_id)
+        
+        if key not in self._pooled_jobs:
+            job = {"title": title, 
+                   "description": description, 
+                   "run_after_job_id": run_after_job_id,
+                   "method_name": "backburner_process_media_pool", 
+                   "args": {},
+                   "lane": lane,
+                   "pool_items": []}
+            self._pooled_jobs[key] = job
+            self._jobs.append(job)
+        
+        job = self._pooled_jobs[key]
+        job["lane"] = min(job["lane"], lane)
+        job["pool_items"].append({"method_name": method_name, "args": args, "lane": lane})
+    
+    def submit(self):
+        """
+        Submits all jobs in the graph to backburner.
+        """
+        # expand pooled jobs into worker jobs sharing a manifest
+        pool_size = max(1, self._app.get_setting("media_worker_pool_size"))
+        concurrency = self._app.get_setting("media_worker_concurrency")
+        
+        jobs = []
+        for job in self._jobs:
+            if "pool_items" not in job:
+                jobs.append(job)
+                continue
+                
+            pool_id = self._manifest.add_pool(job["pool_items"])
+            num_workers = min(pool_size, len(job["pool_items"]))
+            for idx in range(num_workers):
+                jobs.append({"title": "%s %d/%d" % (job["title"], idx + 1, num_workers),
+                             "description": job["description"], 
+                             "run_after_job_id": job["run_after_job_id"],
+                             "method_name": job["method_name"], 
+                             "args": {"manifest_path": self._manifest.path, 
+                                      "pool_id": pool_id,
+                                      "concurrency": concurrency},
+                             "lane": job["lane"]})
+        
+        # hand jobs over lane by lane. The sort is stable, so within a lane, 
+        # jobs are submitted in the order they were added.
+        jobs.sort(key=lambda job: job["lane"])
+        
+        if len(jobs) == 0:
+            return
+        
+        # each job reports back when it has completed, so that the session files
+        # can be removed once all of them are done
+        job_ids = [str(idx) for idx in range(len(jobs))]
+        jobs = [self.__wrap_for_session(job, job_id) for (job, job_id) in zip(jobs, job_ids)]
+        self._manifest.set_job_ids(job_ids)
+        
+        # all jobs read from the manifest, so it needs to be on disk before any of them start
+        self._manifest.save()
+        
+        # with a worker daemon, each job hands its work over to a long lived worker process
+        # on the node rather than running it itself. The first job on a node starts the 
+        # daemon, see backburner_invoke.
+        if self._app.get_setting("use_worker_daemon"):
+            jobs = [self.__wrap_for_worker_daemon(job) for job in jobs]
+        
+        self._app.log_debug("Submitting %s backburner jobs..." % len(jobs))
+        
+        # id of the last review job submitted for each render dependency
+        review_job_ids = {}
+        
+        for job in jobs:
+            run_after_job_id = job["run_after_job_id"]
+            if job["lane"] == self.LANE_LOCAL_MEDIA and review_job_ids.get(run_after_job_id) is not None:
+                # don't let the high res encode compete with the review uploads for
+                # the same media. The review job waits for the render, so this job does too.
+                run_after_job_id = review_job_ids[run_after_job_id]
+            
+            job_id = self._app.job_runner.create_local_backburner_job(job["title"], 
+                                                                      job["description"], 
+                                                                      run_after_job_id, 
+                                                                      self._app, 
+                                                                      job["method_name"], 
+                                                                      job["args"])
+            if job["lane"] == self.LANE_REVIEW:
+                review_job_ids[job["run_after_job_id"]] = job_id
+        self._jobs = []
+        self._batched_jobs = {}
+        self._pooled_jobs = {}
+        self._manifest = SessionManifest.create()
+        
+    def __wrap_for_session(self, job, job_id):
+        """
+        Converts a job so that it reports back to the session manifest once it has completed.
+        
+        :param job: Job dictionary
+        :param job_id: Id of the job in the session
+        :returns: Job dictionary which runs the original job via backburner_run_session_job
+        """
+        wrapped_job = dict(job)
+        wrapped_job["method_name"] = "backburner_run_session_job"
+        wrapped_job["args"] = {"manifest_path": self._manifest.path,
+                               "job_id": job_id,
+                               "method_name": job["method_name"], 
+                               "args": job["args"]}
+        return wrapped_job
+        
+    def __wrap_for_worker_daemon(self, job):
+        """
+        Converts a job so that it is executed via the worker daemon, if one is running.
+        
+        :param job: Job dictionary
+        :returns: Job dictionary which runs the original job via backburner_invoke
+        """
+        wrapped_job = dict(job)
+        wrapped_job["method_name"] = "backburner_invoke"
+        wrapped_job["args"] = {"method_name": job["method_name"], "args": job["args"]}
+        return wrapped_job
@@ -0,0 +1,250 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import time
+import threading
+import multiprocessing
+import traceback
+
+import sgtk
+
+class LocalJobRunner(object):
+    """
+    Stand-in for backburner which runs app callbacks in a pool of local processes.
+
+    The runner has the same create_local_backburner_job() method as the engine, so it
+    can be used wherever jobs are normally handed to backburner. This allows small
+    exports to be processed straight away on the workstation, and the media pipeline
+    to be exercised on a machine without backburner.
+
+    Dependencies are honored for jobs created by the runner itself: a job whose
+    run_after_job_id is the id of a local job starts once that job has completed
+    successfully, and is skipped if it failed. Jobs which depend on a backburner job,
+    for example a Flame background render, are handed to backburner as usual.
+
+    The pool only reports jobs which returned, so jobs which never do - because their
+    arguments could not be sent to the pool, or because the process running them died -
+    are detected when the runner is closed: failed results are treated as job failures,
+    and jobs still running after the job timeout are abandoned. Either way the dependents
+    of such a job are skipped, so that closing the runner never waits forever.
+    """
+
+    def __init__(self, num_processes, job_timeout):
+        """
+        Constructor
+
+        :param num_processes: Number of worker processes. If 0, one process per core is used.
+        :param job_timeout: Number of seconds after which a running job is considered lost.
+                            If 0, jobs are waited for indefinitely.
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._num_processes = num_processes or multiprocessing.cpu_count()
+        self._job_timeout = job_timeout
+        self._pool = None
+
+        self._lock = threading.Lock()
+        self._next_job_id = 0
+        # local jobs which have not completed yet, keyed by job id.
+        # Each job is a dictionary with keys title, method_name, args and dependents.
+        # Once started, it also holds the pool's AsyncResult and the start time.
+        self._pending_jobs = {}
+        # completion status of finished local jobs, keyed by job id
+        self._completed_jobs = {}
+
+    def create_local_backburner_job(self, title, desc, run_after_job_id, instance, method_name, args):
+        """
+        Runs an app callback in the local process pool. Same signature as the engine's
+        create_local_backburner_job.
+
+        :param title: Title of the job
+        :param desc: Description of the job
+        :param run_after_job_id: Id of the job this job depends on, None if it can run
+                                 straight away.
+        :param instance: App instance to run the callback on. Must be this app.
+        :param method_name: Name of the app method to execute
+        :param args: Dictionary of arguments to pass to the method
+        :returns: Id of the local job, or the result of the engine call if the job
+                  was handed to backburner.
+        """
+        if run_after_job_id is not None and not self.is_local_job(run_after_job_id):
+            # depends on work outside of our control. Let backburner take care of it.
+            self._app.log_debug("Job '%s' depends on backburner job %s. "
+                                "Submitting to backburner." % (title, run_after_job_id))
+            return self._app.engine.create_local_backburner_job(title, desc, run_after_job_id,
+                                                                instance, method_name, args)
+
+        self._lock.acquire()
+        try:
+            job_id = "local_%d" % self._next_job_id
+            self._next_job_id += 1
+            job = {"title": title, "method_name": method_name, "args": args, "dependents": []}
+
+            if run_after_job_id in self._pending_jobs:
+                # start this once the job it depends on has completed
+                self._pending_jobs[job_id] = job
+                self._pending_jobs[run_after_job_id]["dependents"].append(job_id)
+                return job_id
+
+            if run_after_job_id is not None and not self._completed_jobs.get(run_after_job_id):
+                self._app.log_warning("Skipping local job '%s' - the job it depends on failed." % title)
+                self._completed_jobs[job_id] = False
+                return job_id
+
+            self._pending_jobs[job_id] = job
+        finally:
+            self._lock.release()
+
+        self.__start(job_id, job)
+        return job_id
+
+    def is_local_job(self, job_id):
+        """
+        :param job_id: Job id
+        :returns: True if the job was created by this runner
+        """
+        return isinstance(job_id, basestring) and job_id.startswith("local_")
+
+    def close(self):
+        """
+        Waits for all local jobs to complete and shuts down the worker processes.
+        """
+        if self._pool is None:
+            return
+
+        # dependent jobs are started from completion callbacks, so wait until the
+        # whole graph has been processed before closing the pool. The callback is
+        # only called for jobs which returned, so check on the running jobs as we
+        # go, to fail the ones which never will.
+        abandoned_jobs = False
+        while True:
+            self._lock.acquire()
+            try:
+                num_pending = len(self._pending_jobs)
+                running_jobs = [(x, y) for (x, y) in self._pending_jobs.items() if "result" in y]
+            finally:
+                self._lock.release()
+            if num_pending == 0:
+                break
+
+            for (job_id, job) in running_jobs:
+                if job["result"].ready():
+                    if not job["result"].successful():
+                        # the job never ran, for example because its arguments could not
+                        # be pickled. The callback is not called for these.
+                        try:
+                            job["result"].get()
+                        except Exception, e:
+                            self.__on_complete(job_id, "Could not run job: %s" % e)
+                elif self._job_timeout and time.time() - job["start_time"] > self._job_timeout:
+                    # the process running the job may have died, in which case the
+                    # pool silently replaces it and the job never completes.
+                    self.__on_complete(job_id, "Job did not complete within %s seconds. "
+                                               "Abandoning it." % self._job_timeout)
+                    abandoned_jobs = True
+
+            self._app.log_debug("Waiting for %s local jobs to complete..." % num_pending)
+            threading.Event().wait(1.0)
+
+        if abandoned_jobs:
+            # abandoned jobs may still be occupying processes, so don't wait for them
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def __start(self, job_id, job):
+        """
+        Hands a job to the process pool.
+
+        :param job_id: Id of job
+        :param job: Job dictionary
+        """
+        if self._pool is None:
+            self._app.log_debug("Starting local job runner with %s processes." % self._num_processes)
+            self._pool = multiprocessing.Pool(self._num_processes, _init_process)
+
+        self._app.log_debug("Starting local job %s: %s" % (job_id, job["title"]))
+        job["start_time"] = time.time()
+        job["result"] = self._pool.apply_async(_run_job,
+                                               (job["method_name"], job["args"]),
+                                               callback=lambda result: self.__on_complete(job_id, result))
+
+    def __on_complete(self, job_id, result):
+        """
+        Called from the pool's result thread when a job has completed, or from close()
+        when a job has failed without the pool reporting it.
+
+        :param job_id: Id of job
+        :param result: None on success, a formatted traceback on failure
+        """
+        self._lock.acquire()
+        try:
+            if job_id not in self._pending_jobs:
+                # already completed, for example a job which returned just as
+                # close() abandoned it
+                return
+            job = self._pending_jobs.pop(job_id)
+            self._completed_jobs[job_id] = result is None
+            dependents = [(x, self._pending_jobs[x]) for x in job["dependents"]]
+        finally:
+            self._lock.release()
+
+        if result is None:
+            self._app.log_debug("Local job %s completed: %s" % (job_id, job["title"]))
+            for (dependent_id, dependent) in dependents:
+                self.__start(dependent_id, dependent)
+        else:
+            self._app.log_error("Local job %s (%s) failed:\n%s" % (job_id, job["title"], result))
+            for (dependent_id, dependent) in dependents:
+                self.__skip(dependent_id)
+
+    def __skip(self, job_id):
+        """
+        Skips a job because the job it depends on failed, along with all jobs depending on it.
+
+        :param job_id: Id of job
+        """
+        self._lock.acquire()
+        try:
+            job = self._pending_jobs.pop(job_id)
+            self._completed_jobs[job_id] = False
+        finally:
+            self._lock.release()
+
+        self._app.log_warning("Skipping local job '%s' - the job it depends on failed." % job["title"])
+        for dependent_id in job["dependents"]:
+            self.__skip(dependent_id)
+
+
+def _init_process():
+    """
+    Initializes a pool process. The process is forked from the process which created
+    the pool, so it shares the Shotgun connection with it. Drop the inherited 
+    connection so that the process opens its own the first time it talks to Shotgun.
+    """
+    app = sgtk.platform.current_bundle()
+    if hasattr(app.shotgun, "close"):
+        app.shotgun.close()
+
+def _run_job(method_name, args):
+    """
+    Executes an app callback in a pool process.
+
+    :param method_name: Name of the app method to execute
+    :param args: Dictionary of arguments to pass to the method
+    :returns: None on success, a formatted traceback on failure.
+    """
+    app = sgtk.platform.current_bundle()
+    try:
+        getattr(app, method_name)(**args)
+    except Exception:
+        return traceback.format_exc()
+    return None
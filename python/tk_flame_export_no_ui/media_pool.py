@@ -0,0 +1,421 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+import uuid
+import errno
+import shutil
+import socket
+import threading
+
+import sgtk
+from sgtk import TankError
+
+from .session_manifest import SessionManifest
+
+class WorkManifest(object):
+    """
+    A list of work items stored in a session manifest on disk and shared between a 
+    pool of backburner worker jobs. Each item is a dictionary with keys id, method_name,
+    args and lane, where method_name is the name of the app method that should process 
+    the item, args are the arguments to pass to it and lane is its JobScheduler priority
+    lane. Items are claimed in lane order.
+
+    Workers claim items by atomically creating a claim file for the item, which
+    means that several workers, running in the same or in different processes,
+    can pull items from the same manifest without processing an item twice.
+
+    Items which fail are released, but not claimed again by the same job, so that 
+    a retry of the job picks them up. Once all items have been processed, the claim
+    files are replaced by a single marker file for the pool.
+
+    Workers renew their claims while they are processing the items, see renew(). A
+    claim which hasn't been renewed for CLAIM_EXPIRY seconds, or which was made by a
+    process on this host which is no longer running, is taken over by the next worker.
+    """
+
+    # number of seconds after which a claim that hasn't been renewed is taken over
+    CLAIM_EXPIRY = 600
+
+    # number of seconds between renewals of the claims held by a worker
+    CLAIM_RENEW_INTERVAL = 60
+
+    def __init__(self, manifest_path, pool_id):
+        """
+        Constructor
+
+        :param manifest_path: Path to a SessionManifest file
+        :param pool_id: Id of the pool in the session manifest
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._path = manifest_path
+
+        session_manifest = SessionManifest.load(manifest_path)
+        self._items = []
+        for (idx, item) in enumerate(session_manifest.get_pool(pool_id)):
+            self._items.append({"id": idx,
+                                "method_name": item["method_name"],
+                                "args": item["args"],
+                                "lane": item.get("lane", 0)})
+        # the sort is stable, so items within a lane keep their submission order
+        self._items.sort(key=lambda item: item["lane"])
+
+        # ids of the items which failed in this job
+        self._failed_items = set()
+
+        self._claim_folder = os.path.join("%s.claims" % os.path.splitext(manifest_path)[0], pool_id)
+        self._complete_path = "%s.complete" % self._claim_folder
+        if os.path.exists(self._complete_path):
+            self._app.log_debug("All items in pool %s of '%s' have already been processed." % (pool_id, manifest_path))
+            self._items = []
+        elif not os.path.exists(self._claim_folder):
+            try:
+                os.makedirs(self._claim_folder)
+            except OSError, e:
+                # another worker may have created it in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @property
+    def path(self):
+        """
+        The path to the manifest file
+        """
+        return self._path
+
+    def get_items(self):
+        """
+        :returns: List of all items in the manifest
+        """
+        return self._items
+
+    def claim_next(self):
+        """
+        Claims the next unprocessed item in the manifest.
+
+        :returns: Item dictionary or None if there are no more items to claim
+        """
+        for item in self._items:
+            if item["id"] in self._failed_items:
+                continue
+            if self.claim(item["id"]):
+                return item
+        return None
+
+    def claim(self, item_id):
+        """
+        Attempts to claim an item. Items with stale claims are taken over.
+
+        :param item_id: Id of the item to claim
+        :returns: True if the item was claimed, False if it is done or
+                  claimed by another worker.
+        """
+        if os.path.exists(self.__get_done_path(item_id)):
+            return False
+
+        claim_path = self.__get_claim_path(item_id)
+
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                # the pool has been completed and cleaned up by another worker
+                return False
+            if e.errno != errno.EEXIST:
+                raise
+            if not self.__take_over_stale_claim(claim_path):
+                return False
+            # the worker which claimed this item has died - take it over
+            self._app.log_debug("Reclaiming stale work item %s in '%s'." % (item_id, self._path))
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError, e:
+                if e.errno not in (errno.EEXIST, errno.ENOENT):
+                    raise
+                # another worker claimed it in the meantime
+                return False
+
+        try:
+            os.write(fd, "%s %s" % (socket.gethostname(), os.getpid()))
+        finally:
+            os.close(fd)
+        return True
+
+    def renew(self, item_id):
+        """
+        Renews the claim for an item which is being processed, so that it
+        doesn't expire.
+
+        :param item_id: Id of the item
+        """
+        try:
+            os.utime(self.__get_claim_path(item_id), None)
+        except OSError:
+            pass
+
+    def release(self, item_id):
+        """
+        Releases a claimed item so that another worker can process it.
+
+        :param item_id: Id of the item to release
+        """
+        try:
+            os.remove(self.__get_claim_path(item_id))
+        except OSError:
+            pass
+
+    def mark_done(self, item_id):
+        """
+        Marks an item as successfully processed.
+
+        :param item_id: Id of the item
+        """
+        fh = open(self.__get_done_path(item_id), "wt")
+        fh.close()
+
+    def mark_failed(self, item_id):
+        """
+        Releases an item which failed to process. The item won't be claimed again 
+        by this job, but a retry of the job will pick it up.
+
+        :param item_id: Id of the item
+        """
+        self._failed_items.add(item_id)
+        self.release(item_id)
+
+    def is_complete(self):
+        """
+        :returns: True if all items in the pool have been processed successfully
+        """
+        if os.path.exists(self._complete_path):
+            return True
+        return all(os.path.exists(self.__get_done_path(item["id"])) for item in self._items)
+
+    def clean_up(self):
+        """
+        Replaces the claim files of a completed pool with a single marker file,
+        so that workers starting later know that there is nothing left to do.
+        """
+        if not os.path.exists(self._complete_path):
+            fh = open(self._complete_path, "wt")
+            fh.close()
+        if os.path.exists(self._claim_folder):
+            shutil.rmtree(self._claim_folder, ignore_errors=True)
+            self._app.log_debug("Removed claim files for '%s'." % self._claim_folder)
+
+    def __get_claim_path(self, item_id):
+        """
+        :returns: path to the claim file for an item
+        """
+        return os.path.join(self._claim_folder, "%s.claim" % item_id)
+
+    def __get_done_path(self, item_id):
+        """
+        :returns: path to the completion marker file for an item
+        """
+        return os.path.join(self._claim_folder, "%s.done" % item_id)
+
+    def __take_over_stale_claim(self, claim_path):
+        """
+        Removes a stale claim. The claim is moved out of the way by renaming it first, so
+        that of several workers which find the same stale claim, only one takes it over.
+
+        :param claim_path: Path to claim file
+        :returns: True if the stale claim was removed by this worker
+        """
+        try:
+            stat = os.stat(claim_path)
+        except OSError:
+            # released in the meantime - leave it to the next attempt
+            return False
+        if not self.__is_stale_claim(claim_path, stat):
+            return False
+
+        taken_path = "%s.%s.stale" % (claim_path, uuid.uuid4().hex)
+        try:
+            os.rename(claim_path, taken_path)
+        except OSError:
+            # another worker got there first
+            return False
+
+        try:
+            taken_stat = os.stat(taken_path)
+            if (taken_stat.st_ino, taken_stat.st_mtime) != (stat.st_ino, stat.st_mtime):
+                # another worker took over the stale claim and made a fresh one, which
+                # is what we have just moved. Put it back unless it has been replaced.
+                try:
+                    os.link(taken_path, claim_path)
+                except OSError:
+                    pass
+                return False
+        finally:
+            try:
+                os.remove(taken_path)
+            except OSError:
+                pass
+        return True
+
+    def __is_stale_claim(self, claim_path, stat):
+        """
+        Checks if a claim has expired, or was made by a process on this host which is 
+        no longer running.
+
+        :param claim_path: Path to claim file
+        :param stat: os.stat() result for the claim file
+        :returns: True if the claim is stale, False otherwise
+        """
+        if time.time() - stat.st_mtime > self.CLAIM_EXPIRY:
+            # not renewed in time, e.g. the worker died half way through writing the
+            # claim, or it is running on a host we can't check.
+            return True
+
+        try:
+            fh = open(claim_path, "rt")
+            try:
+                (host, pid) = fh.read().split()
+            finally:
+                fh.close()
+        except Exception:
+            # being written or unreadable - wait for it to expire
+            return False
+
+        if host != socket.gethostname():
+            return False
+
+        return not is_process_running(int(pid))
+
+
+class MediaWorkerPool(object):
+    """
+    Processes the items of a WorkManifest using a number of concurrent worker threads.
+
+    This is used to process media for many segments inside a single backburner job,
+    so that toolkit and the engine only need to be started once for all the
+    items, rather than once per item.
+    """
+
+    def __init__(self, manifest, concurrency):
+        """
+        Constructor
+
+        :param manifest: WorkManifest object to pull items from
+        :param concurrency: Number of items to process concurrently
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._manifest = manifest
+        self._concurrency = max(1, concurrency)
+        self._errors = []
+        self._lock = threading.Lock()
+
+        # ids of the items currently being processed, whose claims need renewing
+        self._active_items = set()
+        self._finished = threading.Event()
+
+    def run(self):
+        """
+        Processes items until there are no more items to claim in the manifest.
+        Items are processed by calling the app method given by the item's method name.
+
+        :raises: TankError if any of the items failed
+        """
+        self._app.log_debug("Processing work manifest '%s' with %s threads..." % (self._manifest.path,
+                                                                                  self._concurrency))
+
+        renew_thread = threading.Thread(target=self.__renew_claims)
+        renew_thread.daemon = True
+        renew_thread.start()
+
+        threads = []
+        for idx in range(self._concurrency):
+            thread = threading.Thread(target=self.__worker)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        self._finished.set()
+        renew_thread.join()
+
+        if self._manifest.is_complete():
+            self._manifest.clean_up()
+
+        if self._errors:
+            raise TankError("%s work items failed to process:\n%s" % (len(self._errors),
+                                                                     "\n".join(self._errors)))
+
+        self._app.log_debug("Work manifest '%s' processed." % self._manifest.path)
+
+    def __worker(self):
+        """
+        Worker thread main loop.
+        """
+        while True:
+            item = self._manifest.claim_next()
+            if item is None:
+                break
+
+            self._app.log_debug("Processing work item %s: %s" % (item["id"], item["method_name"]))
+            self._lock.acquire()
+            try:
+                self._active_items.add(item["id"])
+            finally:
+                self._lock.release()
+            try:
+                method = getattr(self._app, item["method_name"])
+                # json gives us unicode keys, so convert them before passing them as keyword args
+                kwargs = dict((str(k), v) for (k, v) in item["args"].iteritems())
+                method(**kwargs)
+            except Exception, e:
+                self._app.log_exception("Work item %s failed." % item["id"])
+                # put it back so that a retry of the job picks it up
+                self._manifest.mark_failed(item["id"])
+                self._lock.acquire()
+                try:
+                    self._errors.append("Item %s (%s): %s" % (item["id"], item["method_name"], e))
+                finally:
+                    self._lock.release()
+            else:
+                self._manifest.mark_done(item["id"])
+            finally:
+                self._lock.acquire()
+                try:
+                    self._active_items.discard(item["id"])
+                finally:
+                    self._lock.release()
+
+    def __renew_claims(self):
+        """
+        Renewal thread main loop. Keeps the claims for the items being processed
+        from expiring until all workers have finished.
+        """
+        while not self._finished.wait(self._manifest.CLAIM_RENEW_INTERVAL):
+            self._lock.acquire()
+            try:
+                item_ids = list(self._active_items)
+            finally:
+                self._lock.release()
+            for item_id in item_ids:
+                self._manifest.renew(item_id)
+
+
+def is_process_running(pid):
+    """
+    Checks if a process with the given id is running on this host.
+
+    :param pid: Process id
+    :returns: True if running, False if not
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
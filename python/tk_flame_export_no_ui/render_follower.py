@@ -0,0 +1,308 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+import time
+import uuid
+import json
+import errno
+import fcntl
+
+import sgtk
+from sgtk import TankError
+
+class RenderFollower(object):
+    """
+    Shared state for a batch render which is being transcoded while Flare is still rendering.
+
+    A follow job is started when the render starts. It tails the rendered frames as they
+    land on disk and feeds them into the encoder, so that the quicktimes are complete
+    shortly after the last frame has been rendered. The job which processes the render
+    once it has finished then picks up the finished quicktimes rather than generating
+    them from scratch.
+
+    The two jobs, and the Flame session, coordinate through a state file in a folder
+    inside the backburner temp location:
+
+    - pending:   the follow job has not started yet
+    - running:   the follow job is transcoding frames
+    - done:      the quicktimes have been generated
+    - failed:    the follow job failed, the quicktimes have to be generated from scratch
+    - cancelled: the render job gave up on the follow job and generated the quicktimes itself
+
+    Flame records the outcome of the render in the same file, so that the follow job
+    knows when the last frame has been written or that the render was aborted.
+
+    The folder is removed by the render job once it has taken the result. If the render
+    was aborted there is no render job, and if the render job has cancelled the follow
+    job it no longer waits for the result, so in these cases the follow job removes the
+    folder itself.
+    """
+
+    # states
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, folder):
+        """
+        Constructor. Use RenderFollower.create() to set up a new follower.
+
+        :param folder: Folder holding the follower state
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._folder = folder
+        self._state_path = os.path.join(folder, "state.json")
+
+    @classmethod
+    def create(cls):
+        """
+        Sets up state for a new follower in the backburner temp location.
+
+        :returns: RenderFollower object
+        """
+        app = sgtk.platform.current_bundle()
+        folder = os.path.join(app.engine.get_backburner_tmp(),
+                              "tk_flame_export_render_follow",
+                              uuid.uuid4().hex)
+        os.makedirs(folder)
+        follower = cls(folder)
+        follower.__update_state({"status": cls.PENDING, "render": None, "frames": 0})
+        return follower
+
+    @property
+    def folder(self):
+        """
+        The folder holding the follower state
+        """
+        return self._folder
+
+    def set_render_finished(self, aborted):
+        """
+        Records that Flame has finished rendering. Called from the Flame session.
+
+        :param aborted: True if the render was aborted by the user
+        """
+        state = self.__update_state({"render": "aborted" if aborted else "complete"})
+        if aborted and state.get("status") in (self.PENDING, self.FAILED):
+            # there won't be a render job, and the follow job has either stopped 
+            # already or will find the state gone when it starts.
+            self.__clean_up()
+
+    def start(self):
+        """
+        Claims the follower for the follow job.
+
+        :returns: True if the follow job should go ahead, False if the render
+                  job has already taken over or the render was aborted.
+        """
+        try:
+            state = self.__update_state({"status": self.RUNNING},
+                                        only_if_status=self.PENDING)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            # the render job has taken over and cleaned up
+            return False
+
+        if state.get("status") is None:
+            # the render job cleaned up while we were opening the state file
+            self.__clean_up()
+            return False
+
+        if state.get("render") == "aborted":
+            # there is no render job to pick up the result
+            self.__clean_up()
+            return False
+
+        return state["status"] == self.RUNNING
+
+    def follow_frames(self, frame_paths, timeout, poll_interval=1.0):
+        """
+        Generator which yields the frames of a render as they are completed.
+
+        Flare renders frames in order, so a frame is complete once the next frame
+        has appeared on disk, or once Flame reports that the render has finished.
+
+        :param frame_paths: List of paths to all frames of the render, in order
+        :param timeout: Number of seconds to wait for a frame before giving up
+        :param poll_interval: Number of seconds to wait between checks
+        :raises: TankError if the render was aborted, the timeout was reached or
+                 the render job has taken over.
+        """
+        for (idx, frame_path) in enumerate(frame_paths):
+            next_frame_path = frame_paths[idx + 1] if idx + 1 < len(frame_paths) else None
+            waited = 0
+            while True:
+                state = self.__read_state()
+                if state["status"] == self.CANCELLED:
+                    raise TankError("The render job has taken over the transcode.")
+                if state["render"] == "aborted":
+                    raise TankError("The render was aborted.")
+                if os.path.exists(frame_path):
+                    if state["render"] == "complete":
+                        break
+                    if next_frame_path and os.path.exists(next_frame_path):
+                        break
+                if waited >= timeout:
+                    raise TankError("Timed out after %s seconds waiting for frame '%s' "
+                                    "to be rendered." % (timeout, frame_path))
+                time.sleep(poll_interval)
+                waited += poll_interval
+
+            # report progress so that the render job can tell that we are still alive
+            self.__update_state({"frames": idx + 1})
+            yield frame_path
+
+    def finish(self, review_quicktime_path):
+        """
+        Records that the follow job has generated the quicktimes.
+
+        :param review_quicktime_path: Path to the review quicktime, None if no
+                                      review quicktime was generated.
+        :returns: True if the result was recorded, False if the render job
+                  has taken over in the meantime.
+        """
+        state = self.__update_state({"status": self.DONE, "review_quicktime": review_quicktime_path},
+                                    only_if_status=self.RUNNING)
+        if state["status"] != self.DONE:
+            # the render job no longer waits for us
+            self.__clean_up()
+            return False
+        return True
+
+    def fail(self):
+        """
+        Records that the follow job has failed. If the render job has cancelled
+        the follow job or the render was aborted, nobody is waiting for the
+        result and the follower state is removed instead.
+        """
+        state = self.__update_state({"status": self.FAILED}, only_if_status=self.RUNNING)
+        if state.get("status") == self.CANCELLED or state.get("render") == "aborted":
+            self.__clean_up()
+
+    def take_result(self, timeout, poll_interval=1.0):
+        """
+        Called by the render job once the render has completed. Waits for the
+        follow job to finish and returns its result. If the follow job hasn't
+        started or has stopped making progress, the follower is cancelled and the
+        render job should generate the quicktimes itself.
+
+        :param timeout: Number of seconds without progress before the follow job is cancelled
+        :param poll_interval: Number of seconds to wait between checks
+        :returns: Tuple (done, review_quicktime_path). If done is False, the follow job
+                  did not produce the quicktimes.
+        """
+        last_frames = None
+        waited = 0
+        while True:
+            state = self.__update_state({"status": self.CANCELLED},
+                                        only_if_status=self.PENDING)
+            if state["status"] == self.DONE:
+                self.__clean_up()
+                return (True, state.get("review_quicktime"))
+
+            if state["status"] == self.FAILED:
+                self.__clean_up()
+                return (False, None)
+
+            if state["status"] == self.CANCELLED:
+                self._app.log_debug("The render follow job did not start in time.")
+                self.__clean_up()
+                return (False, None)
+
+            # the follow job is running
+            if state["frames"] != last_frames:
+                last_frames = state["frames"]
+                waited = 0
+            elif waited >= timeout:
+                state = self.__update_state({"status": self.CANCELLED},
+                                            only_if_status=self.RUNNING)
+                if state["status"] == self.CANCELLED:
+                    # leave the state in place so that the follow job can see that it
+                    # has been cancelled.
+                    self._app.log_warning("The render follow job has made no progress for %s seconds. "
+                                          "Cancelling it." % timeout)
+                    return (False, None)
+                # it completed just now
+                continue
+
+            time.sleep(poll_interval)
+            waited += poll_interval
+
+    @staticmethod
+    def get_frame_paths(path, first_frame, last_frame):
+        """
+        Expands a Flame style sequence path into the paths of the individual frames.
+
+        :param path: Path with a [1234-1234] sequence marker
+        :param first_frame: First frame number
+        :param last_frame: Last frame number
+        :returns: List of frame paths, None if the path isn't a sequence path
+        """
+        match = re.search("\[([0-9]+)-[0-9]+\](?=\.[^\.]*$)", path)
+        if match is None:
+            return None
+
+        padding = len(match.group(1))
+        return ["%s%0*d%s" % (path[:match.start()], padding, frame, path[match.end():])
+                for frame in range(int(first_frame), int(last_frame) + 1)]
+
+    def __read_state(self):
+        """
+        :returns: The state dictionary
+        """
+        return self.__update_state({})
+
+    def __update_state(self, values, only_if_status=None):
+        """
+        Updates the state file. The file is locked while it is updated, so that
+        the Flame session and the jobs see consistent state transitions.
+
+        :param values: Dictionary of values to update
+        :param only_if_status: If set, the values are only updated if the
+                               current status is this status.
+        :returns: The state dictionary after the update
+        """
+        fh = open(self._state_path, "a+")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                fh.seek(0)
+                data = fh.read()
+                state = json.loads(data) if data else {}
+
+                if values and (only_if_status is None or state.get("status") == only_if_status):
+                    state.update(values)
+                    fh.seek(0)
+                    fh.truncate()
+                    fh.write(json.dumps(state))
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+        return state
+
+    def __clean_up(self):
+        """
+        Removes the follower state from disk.
+        """
+        try:
+            os.remove(self._state_path)
+            os.rmdir(self._folder)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                self._app.log_warning("Could not remove render follow folder '%s': %s" % (self._folder, e))
@@ -0,0 +1,276 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import json
+
+import sgtk
+from sgtk import TankError
+
+from .temp_space import TempSpaceManager
+from .work_journal import WorkJournal
+
+class SessionManifest(object):
+    """
+    Compact description of all the work submitted to backburner for an export,
+    stored in a single file on disk. Backburner jobs are passed the path to the
+    manifest and the ids of the items they should process, rather than a full
+    copy of the data they need.
+
+    The manifest contains the following tables:
+
+    - settings: values shared by all items, e.g. the export preset name and user comments.
+    - contexts: serialized contexts. Each context is only stored once, no matter
+                how many items refer to it.
+    - segments: render data for each segment (path, resolution, fps, version id etc).
+                This is shared by all the work items for a segment.
+    - items:    work items, e.g. publish requests. Items refer to contexts and
+                segments by id.
+    - pools:    lists of work items processed by a pool of worker jobs, see WorkManifest.
+
+    The manifest is stored in a session folder in the backburner temp location,
+    together with the journals and claims written by the jobs processing it. The
+    jobs of the session report back when they have completed, see mark_job_done(),
+    and the folder is removed once the last of them is done. The folder is covered
+    by a temp space lease, so that it is reclaimed eventually even if some of the
+    jobs never run, e.g. because a render failed.
+    """
+
+    # number of seconds the session folder is kept if its jobs never complete
+    SESSION_LEASE_DURATION = 7 * 24 * 3600
+
+    def __init__(self, path, data):
+        """
+        Constructor. Use SessionManifest.create() or SessionManifest.load() rather than
+        calling this directly.
+
+        :param path: Path to manifest file
+        :param data: Manifest data dictionary
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._path = path
+        self._data = data
+
+        # lookup of serialized context to context id, used to de-duplicate contexts
+        self._context_ids = dict((v, k) for (k, v) in data["contexts"].iteritems())
+        # deserialized contexts, keyed by id
+        self._context_cache = {}
+
+    @classmethod
+    def create(cls):
+        """
+        Creates a new, empty manifest. The manifest isn't written to disk until save() is
+        called, and the session folder isn't allocated until the path is first needed.
+
+        :returns: SessionManifest object
+        """
+        data = {"settings": {}, "contexts": {}, "segments": {}, "items": {}, "pools": {}}
+        return cls(None, data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a manifest from disk.
+
+        :param path: Path to manifest file
+        :returns: SessionManifest object
+        """
+        fh = open(path, "rt")
+        try:
+            data = json.load(fh)
+        finally:
+            fh.close()
+        return cls(path, data)
+
+    @property
+    def path(self):
+        """
+        The path to the manifest file
+        """
+        if self._path is None:
+            temp_space = TempSpaceManager(self._app.engine.get_backburner_tmp())
+            folder = temp_space.allocate_folder("tk_flame_export_session_",
+                                                duration=self.SESSION_LEASE_DURATION,
+                                                shared=True)
+            self._path = os.path.join(folder, "manifest.json")
+        return self._path
+
+    def save(self):
+        """
+        Writes the manifest to disk.
+        """
+        fh = open(self.path, "wt")
+        try:
+            json.dump(self._data, fh, separators=(",", ":"))
+        finally:
+            fh.close()
+        self._app.log_debug("Wrote session manifest '%s' with %s contexts, %s segments "
+                            "and %s items." % (self._path,
+                                               len(self._data["contexts"]),
+                                               len(self._data["segments"]),
+                                               len(self._data["items"])))
+
+    ##########################################################################################
+    # building the manifest
+
+    def set_setting(self, name, value):
+        """
+        Sets a value shared by all items in the manifest.
+
+        :param name: Name of setting
+        :param value: Value to store
+        """
+        self._data["settings"][name] = value
+
+    def add_context(self, context):
+        """
+        Adds a context to the manifest, unless it has already been added.
+
+        :param context: Context object
+        :returns: id of the context
+        """
+        serialized_context = sgtk.context.serialize(context)
+        if serialized_context not in self._context_ids:
+            context_id = str(len(self._data["contexts"]))
+            self._data["contexts"][context_id] = serialized_context
+            self._context_ids[serialized_context] = context_id
+            self._context_cache[context_id] = context
+        return self._context_ids[serialized_context]
+
+    def add_segment(self, segment):
+        """
+        Adds a segment record to the manifest.
+
+        :param segment: Dictionary with segment data
+        :returns: id of the segment
+        """
+        segment_id = str(len(self._data["segments"]))
+        self._data["segments"][segment_id] = segment
+        return segment_id
+
+    def add_item(self, item):
+        """
+        Adds a work item to the manifest.
+
+        :param item: Dictionary with item data
+        :returns: id of the item
+        """
+        item_id = str(len(self._data["items"]))
+        self._data["items"][item_id] = item
+        return item_id
+
+    def add_pool(self, pool_items):
+        """
+        Adds a list of work items to be processed by a pool of workers.
+
+        :param pool_items: List of dictionaries with keys method_name and args
+        :returns: id of the pool
+        """
+        pool_id = str(len(self._data["pools"]))
+        self._data["pools"][pool_id] = pool_items
+        return pool_id
+
+    def set_job_ids(self, job_ids):
+        """
+        Sets the ids of the jobs which process the manifest. The session files are
+        removed once all of these jobs have reported back, see mark_job_done().
+
+        :param job_ids: List of job ids
+        """
+        self.set_setting("job_ids", job_ids)
+
+    ##########################################################################################
+    # reading the manifest
+
+    def get_setting(self, name):
+        """
+        :param name: Name of setting
+        :returns: value for a setting shared by all items
+        """
+        return self._data["settings"].get(name)
+
+    def get_context(self, context_id):
+        """
+        :param context_id: Id of context
+        :returns: Context object
+        """
+        if context_id not in self._context_cache:
+            serialized_context = self._data["contexts"][context_id]
+            self._context_cache[context_id] = sgtk.context.deserialize(serialized_context)
+        return self._context_cache[context_id]
+
+    def get_segment(self, segment_id):
+        """
+        :param segment_id: Id of segment
+        :returns: segment dictionary
+        """
+        return self._data["segments"][segment_id]
+
+    def get_item(self, item_id):
+        """
+        :param item_id: Id of item
+        :raises: TankError if the item doesn't exist
+        :returns: item dictionary
+        """
+        if item_id not in self._data["items"]:
+            raise TankError("Cannot find item %s in manifest '%s'!" % (item_id, self._path))
+        return self._data["items"][item_id]
+
+    def get_pool(self, pool_id):
+        """
+        :param pool_id: Id of pool
+        :returns: List of dictionaries with keys method_name and args
+        """
+        return self._data["pools"][pool_id]
+
+    ##########################################################################################
+    # cleaning up
+
+    def mark_job_done(self, job_id, failed=False):
+        """
+        Records that a job processing the manifest has finished. If this was the
+        last job of the session, the session folder is removed, together with all
+        the journals and claims in it.
+
+        Failed jobs report back as well, so that the files of a session are removed
+        as soon as its last job has exited, rather than when the lease expires.
+
+        :param job_id: Id of the job, see set_job_ids()
+        :param failed: True if the job failed
+        """
+        if not os.path.exists(self.path):
+            # the session has already been cleaned up
+            return
+
+        # hold the lock on the jobs journal while checking for the last job, so
+        # that two jobs finishing at the same time can't both remove the folder.
+        journal = WorkJournal(self.path, "jobs")
+        journal.lock()
+        try:
+            if not os.path.exists(self.path):
+                # the last job has removed the session folder while we waited
+                # for the lock.
+                return
+            journal.mark_done(job_id, failed=failed)
+            if all(journal.is_done(x) for x in (self.get_setting("job_ids") or [])):
+                self.discard()
+        finally:
+            journal.unlock()
+
+    def discard(self):
+        """
+        Removes the session folder and everything in it.
+        """
+        if self._path is None:
+            # never written to disk
+            return
+        self._app.log_debug("Removing session files in '%s'." % os.path.dirname(self._path))
+        temp_space = TempSpaceManager(self._app.engine.get_backburner_tmp())
+        temp_space.remove(os.path.dirname(self._path))
@@ -14,15 +14,56 @@ from sgtk import TankError
 class SegmentMetadata(object):
     """
     Simple Value wrapper class which holds properties associated with a timeline segment.
+    
+    Only the parts of the Flame export info that are needed downstream are kept, 
+    so that large exports don't hold on to the full info dictionaries.
     """
     
+    __slots__ = ["render_path",         # - path to the exported render, Flame style
+                 "version_number",      # - version number of the render
+                 "width",               # - width of the render in pixels
+                 "height",              # - height of the render in pixels
+                 "fps",                 # - frame rate of the render
+                 "aspect_ratio",        # - frame aspect ratio of the render
+                 "record_in",           # - record in point of the segment in the sequence
+                 "background_job_id",   # - backburner job id for the render, None if done in foreground
+                 "shotgun_version",     # - associated Shotgun version (dict with type/id)
+                 "submitted"]           # - has the segment been submitted to Shotgun and backburner?
+    
     def __init__(self):
         """
         Constructor
         """        
-        self.video_info = None          # - info dictionary (as sent from Flame) 
-                                        #   for the video portion of this segment
-        self.shotgun_version = None     # - associated Shotgun version (dict with type/id)
+        self.render_path = None
+        self.version_number = None
+        self.width = None
+        self.height = None
+        self.fps = None
+        self.aspect_ratio = None
+        self.record_in = None
+        self.background_job_id = None
+        self.shotgun_version = None
+        self.submitted = False
+    
+    def set_video_info(self, info):
+        """
+        Populates the segment with the render data from the info dictionary 
+        that Flame passes to the post export asset hook.
+        
+        :param info: Info dictionary for the video export of this segment
+        """
+        self.render_path = os.path.join(info.get("destinationPath"), info.get("resolvedPath"))
+        self.version_number = int(info["versionNumber"])
+        self.width = info.get("width")
+        self.height = info.get("height")
+        self.fps = info.get("fps")
+        self.aspect_ratio = info.get("aspectRatio")
+        self.record_in = info.get("recordIn")
+        
+        if info.get("isBackground"):
+            self.background_job_id = info.get("backgroundJobId")
+        else:
+            self.background_job_id = None
         
     def has_shotgun_version(self):
         """
@@ -53,7 +94,7 @@ class SegmentMetadata(object):
         
         :return: bool flag
         """
-        return self.video_info is not None
+        return self.render_path is not None
         
     def get_render_version_number(self):
         """
@@ -64,7 +105,7 @@ class SegmentMetadata(object):
         if not self.has_render_export():
             raise TankError("Cannot get render path for segment - no video metadata found!")
 
-        return int(self.video_info["versionNumber"])
+        return self.version_number
     
     def get_render_path(self):
         """
@@ -75,7 +116,7 @@ class SegmentMetadata(object):
         if not self.has_render_export():
             raise TankError("Cannot get render path for segment - no video metadata found!")
         
-        return os.path.join(self.video_info.get("destinationPath"), self.video_info.get("resolvedPath"))
+        return self.render_path
 
         
         
@@ -86,6 +127,26 @@ class ShotMetadata(object):
     Simple value wrapper class which holds various properties associated with a shot.
     """
 
+    __slots__ = ["name", 
+                 "parent_name", 
+                 "shotgun_parent", 
+                 "created_this_session", 
+                 "thumbnail_uploaded", 
+                 "shotgun_id", 
+                 "shotgun_cut_in", 
+                 "shotgun_cut_out", 
+                 "shotgun_cut_order", 
+                 "new_cut_in", 
+                 "new_cut_out", 
+                 "new_cut_order", 
+                 "context", 
+                 "batch_path", 
+                 "batch_version_number", 
+                 "batch_background_job_id", 
+                 "batch_submitted", 
+                 "expected_segments", 
+                 "segment_metadata"]
+
     def __init__(self):
         """
         Constructor
@@ -111,12 +172,33 @@ class ShotMetadata(object):
         
         self.context = None                 # context object for the shot
         
-        self.batch_info = None              # info dictionary (as sent from Flame) for the batch export
-                                            # associated with this shot
+        self.batch_path = None              # path to the batch file exported for this shot
+        self.batch_version_number = None    # version number of the batch file
+        self.batch_background_job_id = None # backburner job id for the batch export, None if 
+                                            # done in foreground
+        self.batch_submitted = False        # has the batch file been submitted for publishing?
+        
+        self.expected_segments = None       # number of video segments Flame is expected to export
+                                            # for this shot, None if unknown
         
         self.segment_metadata = {}          # metadata about all the clips associated 
                                             # with this shot, keyed by segment name                
     
+    def set_batch_info(self, info):
+        """
+        Populates the shot with the batch data from the info dictionary 
+        that Flame passes to the post export asset hook.
+        
+        :param info: Info dictionary for the batch export of this shot
+        """
+        self.batch_path = os.path.join(info.get("destinationPath"), info.get("resolvedPath"))
+        self.batch_version_number = int(info["versionNumber"])
+        
+        if info.get("isBackground"):
+            self.batch_background_job_id = info.get("backgroundJobId")
+        else:
+            self.batch_background_job_id = None
+    
     def has_batch_export(self):
         """
         Returns true if a batch export is associated with this shot, false if not.
@@ -127,7 +209,7 @@ class ShotMetadata(object):
         
         :return: bool flag
         """
-        return self.batch_info is not None
+        return self.batch_path is not None
     
     def get_batch_path(self):
         """
@@ -138,7 +220,7 @@ class ShotMetadata(object):
         if not self.has_batch_export():
             raise TankError("Cannot get batch path - no batch metadata found!")
         
-        return os.path.join(self.batch_info.get("destinationPath"), self.batch_info.get("resolvedPath"))
+        return self.batch_path
     
     def get_batch_version_number(self):
         """
@@ -149,7 +231,20 @@ class ShotMetadata(object):
         if not self.has_batch_export():
             raise TankError("Cannot get batch path - no batch metadata found!")
 
-        return int(self.batch_info["versionNumber"])
+        return self.batch_version_number
+    
+    def is_export_complete(self):
+        """
+        Returns true if all the assets that Flame is expected to export for this 
+        shot have arrived, e.g. the batch file and all video segments.
+        
+        :returns: bool flag
+        """
+        if self.expected_segments is None or not self.has_batch_export():
+            return False
+        
+        num_renders = len([x for x in self.segment_metadata.values() if x.has_render_export()])
+        return num_renders >= self.expected_segments
     
     def update_new_cut_info(self, record_in, record_out):
         """
@@ -12,13 +12,22 @@ import sgtk
 import pprint
 import subprocess
 import math
+import fractions
+import shutil
 import uuid
 from sgtk import TankError
 import os
 import re
+import time
+import tempfile
+import threading
 
 from .shot_metadata import ShotMetadata
 from .util import subprocess_check_output, SubprocessCalledProcessError
+from .encode_slots import EncodeSlots
+from .upload_bandwidth import UploadBandwidthScheduler
+from .filmstrip import FilmstripBuilder
+from .temp_space import TempSpaceManager
 
 
 
@@ -36,9 +45,24 @@ class ShotgunSubmitter(object):
     # default height for thumbs
     SHOTGUN_THUMBNAIL_TARGET_HEIGHT = 400
     
+    # default height for the proxy quicktimes uploaded ahead of the full quality quicktimes
+    SHOTGUN_PROXY_QUICKTIME_TARGET_HEIGHT = 360
+    
     # the department to use for versions
     SHOTGUN_DEPARTMENT = "Flame"
     
+    # delay in seconds before the first retry of a failed upload. 
+    # The delay is doubled for each subsequent retry, up to the max delay.
+    UPLOAD_RETRY_DELAY = 5
+    UPLOAD_RETRY_MAX_DELAY = 120
+    
+    # maximum relative distortion of the aspect ratio accepted when scaling media 
+    # with an aspect ratio that can't be matched exactly close to the target size
+    ASPECT_RATIO_TOLERANCE = 0.01
+    
+    # size in bytes of the chunks in which quicktimes are copied from local scratch
+    STAGING_COPY_BUFFER_SIZE = 16 * 1024 * 1024
+    
     def __init__(self):
         """
         Constructor
@@ -48,6 +72,30 @@ class ShotgunSubmitter(object):
         # get some app settings configuring how shots are parented
         self._shot_parent_entity_type = self._app.get_setting("shot_parent_entity_type")
         self._shot_parent_link_field = self._app.get_setting("shot_parent_link_field")
+        
+        # memoized sequence format strings (e.g. '%04d'), keyed by render template name
+        self._sequence_formats = {}
+        
+        # memoized scaled down resolutions, keyed by (target height, width, height)
+        self._aspect_ratios = {}
+        
+        # items may be processed by several threads at the same time (see MediaWorkerPool
+        # and WorkerDaemon) and the Shotgun connection is not thread safe, so serialize 
+        # all Shotgun access from the backburner methods.
+        self._shotgun_lock = threading.RLock()
+        
+        # movie uploads can take a long time, so rather than holding the lock for the 
+        # duration of an upload, each thread uploads through a connection of its own.
+        self._upload_connections = threading.local()
+        
+        # all uploads are admitted through the bandwidth scheduler, so that jobs 
+        # uploading at the same time don't saturate the uplink.
+        self._upload_bandwidth = UploadBandwidthScheduler()
+        
+        # temp files are allocated through leases, so that the ones left behind by 
+        # jobs which crashed or were killed are reclaimed before the disk fills up.
+        self._temp_space = TempSpaceManager(self._app.engine.get_backburner_tmp())
+        self._local_temp_space = TempSpaceManager(tempfile.gettempdir())
 
     def create_shotgun_structure(self, parent_name, shot_names):
         """
@@ -279,7 +327,8 @@ class ShotgunSubmitter(object):
         }
         
         self._app.log_debug("Register publish in Shotgun: %s" % str(args))        
-        sg_publish_data = sgtk.util.register_publish(**args)
+        with self._shotgun_lock:
+            sg_publish_data = sgtk.util.register_publish(**args)
         self._app.log_debug("Register complete: %s" % sg_publish_data)
         return sg_publish_data
         
@@ -328,7 +377,11 @@ class ShotgunSubmitter(object):
             args["update_entity_thumbnail"] = True
         
         self._app.log_debug("Register render publish in Shotgun: %s" % str(args))        
-        sg_publish_data = sgtk.util.register_publish(**args)
+        if jpeg_path:
+            # the publish uploads the thumbnail
+            self._upload_bandwidth.acquire(os.path.getsize(jpeg_path))
+        with self._shotgun_lock:
+            sg_publish_data = sgtk.util.register_publish(**args)
         self._app.log_debug("Register complete: %s" % sg_publish_data)
 
 
@@ -348,7 +401,10 @@ class ShotgunSubmitter(object):
                         "published_file_type": preset_obj.get_quicktime_publish_type() }
         
             self._app.log_debug("Register quicktime publish in Shotgun: %s" % str(mov_args))        
-            sg_mov_data = sgtk.util.register_publish(**mov_args)
+            if jpeg_path:
+                self._upload_bandwidth.acquire(os.path.getsize(jpeg_path))
+            with self._shotgun_lock:
+                sg_mov_data = sgtk.util.register_publish(**mov_args)
             self._app.log_debug("Register complete: %s" % sg_mov_data)
 
         
@@ -377,10 +433,11 @@ class ShotgunSubmitter(object):
             data["tank_published_file"] = sg_publish_data
             
         self._app.log_debug("Updating dependencies for version %s: %s" % (version_id, data))
-        self._app.shotgun.update("Version", version_id, data)
+        with self._shotgun_lock:
+            self._app.shotgun.update("Version", version_id, data)
         self._app.log_debug("...version update complete")
     
-    def create_version(self, context, path, user_comments, sg_publish_data, aspect_ratio):        
+    def create_version(self, context, path, user_comments, sg_publish_data, aspect_ratio, render_template=None):        
         """
         Creates a single version record in Shotgun.
         
@@ -394,18 +451,26 @@ class ShotgunSubmitter(object):
         :param sg_publish_data: Std Shotgun dictionary (with type and id), representing the publish
                                 in Shotgun that has been carried out for this asset.
         :param aspect_ratio: Aspect ratio of the images
+        :param render_template: The render template that produced the path. If None, 
+                                the template will be looked up from the path.
         :returns: The created Shotgun record
         """
         self._app.log_debug("Preparing data for version creation in Shotgun...")
         sg_batch_payload = []
-        version_batch = self.create_version_batch(context, path, user_comments, sg_publish_data, aspect_ratio)
+        version_batch = self.create_version_batch(context, 
+                                                  path, 
+                                                  user_comments, 
+                                                  sg_publish_data, 
+                                                  aspect_ratio, 
+                                                  render_template)
         sg_batch_payload.append(version_batch)
         self._app.log_debug("Create version in Shotgun: %s" % pprint.pformat(sg_batch_payload))
-        sg_data = self._app.shotgun.batch(sg_batch_payload)
+        with self._shotgun_lock:
+            sg_data = self._app.shotgun.batch(sg_batch_payload)
         self._app.log_debug("...done!")
         return sg_data[0]
     
-    def create_version_batch(self, context, path, user_comments, sg_publish_data, aspect_ratio):
+    def create_version_batch(self, context, path, user_comments, sg_publish_data, aspect_ratio, render_template=None):
         """
         Similar to create_version(), but instead generates a single batch dictionary to be used
         within a Shotgun batch call. Takes the same parameters as create_version()
@@ -417,6 +482,8 @@ class ShotgunSubmitter(object):
         :param sg_publish_data: Std Shotgun dictionary (with type and id), representing the publish
                                 in Shotgun that has been carried out for this asset.
         :param aspect_ratio: Aspect ratio of the images        
+        :param render_template: The render template that produced the path. Passing this in 
+                                avoids a scan of all the templates in the configuration.
         :returns: dictionary suitable to be used as part of a Shotgun batch call
         """
         
@@ -480,7 +547,7 @@ class ShotgunSubmitter(object):
                 batch_item["data"]["tank_published_file"] = sg_publish_data
         
         # populate the path to frames with a path which is using %4d syntax
-        batch_item["data"]["sg_path_to_frames"] = self.__get_tk_path_from_flame_plate_path(path)
+        batch_item["data"]["sg_path_to_frames"] = self.__get_tk_path_from_flame_plate_path(path, render_template)
         
         # This is used to find the latest Version from the same department.
         batch_item["data"]["sg_department"] = self.SHOTGUN_DEPARTMENT   
@@ -509,7 +576,9 @@ class ShotgunSubmitter(object):
             if jpeg_path:
                 # we have a valid thumbnail - push it to shotgn
                 self._app.log_debug("Push version thumbnail to Shotgun...")
-                self._app.shotgun.upload_thumbnail("Version", version_id, jpeg_path)
+                self._upload_bandwidth.acquire(os.path.getsize(jpeg_path))
+                with self._shotgun_lock:
+                    self._app.shotgun.upload_thumbnail("Version", version_id, jpeg_path)
                 self._app.log_debug("...upload complete!")
                 # try to clean up
                 self.__clean_up_temp_file(jpeg_path)
@@ -531,37 +600,334 @@ class ShotgunSubmitter(object):
         :param fps: The fps for the source media
         """
         self._app.log_debug("Starting to upload media to Shotgun. A quicktime will be generated.")
+        review_quicktime = self.generate_quicktimes(path, width, height, fps)
+        self.upload_review_quicktime(version_id, review_quicktime, width, height)
+    
+    def create_local_quicktime(self, export_preset_name, version_id, path, quicktime_path, width, height, fps, renditions=False):
+        """
+        Generates a quicktime based on Flame image data.
+
+        :param export_preset_name: Export preset name associated with this export
+        :param version_id: The id for the Shotgun version to which we are uploading a quicktime.
+        :param path: Path to frames, Flame style path with [1234-1234] sequence marker.
+        :param quicktime_path: Path to the quicktime we want to generate
+        :param width: Image width in pixels
+        :param height: Image height in pixels
+        :param fps: The fps for the source media
+        :param renditions: If True, the additional renditions configured in the settings 
+                           hook are generated as well, see generate_quicktimes().
+        """
+        self._app.log_debug("Starting high res quicktime generation.")
+        self.generate_quicktimes(path, width, height, fps, 
+                                 review_quicktime=False, 
+                                 export_preset_name=export_preset_name, 
+                                 quicktime_path=quicktime_path,
+                                 renditions=renditions)
+        self.set_version_movie_path(version_id, quicktime_path)
+    
+    def generate_quicktimes(self, path, width, height, fps, review_quicktime=True, export_preset_name=None, quicktime_path=None, frames=None, renditions=False):
+        """
+        Generates a quicktime for Shotgun review and/or a high res quicktime for local 
+        playback from Flame image data, along with any additional renditions configured
+        in the settings hook. All quicktimes are encoded by a single ffmpeg process from 
+        a single read of the frames, with a separate scaler for each quicktime.
+        
+        The review quicktime is written to a temp location and should be passed to 
+        upload_review_quicktime(), which uploads it and cleans it up. All other quicktimes
+        are encoded to local scratch and only appear at their target locations once complete.
+        
+        :param path: Path to frames, Flame style path with [1234-1234] sequence marker.
+        :param width: Image width in pixels
+        :param height: Image height in pixels
+        :param fps: The fps for the source media
+        :param review_quicktime: True if a quicktime for Shotgun review should be generated
+        :param export_preset_name: Export preset name associated with this export. Required 
+                                   if a local quicktime is requested.
+        :param quicktime_path: Path to the local quicktime to generate, None if no local 
+                               quicktime should be generated.
+        :param frames: Optional iterable yielding the paths to the individual frames. If given,
+                       the frames are read one at a time as they are yielded rather than as a
+                       sequence, which allows transcoding frames while they are being rendered.
+        :param renditions: If True, the renditions returned by get_quicktime_renditions in 
+                           the settings hook are generated as well. The renditions should only 
+                           be requested by one of the calls for a render.
+        :returns: Path to the review quicktime, None if no review quicktime was requested.
+        """
         self._app.log_debug("Source media: %s" % path)
         self._app.log_debug("Source media FPS: %s" % fps)
         
-        # now calculate the closest res to with 720px
-        (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(self.SHOTGUN_QUICKTIME_TARGET_HEIGHT,
-                                                                                width, 
-                                                                                height) 
+        # each output is a dictionary with keys path, width, height, hook_method and hook_args,
+        # where the hook method and args define how to get the ffmpeg parameters for the output.
+        outputs = []
+        review_quicktime_path = None
+        filmstrip = None
+        
+        if review_quicktime:
+            # now calculate the closest res to with 720px
+            (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(self.SHOTGUN_QUICKTIME_TARGET_HEIGHT,
+                                                                                    width, 
+                                                                                    height) 
+            
+            self._app.log_debug("The review quicktime will be resolution %sx%s" % (scaled_down_width, scaled_down_height))
+            
+            review_quicktime_path = self.__get_review_quicktime_tmp_path(path)
+            
+            outputs.append({"path": review_quicktime_path,
+                            "width": scaled_down_width,
+                            "height": scaled_down_height,
+                            "hook_method": "get_ffmpeg_quicktime_encode_parameters",
+                            "hook_args": {}})
+            
+            # sample a filmstrip for hover scrubbing from the frames going into the encode
+            # and keep it next to the review quicktime, so that they are uploaded together.
+            if self._app.get_setting("filmstrip_thumbnail_frames") > 0:
+                filmstrip = {"path": self.__get_filmstrip_path(review_quicktime_path),
+                             "max_tiles": self._app.get_setting("filmstrip_thumbnail_frames"),
+                             "num_frames": self.__get_frame_count(path)}
+        
+        if quicktime_path:
+            self._app.log_debug("Local quicktime target location: %s" % quicktime_path)
+            
+            preferred_height = self._app.execute_hook_method("settings_hook",
+                                                             "get_local_quicktime_prescale",
+                                                             preset_name=export_preset_name,
+                                                             width=width,
+                                                             height=height)
+            
+            (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(preferred_height, width, height) 
+            
+            self._app.log_debug("The local quicktime will be resolution %sx%s" % (scaled_down_width, scaled_down_height))
+            
+            outputs.append({"path": quicktime_path,
+                            "width": scaled_down_width,
+                            "height": scaled_down_height,
+                            "hook_method": "get_local_quicktime_ffmpeg_encode_parameters",
+                            "hook_args": {"preset_name": export_preset_name}})
+        
+        if renditions:
+            for rendition in self._app.execute_hook_method("settings_hook",
+                                                           "get_quicktime_renditions",
+                                                           preset_name=export_preset_name,
+                                                           path=path,
+                                                           width=width,
+                                                           height=height):
+                
+                (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(rendition["height"], width, height)
+                
+                self._app.log_debug("The %s rendition will be resolution %sx%s: %s" % (rendition["name"],
+                                                                                      scaled_down_width, 
+                                                                                      scaled_down_height,
+                                                                                      rendition["path"]))
+                
+                rendition_folder = os.path.dirname(rendition["path"])
+                if not os.path.exists(rendition_folder):
+                    os.makedirs(rendition_folder)
+                
+                outputs.append({"path": rendition["path"],
+                                "width": scaled_down_width,
+                                "height": scaled_down_height,
+                                "hook_method": "get_quicktime_rendition_encode_parameters",
+                                "hook_args": {"rendition_name": rendition["name"]}})
+        
+        if len(outputs) == 0:
+            return None
+        
+        # Wait for a free encode slot on this node first, so that the transcode 
+        # doesn't compete with too many others for the cores.
+        encode_slots = EncodeSlots(self._app.get_setting("max_concurrent_encodes"))
+        staging_folder = None
+        try:
+            # quicktimes which end up on the file server are encoded to local scratch and 
+            # moved into place once complete, see __move_into_place.
+            for (idx, output) in enumerate(outputs):
+                if output["path"] != review_quicktime_path:
+                    if staging_folder is None:
+                        staging_folder = self._local_temp_space.allocate_folder("tk_flame_export_staging_")
+                    output["target_path"] = output["path"]
+                    output["path"] = os.path.join(staging_folder, "%s_%s" % (idx, os.path.basename(output["path"])))
+            
+            # rather than failing half way through the encode, make sure there is room for it
+            required_bytes = self._app.get_setting("min_free_temp_space_mb") * 1024 * 1024
+            if review_quicktime_path:
+                self._temp_space.check_free_space(required_bytes)
+            if staging_folder:
+                self._local_temp_space.check_free_space(required_bytes)
+            
+            encode_slots.acquire()
+            try:
+                # each output has its own encoder threads in the same ffmpeg process
+                threads = self._app.execute_hook_method("settings_hook",
+                                                        "get_ffmpeg_thread_count",
+                                                        cpu_count=encode_slots.cpu_count,
+                                                        max_encodes=encode_slots.max_encodes,
+                                                        num_outputs=len(outputs))
+                
+                # get transcode params from hook
+                for output in outputs:
+                    output["ffmpeg_presets"] = "-threads %d %s" % (threads,
+                                                                   self._app.execute_hook_method("settings_hook", 
+                                                                                                 output["hook_method"],
+                                                                                                 **output["hook_args"]))
+                
+                self.__do_quicktime_transcode(fps, path, outputs, frames, filmstrip)
+            finally:
+                encode_slots.release()
+            
+            # copying the quicktimes doesn't need the cores, so do it outside the encode slot
+            for output in outputs:
+                if "target_path" in output:
+                    self.__move_into_place(output["path"], output["target_path"])
+        except:
+            # don't leave a partial review quicktime behind in the temp location
+            if review_quicktime_path:
+                self.discard_review_quicktime(review_quicktime_path)
+            raise
+        finally:
+            if staging_folder:
+                shutil.rmtree(staging_folder, ignore_errors=True)
+                self._local_temp_space.release(staging_folder)
         
-        self._app.log_debug("The quicktime will be resolution %sx%s" % (scaled_down_width, scaled_down_height))
+        return review_quicktime_path
+    
+    def __move_into_place(self, staging_path, target_path):
+        """
+        Moves a quicktime encoded to local scratch to its target location.
         
-        # get transcode params from hook
-        ffmpeg_presets = self._app.execute_hook_method("settings_hook", "get_ffmpeg_quicktime_encode_parameters")        
+        The encoder writes its output in many small pieces and rewrites the header 
+        at the end, which is hard on a file server when many encodes run at the same
+        time. Copying the finished quicktime across in large sequential chunks is much
+        cheaper. The copy is written to a hidden temp file next to the target and 
+        renamed once complete, so viewers never pick up a partial quicktime.
         
-        # get a temp path - keep the filename nice because this will be uploaded to Shotgun
-        tmp_folder = os.path.join(self._app.engine.get_backburner_tmp(), "shotgun_flame_tmp_%s" % uuid.uuid4().hex)
-        os.mkdir(tmp_folder)
+        :param staging_path: Path to the quicktime on local scratch
+        :param target_path: Path to move the quicktime to
+        """
+        tmp_path = os.path.join(os.path.dirname(target_path), 
+                                ".%s.%s.tmp" % (os.path.basename(target_path), uuid.uuid4().hex))
         
-        # format a nice name for the temp quicktime because this name will be visible in Shotgun
-        # /path/to/filename -> filename
-        # /path/to/filename.ext -> filename
-        # /path/to/filename.%04d.ext -> filename
-        file_name = os.path.basename(path)
-        file_name_no_ext = os.path.splitext(os.path.splitext(file_name)[0])[0]
-        tmp_quicktime = os.path.join(tmp_folder, "%s.mov" % file_name_no_ext)                 
+        self._app.log_debug("Copying quicktime from local scratch to '%s'..." % target_path)
+        try:
+            src = open(staging_path, "rb")
+            try:
+                dst = open(tmp_path, "wb")
+                try:
+                    shutil.copyfileobj(src, dst, self.STAGING_COPY_BUFFER_SIZE)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                finally:
+                    dst.close()
+            finally:
+                src.close()
+            
+            os.rename(tmp_path, target_path)
+        except:
+            if os.path.exists(tmp_path):
+                self.__clean_up_temp_file(tmp_path)
+            raise
         
-        # create quicktime
-        self.__do_quicktime_transcode(fps, path, tmp_quicktime, scaled_down_width, scaled_down_height, ffmpeg_presets)                
+        self._app.log_debug("...quicktime moved into place!")
+    
+    def start_proxy_upload(self, version_id, path, width, height, fps):
+        """
+        Starts generating and uploading a small, quickly encoded proxy quicktime for a 
+        version in the background, so that there is something to review in Shotgun 
+        well before the full quality quicktime is ready. The proxy is replaced when 
+        the full quality quicktime is uploaded to the version.
+        
+        The proxy encode doesn't wait for an encode slot - it is cheap compared to the 
+        full quality encode it runs alongside. Failures are logged but not raised, 
+        since the full quality quicktime will still be uploaded.
+        
+        :param version_id: The id for the Shotgun version to upload the proxy to
+        :param path: Path to frames, Flame style path with [1234-1234] sequence marker.
+        :param width: Image width in pixels
+        :param height: Image height in pixels
+        :param fps: The fps for the source media
+        :returns: Thread object. Join it before uploading the full quality quicktime,
+                  so that the proxy can't replace it.
+        """
+        thread = threading.Thread(target=self.__upload_proxy_quicktime, 
+                                  args=(version_id, path, width, height, fps))
+        thread.start()
+        return thread
+    
+    def __upload_proxy_quicktime(self, version_id, path, width, height, fps):
+        """
+        Generates and uploads a proxy quicktime, see start_proxy_upload().
         
+        :param version_id: The id for the Shotgun version to upload the proxy to
+        :param path: Path to frames, Flame style path with [1234-1234] sequence marker.
+        :param width: Image width in pixels
+        :param height: Image height in pixels
+        :param fps: The fps for the source media
+        """
+        try:
+            (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(self.SHOTGUN_PROXY_QUICKTIME_TARGET_HEIGHT,
+                                                                                    width, 
+                                                                                    height) 
+            self._app.log_debug("The proxy quicktime will be resolution %sx%s" % (scaled_down_width, scaled_down_height))
+            
+            encode_slots = EncodeSlots(self._app.get_setting("max_concurrent_encodes"))
+            threads = self._app.execute_hook_method("settings_hook",
+                                                    "get_ffmpeg_thread_count",
+                                                    cpu_count=encode_slots.cpu_count,
+                                                    max_encodes=encode_slots.max_encodes,
+                                                    num_outputs=1)
+            ffmpeg_presets = "-threads %d %s" % (threads,
+                                                 self._app.execute_hook_method("settings_hook", 
+                                                                               "get_ffmpeg_proxy_quicktime_encode_parameters"))
+            
+            proxy_quicktime_path = self.__get_review_quicktime_tmp_path(path)
+            try:
+                # the proxy is an encode of its own, running alongside the full quality
+                # encode, so it needs a slot of its own to stay within the cap.
+                encode_slots.acquire()
+                try:
+                    self.__do_quicktime_transcode(fps, path, [{"path": proxy_quicktime_path,
+                                                               "width": scaled_down_width,
+                                                               "height": scaled_down_height,
+                                                               "ffmpeg_presets": ffmpeg_presets}])
+                finally:
+                    encode_slots.release()
+                
+                self._app.log_debug("Uploading proxy quicktime to Version.sg_uploaded_movie")
+                self.__upload_movie(version_id, proxy_quicktime_path, "sg_uploaded_movie")
+                self._app.log_debug("...upload complete!")
+            finally:
+                if os.path.exists(proxy_quicktime_path):
+                    self.__clean_up_temp_file(proxy_quicktime_path)
+                self.__clean_up_folder(os.path.dirname(proxy_quicktime_path))
+        
+        except Exception, e:
+            self._app.log_warning("Proxy quicktime upload for version %s failed: %s. The full "
+                                  "quality quicktime will still be uploaded." % (version_id, e))
+    
+    def upload_review_quicktime(self, version_id, review_quicktime_path, width, height, keep_on_failure=False):
+        """
+        Uploads a quicktime generated by generate_quicktimes() to Shotgun and 
+        removes the local temp file.
+        
+        Failed uploads are retried a number of times, see the upload_retries setting.
+        
+        :param version_id: The id for the Shotgun version to which we are uploading a quicktime.
+        :param review_quicktime_path: Path to the review quicktime
+        :param width: Width in pixels of the images the quicktime was generated from
+        :param height: Height in pixels of the images the quicktime was generated from
+        :param keep_on_failure: If True, the local temp file is left in place if the 
+                                upload fails, so that a retry of the job can upload it 
+                                without generating it again.
+        """
         # upload quicktime to Shotgun
         self._app.log_debug("Begin upload of quicktime to Shotgun...")
         
+        # the quicktime may have been left behind by an earlier attempt of the job,
+        # so make sure it isn't reclaimed while it is being uploaded.
+        self._temp_space.renew(os.path.dirname(review_quicktime_path))
+        
+        (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(self.SHOTGUN_QUICKTIME_TARGET_HEIGHT,
+                                                                                width, 
+                                                                                height) 
+        
         try:
         
             # check if we should attempt bypassing Shotgun transcoding
@@ -578,73 +944,165 @@ class ShotgunSubmitter(object):
             
             if bypass_server_transcoding:
                 self._app.log_debug("Uploading quicktime to Version.sg_uploaded_movie_mp4")
-                self._app.shotgun.upload("Version", version_id, tmp_quicktime, "sg_uploaded_movie_mp4")
+                self.__upload_movie(version_id, review_quicktime_path, "sg_uploaded_movie_mp4")
                 self._app.log_debug("...upload complete!")            
                 
             else:
                 self._app.log_debug("Uploading quicktime to Version.sg_uploaded_movie")
-                self._app.shotgun.upload("Version", version_id, tmp_quicktime, "sg_uploaded_movie")
+                self.__upload_movie(version_id, review_quicktime_path, "sg_uploaded_movie")
                 self._app.log_debug("...upload complete!")
+            
+            filmstrip_path = self.__get_filmstrip_path(review_quicktime_path)
+            if os.path.exists(filmstrip_path):
+                self.__upload_filmstrip(version_id, filmstrip_path)
         
-        finally:
+        except:
+            if not keep_on_failure:
+                self.discard_review_quicktime(review_quicktime_path)
+            raise
+        
+        else:
             # clean up
-            self.__clean_up_temp_file(tmp_quicktime)
-            self.__clean_up_folder(tmp_folder)
+            self.discard_review_quicktime(review_quicktime_path)
     
-    
-    def create_local_quicktime(self, export_preset_name, version_id, path, quicktime_path, width, height, fps):
+    def __upload_filmstrip(self, version_id, filmstrip_path):
         """
-        Generates a quicktime based on Flame image data.
-
-        :param export_preset_name: Export preset name associated with this export
-        :param version_id: The id for the Shotgun version to which we are uploading a quicktime.
-        :param path: Path to frames, Flame style path with [1234-1234] sequence marker.
-        :param quicktime_path: Path to the quicktime we want to generate
-        :param width: Image width in pixels
-        :param height: Image height in pixels
-        :param fps: The fps for the source media
-        """
-        self._app.log_debug("Starting high res quicktime generation.")
-        self._app.log_debug("Source media: %s" % path)
-        self._app.log_debug("Quicktime target location: %s" % quicktime_path)
-        self._app.log_debug("Source media FPS: %s" % fps)
+        Uploads a filmstrip thumbnail to a version. The filmstrip is a nice to have, 
+        so failures are logged rather than raised.
         
-        preferred_height = self._app.execute_hook_method("settings_hook",
-                                                         "get_local_quicktime_prescale",
-                                                         preset_name=export_preset_name,
-                                                         width=width,
-                                                         height=height)
+        :param version_id: The id for the Shotgun version to upload to
+        :param filmstrip_path: Path to the filmstrip jpeg
+        """
+        self._app.log_debug("Uploading filmstrip thumbnail to Version %s..." % version_id)
+        try:
+            self._upload_bandwidth.acquire(os.path.getsize(filmstrip_path))
+            with self._shotgun_lock:
+                self._app.shotgun.upload_filmstrip_thumbnail("Version", version_id, filmstrip_path)
+            self._app.log_debug("...upload complete!")
+        except Exception, e:
+            self._app.log_warning("Could not upload filmstrip thumbnail for version %s: %s" % (version_id, e))
+    
+    def __upload_movie(self, version_id, path, field_name):
+        """
+        Uploads a movie to a version. If the upload fails, it is retried with 
+        an increasing delay, so that uploads survive short network outages.
         
-        # now calculate the closest res to with 720px
-        (scaled_down_width, scaled_down_height) = self.__calculate_aspect_ratio(preferred_height, width, height) 
+        :param version_id: The id for the Shotgun version to upload to
+        :param path: Path to the movie
+        :param field_name: Name of the movie field on the version
+        """
+        num_retries = self._app.get_setting("upload_retries")
         
-        self._app.log_debug("The quicktime will be resolution %sx%s" % (scaled_down_width, scaled_down_height))
+        for attempt in range(num_retries + 1):
+            try:
+                self._upload_bandwidth.acquire(os.path.getsize(path))
+                self.__get_upload_connection().upload("Version", version_id, path, field_name)
+                return
+            except Exception, e:
+                if attempt == num_retries:
+                    raise
                 
-        ffmpeg_presets = self._app.execute_hook_method("settings_hook", 
-                                                       "get_local_quicktime_ffmpeg_encode_parameters",
-                                                       preset_name=export_preset_name)
+                # the connection may be in a bad state - start afresh
+                self._upload_connections.shotgun = None
                 
-        self.__do_quicktime_transcode(fps, path, quicktime_path, scaled_down_width, scaled_down_height, ffmpeg_presets)
+                delay = min(self.UPLOAD_RETRY_DELAY * (2 ** attempt), self.UPLOAD_RETRY_MAX_DELAY)
+                self._app.log_warning("Upload of '%s' failed: %s. Retrying in %s seconds "
+                                      "(attempt %s of %s)..." % (path, e, delay, attempt + 2, num_retries + 1))
+                time.sleep(delay)
+    
+    def __get_upload_connection(self):
+        """
+        Returns the Shotgun connection to use for uploads from the current thread.
+        
+        :returns: Shotgun API instance
+        """
+        sg = getattr(self._upload_connections, "shotgun", None)
+        if sg is None:
+            sg = sgtk.util.shotgun.create_sg_connection()
+            self._upload_connections.shotgun = sg
+        return sg
     
+    def create_cut_version(self, context, entity, name, user_comments, movie_path):
+        """
+        Creates a version for a review movie of a whole cut and uploads the movie to it.
+        
+        :param context: Context of one of the shots in the cut. Used for the project and user.
+        :param entity: Shotgun entity dictionary for the shot parent (e.g. Sequence) 
+                       that the cut belongs to.
+        :param name: Name of the version
+        :param user_comments: Comments entered by the user at export start.
+        :param movie_path: Path to the cut review movie
+        :returns: Shotgun data for the created version
+        """
+        data = {"code": name,
+                "description": user_comments,
+                "project": context.project,
+                "entity": entity,
+                "created_by": context.user,
+                "user": context.user,
+                "sg_department": self.SHOTGUN_DEPARTMENT}
+        
+        self._app.log_debug("Creating cut version in Shotgun: %s" % pprint.pformat(data))
+        with self._shotgun_lock:
+            sg_version = self._app.shotgun.create("Version", data)
+        
+        self._app.log_debug("Uploading cut review movie to Version.sg_uploaded_movie")
+        self.__upload_movie(sg_version["id"], movie_path, "sg_uploaded_movie")
+        self._app.log_debug("...upload complete!")
+        return sg_version
+    
+    def discard_review_quicktime(self, review_quicktime_path):
+        """
+        Removes a quicktime generated by generate_quicktimes() which is not going to be uploaded.
+        
+        :param review_quicktime_path: Path to the review quicktime
+        """
+        for path in [review_quicktime_path, self.__get_filmstrip_path(review_quicktime_path)]:
+            if os.path.exists(path):
+                self.__clean_up_temp_file(path)
+        self.__clean_up_folder(os.path.dirname(review_quicktime_path))
+    
+    def set_version_movie_path(self, version_id, quicktime_path):
+        """
+        Points a version to a local quicktime generated by generate_quicktimes().
+        
+        :param version_id: The id for the Shotgun version to update
+        :param quicktime_path: Path to the local quicktime
+        """
         # now update the corresponding version's path to movie field
         self._app.log_debug("Setting sg_path_to_movie to '%s' for Version %s" % (quicktime_path, version_id))
-        self._app.shotgun.update("Version", version_id, {"sg_path_to_movie": quicktime_path})
+        with self._shotgun_lock:
+            self._app.shotgun.update("Version", version_id, {"sg_path_to_movie": quicktime_path})
         self._app.log_debug("...Shotgun update complete!")
     
     
-    def __do_quicktime_transcode(self, fps, input_path, output_path, target_width, target_height, ffmpeg_presets):
+    def __do_quicktime_transcode(self, fps, input_path, outputs, frames=None, filmstrip=None):
         """
-        Create a quicktime based on Flame media.
+        Create one or more quicktimes based on Flame media. The media is read once,
+        at the resolution of the largest quicktime, and encoded into all quicktimes 
+        by a single ffmpeg process. Optionally, a filmstrip thumbnail is sampled from
+        the frames on their way into ffmpeg.
         
         :param fps: The fps (as a float or int) for the input data
         :param input_path: Path to input image sequence
-        :param output_path: Path to quicktime to be generated
-        :param target_width: Width of generated quicktime, in pixels
-        :param target_height: Height of generated quicktime, in pixels
-        :param ffmpeg_presets: String with ffmpeg presets to control codec settings
+        :param outputs: List of dictionaries with keys path, width, height and ffmpeg_presets,
+                        where path is the quicktime to be generated, width and height are its
+                        resolution in pixels and ffmpeg_presets is a string with ffmpeg presets
+                        to control codec settings.
+        :param frames: Optional iterable yielding paths to the individual frames to read, 
+                       see generate_quicktimes.
+        :param filmstrip: Optional dictionary with keys path, max_tiles and num_frames, where
+                          path is the filmstrip jpeg to generate, max_tiles the maximum number
+                          of frames in it and num_frames the number of frames in the media, 
+                          None if not known.
         """
                 
         self._app.log_debug("Start transcoding quicktime...")
+        
+        # read the frames at the largest resolution requested
+        largest_output = max(outputs, key=lambda output: output["height"])
+        target_width = largest_output["width"]
+        target_height = largest_output["height"]
 
         # first assemble the readframe syntax. This will use the wiretap API to emit a stream of 
         # image data to stdout that we can pipe into ffmpeg. We use this because the ffmpeg version
@@ -699,6 +1157,10 @@ class ShotgunSubmitter(object):
         #  QUICKTIME_OPTIONS   <-- quicktime codec options (comes from hook)
         #  /output/file.mov    <-- target file
         #
+        # when several quicktimes are generated, the quicktime options and target file
+        # are repeated for each output, prefixed with -s WxH for outputs which are smaller
+        # than the input stream.
+        #
         
         # note: the -r framerate argument seems to confuse ffmpeg so I am omitting that
         # instead, quicktimes are generated at a default of 25fps.
@@ -714,7 +1176,57 @@ class ShotgunSubmitter(object):
                                                                                        target_width,
                                                                                        target_height)
                                                                                        
-        full_cmd = "%s | %s %s %s" % (input_cmd, ffmpeg_cmd, ffmpeg_presets, output_path)
+        output_cmds = []
+        for output in outputs:
+            if (output["width"], output["height"]) == (target_width, target_height):
+                output_cmds.append("%s %s" % (output["ffmpeg_presets"], output["path"]))
+            else:
+                output_cmds.append("-s %sx%s %s %s" % (output["width"], 
+                                                       output["height"], 
+                                                       output["ffmpeg_presets"], 
+                                                       output["path"]))
+        
+        filmstrip_builder = None
+        if filmstrip:
+            filmstrip_builder = FilmstripBuilder(target_width, 
+                                                 target_height, 
+                                                 filmstrip["max_tiles"], 
+                                                 filmstrip["num_frames"])
+        
+        if frames is not None:
+            # frames are read one by one and fed to a running ffmpeg process
+            frame_data = self.__read_frames(frames, target_width, target_height)
+            self.__do_streaming_transcode(frame_data, "%s %s" % (ffmpeg_cmd, " ".join(output_cmds)), filmstrip_builder)
+        elif filmstrip_builder:
+            # the frames have to pass through this process to be sampled, so rather 
+            # than letting the shell pipe them into ffmpeg, pump them across.
+            frame_data = self.__read_sequence(input_cmd, filmstrip_builder.frame_size)
+            self.__do_streaming_transcode(frame_data, "%s %s" % (ffmpeg_cmd, " ".join(output_cmds)), filmstrip_builder)
+        else:
+            self.__do_piped_transcode(input_cmd, "%s %s" % (ffmpeg_cmd, " ".join(output_cmds)))
+        
+        for output in outputs:
+            self._app.log_debug("File size of %s is %s bytes." % (output["path"], os.path.getsize(output["path"])))
+        
+        if filmstrip_builder:
+            try:
+                if filmstrip_builder.save(filmstrip["path"], ffmpeg_executable):
+                    self._app.log_debug("File size of %s is %s bytes." % (filmstrip["path"], 
+                                                                         os.path.getsize(filmstrip["path"])))
+            except Exception, e:
+                # the quicktimes are fine, so carry on without the filmstrip
+                self._app.log_warning("Could not generate filmstrip thumbnail: %s" % e)
+                if os.path.exists(filmstrip["path"]):
+                    self.__clean_up_temp_file(filmstrip["path"])
+    
+    def __do_piped_transcode(self, input_cmd, ffmpeg_cmd):
+        """
+        Runs read_frame for a sequence and pipes the output into ffmpeg.
+        
+        :param input_cmd: read_frame command line for the sequence
+        :param ffmpeg_cmd: ffmpeg command line
+        """
+        full_cmd = "%s | %s" % (input_cmd, ffmpeg_cmd)
         
         self._app.log_debug("Full transcoding command line: %s" % full_cmd)
         self._app.log_debug("Begin quicktime generation...")
@@ -726,9 +1238,146 @@ class ShotgunSubmitter(object):
             self._app.log_debug("Quicktime successfully created! Command output:\n%s" % cmd_output)
         except SubprocessCalledProcessError, e:
             raise TankError("Transcode process failed!\nError code: %s\nOutput:\n%s" % (e.returncode, e.output))
+    
+    def __do_streaming_transcode(self, frame_data, ffmpeg_cmd, filmstrip_builder=None):
+        """
+        Starts ffmpeg and feeds it raw frames one at a time as they become available.
         
-        self._app.log_debug("File size is %s bytes." % os.path.getsize(output_path))
-                
+        :param frame_data: Iterable yielding the raw rgb24 data for each frame, 
+                           see __read_frames and __read_sequence.
+        :param ffmpeg_cmd: ffmpeg command line
+        :param filmstrip_builder: Optional FilmstripBuilder to pass the frames to
+        """
+        self._app.log_debug("Begin streaming quicktime generation: %s" % ffmpeg_cmd)
+        
+        # send ffmpeg's output to a file rather than a pipe, so that it can't 
+        # block while we are writing frames to it.
+        ffmpeg_log = tempfile.TemporaryFile()
+        ffmpeg_process = subprocess.Popen(ffmpeg_cmd, 
+                                          shell=True, 
+                                          stdin=subprocess.PIPE, 
+                                          stdout=ffmpeg_log, 
+                                          stderr=subprocess.STDOUT)
+        try:
+            num_frames = 0
+            for data in frame_data:
+                ffmpeg_process.stdin.write(data)
+                if filmstrip_builder:
+                    filmstrip_builder.add_frame(num_frames, data)
+                num_frames += 1
+            
+            ffmpeg_process.stdin.close()
+            ffmpeg_process.wait()
+        except:
+            # stop the encode straight away
+            if ffmpeg_process.poll() is None:
+                ffmpeg_process.kill()
+                ffmpeg_process.wait()
+            ffmpeg_log.close()
+            raise
+        
+        try:
+            ffmpeg_log.seek(0)
+            cmd_output = ffmpeg_log.read()
+        finally:
+            ffmpeg_log.close()
+        
+        if ffmpeg_process.returncode != 0:
+            raise TankError("Transcode process failed!\nError code: %s\nOutput:\n%s" % (ffmpeg_process.returncode, 
+                                                                                          cmd_output))
+        self._app.log_debug("Quicktime successfully created from %s frames! "
+                            "Command output:\n%s" % (num_frames, cmd_output))
+    
+    def __read_frames(self, frames, width, height):
+        """
+        Generator which reads frames one at a time as they are yielded, with a separate 
+        read_frame call for each frame, using the same syntax as for a sequence, 
+        see __do_quicktime_transcode.
+        
+        :param frames: Iterable yielding paths to the frames to read
+        :param width: Width to read the frames at
+        :param height: Height to read the frames at
+        :returns: Generator yielding the raw rgb24 data for each frame
+        """
+        for frame_path in frames:
+            frame_cmd = "%s -n \"%s@CLIP\" -h %s -W %s -H %s -L -N 1 -r" % (self._app.engine.get_read_frame_path(),
+                                                                            frame_path,
+                                                                            "%s:Gateway" % self._app.engine.get_server_hostname(),
+                                                                            width,
+                                                                            height)
+            try:
+                yield subprocess_check_output(frame_cmd, shell=True)
+            except SubprocessCalledProcessError, e:
+                raise TankError("Could not read frame '%s'!\nError code: %s" % (frame_path, e.returncode))
+    
+    def __read_sequence(self, input_cmd, frame_size):
+        """
+        Generator which runs read_frame for a sequence and splits its output into frames.
+        
+        :param input_cmd: read_frame command line for the sequence
+        :param frame_size: Size of each frame in bytes
+        :returns: Generator yielding the raw rgb24 data for each frame
+        """
+        self._app.log_debug("Reading frames: %s" % input_cmd)
+        
+        read_log = tempfile.TemporaryFile()
+        read_process = subprocess.Popen(input_cmd, 
+                                        shell=True, 
+                                        stdout=subprocess.PIPE, 
+                                        stderr=read_log)
+        try:
+            while True:
+                data = read_process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield data
+            
+            read_process.wait()
+            if read_process.returncode != 0 or len(data) != 0:
+                read_log.seek(0)
+                raise TankError("Could not read frames!\nError code: %s\nOutput:\n%s" % (read_process.returncode,
+                                                                                          read_log.read()))
+        finally:
+            # the consumer may have given up early
+            if read_process.poll() is None:
+                read_process.kill()
+                read_process.wait()
+            read_log.close()
+    
+    def __get_review_quicktime_tmp_path(self, path):
+        """
+        Creates a temp folder for a quicktime which is going to be uploaded to Shotgun.
+        
+        :param path: Path to the frames the quicktime is generated from
+        :returns: Path to the quicktime in the temp folder
+        """
+        # get a temp path - keep the filename nice because this will be uploaded to Shotgun
+        tmp_folder = self._temp_space.allocate_folder("shotgun_flame_tmp_")
+        
+        # format a nice name for the temp quicktime because this name will be visible in Shotgun
+        # /path/to/filename -> filename
+        # /path/to/filename.ext -> filename
+        # /path/to/filename.%04d.ext -> filename
+        file_name = os.path.basename(path)
+        file_name_no_ext = os.path.splitext(os.path.splitext(file_name)[0])[0]
+        return os.path.join(tmp_folder, "%s.mov" % file_name_no_ext)
+    
+    def __get_filmstrip_path(self, review_quicktime_path):
+        """
+        :param review_quicktime_path: Path to a review quicktime generated by generate_quicktimes()
+        :returns: Path to the filmstrip thumbnail kept next to the review quicktime
+        """
+        return "%s_filmstrip.jpg" % os.path.splitext(review_quicktime_path)[0]
+    
+    def __get_frame_count(self, path):
+        """
+        :param path: Flame style path with [1234-1234] sequence marker
+        :returns: Number of frames in the sequence, None if the path has no sequence marker
+        """
+        match = re.search("\[([0-9]+)-([0-9]+)\](?=\.[^\.]*$)", path)
+        if match is None:
+            return None
+        return int(match.group(2)) - int(match.group(1)) + 1
     
     def __calculate_aspect_ratio(self, target_height, width, height):
         """
@@ -739,13 +1388,39 @@ class ShotgunSubmitter(object):
         
         - the height should be as close to target_height as possible (but not lower)
         - width and height both need to be divisible by two (ffmpeg requirement)
+        - the aspect ratio should be preserved, within ASPECT_RATIO_TOLERANCE
+        
+        Results are memoized, since the same few resolutions come up over and over
+        again in an export.
         
         :param target_height: The desired height
         :param width: The current width
         :param height: The current height
         :returns: int tuple, e.g. (768, 440)
         """
+        key = (target_height, width, height)
+        if key not in self._aspect_ratios:
+            self._aspect_ratios[key] = self.__solve_aspect_ratio(int(target_height), int(width), int(height))
+        return self._aspect_ratios[key]
+    
+    def __solve_aspect_ratio(self, target_height, width, height):
+        """
+        Solves for the scaled down resolution, see __calculate_aspect_ratio.
+        
+        Reduced to lowest terms, the aspect ratio is p:q. All resolutions with exactly
+        the same aspect ratio are multiples k*p x k*q, and since p and q can't both be
+        even, k has to be even for both to be divisible by two. The smallest such 
+        resolution with a height of at least target_height can therefore be calculated
+        directly. For awkward aspect ratios, this may be far larger than the target, 
+        in which case the smallest even height above the target is used instead, with
+        the width rounded to the closest even number, as long as that doesn't distort 
+        the image by more than the tolerance.
         
+        :param target_height: The desired height
+        :param width: The current width
+        :param height: The current height
+        :returns: int tuple, e.g. (768, 440)
+        """
         self._app.log_debug("Trying to find a scaled down resolution " 
                             "with height %s for %sx%s" % (target_height, width, height))
         
@@ -754,39 +1429,71 @@ class ShotgunSubmitter(object):
         if target_height > height:
             return (width, height)
         
-        # calculate initial values
-        aspect_ratio = float(width) / float(height)
-        new_height = target_height
-        new_width = 0.5
-    
-        # loop until a match is found or until we reach original resolution
-        while new_height < height:
-                        
-            # calculate our width given the current height
-            new_width = float(new_height) * aspect_ratio
-
-            # check if this resolution is good
-            if new_height%2==0 and new_width.is_integer() and int(new_width) % 2 == 0:
-                # both width and height is an integer divisible by two.
-                return (int(new_width), int(new_height))
-            else:
-                # no match, increment by one and try again
-                new_height += 1
+        # smallest even height which isn't lower than the target
+        min_height = target_height + target_height % 2
+        
+        # smallest exact resolution, based on the reduced aspect ratio
+        divisor = fractions.gcd(width, height)
+        (p, q) = (width / divisor, height / divisor)
+        k = (target_height + q - 1) / q
+        k += k % 2
+        exact_resolution = (k * p, k * q)
+        
+        if exact_resolution[1] == min_height:
+            return exact_resolution
+        
+        # closest resolution with the smallest even height
+        approx_width = int(round(float(width) * min_height / height / 2)) * 2
+        if approx_width > 0 and min_height <= height:
+            error = abs(float(approx_width) / min_height - float(width) / height) / (float(width) / height)
+            if error <= self.ASPECT_RATIO_TOLERANCE:
+                self._app.log_debug("No exact match close to the target height. Using %sx%s, which differs "
+                                    "from the aspect ratio by %.3f%%." % (approx_width, min_height, error * 100))
+                return (approx_width, min_height)
+        
+        if exact_resolution[1] <= height:
+            return exact_resolution
         
         return (width, height)
 
-    def __get_tk_path_from_flame_plate_path(self, flame_path):
+    def __get_tk_path_from_flame_plate_path(self, flame_path, template=None):
         """
         Given a xxx.[1234-1234].exr style Flame plate path,
         return the equivalent, normalized tk path, e.g. xxx.%04d.exr
         
+        If the template is known, the Flame sequence token is swapped out for the 
+        template's sequence format directly. This avoids a lookup across all the 
+        templates in the configuration, which can be slow for large configurations.
+        
         :param flame_path: Flame style plate path (must match the plate template)
+        :param template: Template that the path was generated from. If None, the template
+                         will be resolved via template_from_path().
         :returns: tk equivalent
         """
-        template = self._app.sgtk.template_from_path(flame_path)
-        fields = template.get_fields(flame_path)    
-        fields["SEQ"] = "FORMAT: %d"
-        return template.apply_fields(fields)        
+        if template is None:
+            template = self._app.sgtk.template_from_path(flame_path)
+            fields = template.get_fields(flame_path)    
+            fields["SEQ"] = "FORMAT: %d"
+            return template.apply_fields(fields)
+        
+        # look up the sequence format (e.g. '%04d') for the template
+        if template.name not in self._sequence_formats:
+            sequence_key = template.keys["SEQ"]
+            self._sequence_formats[template.name] = sequence_key.str_from_value("FORMAT: %d")
+        sequence_format = self._sequence_formats[template.name]
+        
+        # Flame sequence tokens are on the form "[1001-1100]"
+        (tk_path, num_subs) = re.subn("\[[0-9]+-[0-9]+\](?=\.[^\.]*$)", sequence_format, flame_path)
+        
+        if num_subs != 1:
+            # not a standard Flame sequence path - fall back on the template fields
+            self._app.log_debug("Could not locate a sequence token in '%s'. Resolving "
+                                "via template %s." % (flame_path, template))
+            fields = template.get_fields(flame_path)    
+            fields["SEQ"] = "FORMAT: %d"
+            return template.apply_fields(fields)
+        
+        return tk_path
 
     def __extract_thumbnail(self, path, width, height):
         """
@@ -816,7 +1523,7 @@ class ShotgunSubmitter(object):
                                                                 scaled_down_width,
                                                                 scaled_down_height) 
         
-        thumbnail_jpg = os.path.join(self._app.engine.get_backburner_tmp(), "tk_thumb_%s.jpg" % uuid.uuid4().hex)
+        thumbnail_jpg = self._temp_space.allocate_file("tk_thumb_", ".jpg")
         full_cmd = "%s > %s" % (input_cmd, thumbnail_jpg)
         
         self._app.log_debug("Full thumbnail command line: %s" % full_cmd)
@@ -827,6 +1534,10 @@ class ShotgunSubmitter(object):
             self._app.log_debug("Thumbnail successfully created! Command output:\n%s" % cmd_output)
         except SubprocessCalledProcessError, e:
             self._app.log_warning("Thumbnail process failed!\nError code: %s\nOutput:\n%s" % (e.returncode, e.output))
+            if os.path.exists(thumbnail_jpg):
+                self.__clean_up_temp_file(thumbnail_jpg)
+            else:
+                self._temp_space.release(thumbnail_jpg)
             thumbnail_jpg = None
         
         return thumbnail_jpg
@@ -841,6 +1552,7 @@ class ShotgunSubmitter(object):
         try:
             os.rmdir(path)
             self._app.log_debug("Removed temporary folder '%s'." % path)
+            self._temp_space.release(path)
         except Exception, e:
             self._app.log_warning("Could not remove temporary folder '%s': %s" % (path, e))    
         
@@ -854,5 +1566,6 @@ class ShotgunSubmitter(object):
         try:
             os.remove(path)
             self._app.log_debug("Removed temporary file '%s'." % path)
+            self._temp_space.release(path)
         except Exception, e:
             self._app.log_warning("Could not remove temporary file '%s': %s" % (path, e))    
@@ -0,0 +1,102 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+
+import sgtk
+from sgtk import TankError
+
+class TaskGroup(object):
+    """
+    Runs a group of independent tasks on a number of threads inside a backburner job
+    and waits for all of them to complete.
+
+    This is used to overlap Shotgun calls, thumbnail extraction and transcodes within
+    a single job. Tasks which fail don't stop the other tasks from running - once all
+    tasks have completed, a TankError is raised listing all failures.
+    """
+
+    def __init__(self, concurrency):
+        """
+        Constructor
+
+        :param concurrency: Maximum number of tasks to run at the same time
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._concurrency = max(1, concurrency)
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def add(self, description, method, *args, **kwargs):
+        """
+        Adds a task to the group.
+
+        :param description: Description of the task, used for logging
+        :param method: Callable to execute
+        :param args: Positional arguments to pass to the callable
+        :param kwargs: Keyword arguments to pass to the callable
+        :returns: Task dictionary. Once the group has been run, the return value of the
+                  callable is available as task["result"].
+        """
+        task = {"description": description,
+                "method": method,
+                "args": args,
+                "kwargs": kwargs,
+                "result": None,
+                "error": None}
+        self._tasks.append(task)
+        return task
+
+    def run(self):
+        """
+        Runs all tasks added to the group and waits for them to complete.
+
+        :raises: TankError if any of the tasks failed
+        """
+        tasks = self._tasks
+        self._tasks = []
+        queue = list(tasks)
+
+        threads = []
+        for idx in range(min(self._concurrency, len(queue))):
+            thread = threading.Thread(target=self.__worker, args=(queue,))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        errors = ["%s: %s" % (x["description"], x["error"]) for x in tasks if x["error"]]
+        if errors:
+            raise TankError("%s tasks failed:\n%s" % (len(errors), "\n".join(errors)))
+
+    def __worker(self, queue):
+        """
+        Worker thread main loop.
+
+        :param queue: List of tasks to pull from
+        """
+        while True:
+            self._lock.acquire()
+            try:
+                if len(queue) == 0:
+                    break
+                task = queue.pop(0)
+            finally:
+                self._lock.release()
+
+            self._app.log_debug("Starting task: %s" % task["description"])
+            try:
+                task["result"] = task["method"](*task["args"], **task["kwargs"])
+            except Exception, e:
+                self._app.log_exception("Task failed: %s" % task["description"])
+                task["error"] = "%s" % e
+            else:
+                self._app.log_debug("Completed task: %s" % task["description"])
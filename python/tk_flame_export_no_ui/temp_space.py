@@ -0,0 +1,324 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+import time
+import uuid
+import json
+import errno
+import shutil
+import socket
+
+import sgtk
+from sgtk import TankError
+
+class TempSpaceManager(object):
+    """
+    Hands out temp files and folders in a temp location and reclaims the ones which
+    have been left behind by jobs that crashed or were killed.
+
+    Each allocation is covered by a lease file, written before the allocation is
+    created and removed when it is released. The lease records the node and process
+    which holds it and when it expires. A lease is reclaimed by the sweeper, together
+    with the files it covers, once it has expired, or once the process holding it has
+    died on this node and the lease hasn't been renewed for ORPHAN_GRACE_PERIOD
+    seconds. The grace period allows a retry of the job to pick up where the failed
+    job left off, see renew(). Allocations which are shared by several jobs aren't
+    tied to the process which allocated them and are only reclaimed once expired.
+
+    Sweeps run at most every SWEEP_INTERVAL seconds across all jobs sharing the temp
+    location, and straight away if the temp location is running out of space.
+    """
+
+    # number of seconds until a lease expires, unless it is renewed
+    LEASE_DURATION = 24 * 3600
+
+    # number of seconds a lease held by a dead process is kept for a retry of its job
+    ORPHAN_GRACE_PERIOD = 3600
+
+    # minimum number of seconds between sweeps
+    SWEEP_INTERVAL = 600
+
+    # temp files and folders were created without leases by earlier versions of the
+    # app. These are reclaimed once they are older than LEASE_DURATION.
+    UNLEASED_PATTERNS = [re.compile("^shotgun_flame_tmp_[0-9a-f]{32}$"),
+                         re.compile("^tk_thumb_[0-9a-f]{32}\.jpg$")]
+
+    def __init__(self, root):
+        """
+        Constructor
+
+        :param root: Temp location to allocate files and folders in
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._root = os.path.normpath(root)
+        self._lease_folder = os.path.join(root, "tk_flame_export_leases")
+        self._hostname = socket.gethostname()
+
+        if not os.path.exists(self._lease_folder):
+            try:
+                os.makedirs(self._lease_folder)
+            except OSError, e:
+                # another job may have created it in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def allocate_folder(self, prefix, duration=LEASE_DURATION, shared=False):
+        """
+        Creates a new temp folder.
+
+        :param prefix: Prefix for the folder name. The name is completed with a unique id.
+        :param duration: Number of seconds until the lease expires
+        :param shared: If True, the folder is used by several jobs and is kept until
+                       it is released or the lease expires, even if the process which
+                       allocated it has exited.
+        :returns: Path to the folder
+        """
+        path = os.path.join(self._root, "%s%s" % (prefix, uuid.uuid4().hex))
+        self.sweep()
+        self.__write_lease(path, duration, shared)
+        os.mkdir(path)
+        return path
+
+    def allocate_file(self, prefix, extension):
+        """
+        Reserves a path for a new temp file. The file itself is not created.
+
+        :param prefix: Prefix for the file name. The name is completed with a unique id.
+        :param extension: File extension, including the dot
+        :returns: Path to the file
+        """
+        path = os.path.join(self._root, "%s%s%s" % (prefix, uuid.uuid4().hex, extension))
+        self.sweep()
+        self.__write_lease(path, self.LEASE_DURATION, False)
+        return path
+
+    def renew(self, path):
+        """
+        Takes over the lease for an allocation and extends it, for example when a
+        retry of a job picks up a file left behind by the failed job.
+
+        :param path: Path returned by allocate_folder() or allocate_file()
+        :returns: True if the lease was renewed, False if it has been reclaimed
+        """
+        try:
+            lease = self.__read_lease(self.__get_lease_path(path))
+        except (IOError, OSError, ValueError):
+            return False
+        self.__write_lease(path, lease.get("duration", self.LEASE_DURATION), lease.get("pid") is None)
+        return True
+
+    def release(self, path):
+        """
+        Releases the lease for an allocation. The caller is responsible for removing
+        the allocation itself. Paths which are not covered by a lease are ignored.
+
+        :param path: Path returned by allocate_folder() or allocate_file()
+        """
+        if os.path.dirname(os.path.normpath(path)) != self._root:
+            return
+        try:
+            os.remove(self.__get_lease_path(path))
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                self._app.log_warning("Could not release temp space lease for '%s': %s" % (path, e))
+
+    def remove(self, path):
+        """
+        Removes an allocation and releases its lease.
+
+        :param path: Path returned by allocate_folder() or allocate_file()
+        """
+        self.__remove(path)
+        self.release(path)
+
+    def check_free_space(self, required_bytes):
+        """
+        Makes sure that there is enough free space in the temp location. If there isn't,
+        the temp location is swept straight away before checking again.
+
+        :param required_bytes: Number of bytes required
+        :raises: TankError if there isn't enough free space
+        """
+        free_bytes = self.get_free_space()
+        if free_bytes >= required_bytes:
+            return
+
+        self._app.log_warning("Only %s MB free in temp location '%s'. Reclaiming "
+                              "orphaned temp files..." % (free_bytes / (1024 * 1024), self._root))
+        self.sweep(force=True)
+
+        free_bytes = self.get_free_space()
+        if free_bytes < required_bytes:
+            raise TankError("Not enough free space in temp location '%s': %s MB free, %s MB "
+                            "required." % (self._root, free_bytes / (1024 * 1024), required_bytes / (1024 * 1024)))
+
+    def get_free_space(self):
+        """
+        :returns: Number of bytes available in the temp location
+        """
+        stat = os.statvfs(self._root)
+        return stat.f_bavail * stat.f_frsize
+
+    def sweep(self, force=False):
+        """
+        Reclaims orphaned temp files and folders.
+
+        :param force: If True, sweep even if the last sweep was less than SWEEP_INTERVAL seconds ago
+        """
+        stamp_path = os.path.join(self._lease_folder, "sweep.stamp")
+        try:
+            last_sweep = os.path.getmtime(stamp_path)
+        except OSError:
+            last_sweep = 0
+        if not force and time.time() - last_sweep < self.SWEEP_INTERVAL:
+            return
+
+        # let other jobs know that there is no need for them to sweep
+        open(stamp_path, "a").close()
+        os.utime(stamp_path, None)
+
+        num_reclaimed = 0
+        now = time.time()
+
+        for name in os.listdir(self._lease_folder):
+            if not name.endswith(".lease"):
+                continue
+            lease_path = os.path.join(self._lease_folder, name)
+            try:
+                lease = self.__read_lease(lease_path)
+                renewed = os.path.getmtime(lease_path)
+            except (IOError, OSError):
+                # released in the meantime
+                continue
+            except ValueError:
+                # damaged lease - treat it as expired
+                lease = {"expires": 0}
+                renewed = 0
+
+            if lease["expires"] > now and not (now - renewed > self.ORPHAN_GRACE_PERIOD and self.__is_dead(lease)):
+                continue
+
+            if self.__reclaim(lease_path, os.path.join(self._root, name[:-len(".lease")])):
+                num_reclaimed += 1
+
+        for name in os.listdir(self._root):
+            if not any(pattern.match(name) for pattern in self.UNLEASED_PATTERNS):
+                continue
+            path = os.path.join(self._root, name)
+            if os.path.exists(self.__get_lease_path(path)):
+                continue
+            try:
+                if now - os.path.getmtime(path) < self.LEASE_DURATION:
+                    continue
+            except OSError:
+                continue
+            self.__remove(path)
+            num_reclaimed += 1
+
+        if num_reclaimed:
+            self._app.log_debug("Reclaimed %s orphaned temp files and folders in '%s'." % (num_reclaimed, self._root))
+
+    def __is_dead(self, lease):
+        """
+        :param lease: Lease dictionary
+        :returns: True if the lease is held by a process on this node which no longer exists
+        """
+        if lease.get("pid") is None:
+            # shared by several jobs - wait for the lease to expire
+            return False
+        if lease.get("hostname") != self._hostname:
+            # can't tell - wait for the lease to expire
+            return False
+        try:
+            os.kill(lease["pid"], 0)
+        except OSError, e:
+            return e.errno == errno.ESRCH
+        return False
+
+    def __reclaim(self, lease_path, path):
+        """
+        Removes an allocation and its lease. The lease is claimed by renaming it first,
+        so that only one of several jobs sweeping at the same time reclaims it.
+
+        :param lease_path: Path to the lease file
+        :param path: Path to the allocation
+        :returns: True if the allocation was reclaimed by this job
+        """
+        claimed_path = "%s.%s.reclaim" % (lease_path, uuid.uuid4().hex)
+        try:
+            os.rename(lease_path, claimed_path)
+        except OSError:
+            # another job got there first
+            return False
+
+        self._app.log_debug("Reclaiming orphaned temp space '%s'." % path)
+        self.__remove(path)
+        try:
+            os.remove(claimed_path)
+        except OSError:
+            pass
+        return True
+
+    def __remove(self, path):
+        """
+        Removes a temp file or folder.
+
+        :param path: Path to remove
+        """
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError, e:
+            self._app.log_warning("Could not remove temp space '%s': %s" % (path, e))
+
+    def __read_lease(self, lease_path):
+        """
+        :param lease_path: Path to a lease file
+        :returns: Lease dictionary
+        """
+        fh = open(lease_path, "rt")
+        try:
+            return json.load(fh)
+        finally:
+            fh.close()
+
+    def __write_lease(self, path, duration, shared):
+        """
+        Writes the lease for an allocation. The lease is written to a temp file and
+        renamed into place, so that the sweeper never sees a partial lease.
+
+        :param path: Path to the allocation
+        :param duration: Number of seconds until the lease expires
+        :param shared: If True, the lease isn't tied to the current process
+        """
+        lease = {"hostname": self._hostname,
+                 "pid": None if shared else os.getpid(),
+                 "expires": time.time() + duration,
+                 "duration": duration}
+
+        lease_path = self.__get_lease_path(path)
+        tmp_path = "%s.%s.tmp" % (lease_path, uuid.uuid4().hex)
+        fh = open(tmp_path, "wt")
+        try:
+            json.dump(lease, fh)
+        finally:
+            fh.close()
+        os.rename(tmp_path, lease_path)
+
+    def __get_lease_path(self, path):
+        """
+        :param path: Path to an allocation
+        :returns: Path to the lease file for the allocation
+        """
+        return os.path.join(self._lease_folder, "%s.lease" % os.path.basename(path))
@@ -0,0 +1,159 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+import json
+import errno
+import fcntl
+import tempfile
+
+import sgtk
+
+class UploadBandwidthScheduler(object):
+    """
+    Shares the upload bandwidth to Shotgun between all the jobs uploading media.
+
+    Uploads are admitted through token buckets which fill up at the configured
+    rate. Each upload takes as many tokens as it has bytes, which may leave the
+    bucket in debt, and the next upload has to wait until the debt has been paid
+    off. Over time, uploads therefore don't exceed the configured rate, without
+    having to throttle the upload itself.
+
+    There is a bucket per node, stored in the local temp folder, and optionally a
+    global bucket shared by all nodes, stored in the backburner temp location. The
+    buckets are files which are updated under a file lock, so that all jobs, threads
+    and processes coordinate through them.
+
+    Small uploads, such as thumbnails, are admitted straight away so that they don't
+    queue up behind large movies, but they still take their tokens.
+    """
+
+    # uploads up to this size in bytes are admitted without waiting
+    SMALL_UPLOAD_SIZE = 1024 * 1024
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._app = sgtk.platform.current_bundle()
+
+        self._buckets = []
+
+        node_limit = self._app.get_setting("max_upload_mbps_per_node")
+        if node_limit > 0:
+            folder = os.path.join(tempfile.gettempdir(), "tk_flame_export_upload_bandwidth_%s" % os.getuid())
+            self._buckets.append(TokenBucket(os.path.join(folder, "node.bucket"), _mbps_to_bytes(node_limit)))
+
+        global_limit = self._app.get_setting("max_upload_mbps_global")
+        if global_limit > 0:
+            folder = os.path.join(self._app.engine.get_backburner_tmp(), "tk_flame_export_upload_bandwidth")
+            self._buckets.append(TokenBucket(os.path.join(folder, "global.bucket"), _mbps_to_bytes(global_limit)))
+
+    def acquire(self, num_bytes, poll_interval=1.0):
+        """
+        Waits until an upload may start.
+
+        :param num_bytes: Size of the upload in bytes
+        :param poll_interval: Maximum number of seconds to wait between attempts
+        """
+        priority = num_bytes <= self.SMALL_UPLOAD_SIZE
+
+        for bucket in self._buckets:
+            waiting = False
+            while True:
+                wait_time = bucket.take(num_bytes, priority)
+                if wait_time == 0:
+                    break
+                if not waiting:
+                    self._app.log_debug("Upload bandwidth limit reached. Waiting about %.1f seconds "
+                                        "before uploading %s bytes..." % (wait_time, num_bytes))
+                    waiting = True
+                # another upload may get in first, so check back regularly
+                time.sleep(min(wait_time, poll_interval))
+
+
+class TokenBucket(object):
+    """
+    Token bucket stored in a file, see UploadBandwidthScheduler.
+    """
+
+    # number of seconds worth of tokens the bucket can hold, which allows short bursts
+    BURST_SECONDS = 2.0
+
+    def __init__(self, path, rate):
+        """
+        Constructor
+
+        :param path: Path to the bucket file
+        :param rate: Rate in bytes per second at which the bucket fills up
+        """
+        self._path = path
+        self._rate = float(rate)
+
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError, e:
+                # another job may have created it in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def take(self, num_bytes, force=False):
+        """
+        Attempts to take tokens from the bucket.
+
+        :param num_bytes: Number of tokens to take
+        :param force: If True, the tokens are taken even if the bucket is in debt
+        :returns: 0 if the tokens were taken, otherwise the estimated number of
+                  seconds until the bucket is out of debt.
+        """
+        fh = open(self._path, "a+")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                fh.seek(0)
+                data = fh.read()
+                try:
+                    state = json.loads(data)
+                except ValueError:
+                    # new or damaged bucket - start full
+                    state = {"tokens": self._rate * self.BURST_SECONDS, "time": time.time()}
+
+                # top up the bucket for the time that has passed
+                now = time.time()
+                elapsed = max(0.0, now - state["time"])
+                tokens = min(self._rate * self.BURST_SECONDS, state["tokens"] + elapsed * self._rate)
+
+                if tokens < 0 and not force:
+                    wait_time = -tokens / self._rate
+                else:
+                    tokens -= num_bytes
+                    wait_time = 0
+
+                fh.seek(0)
+                fh.truncate()
+                fh.write(json.dumps({"tokens": tokens, "time": now}))
+                fh.flush()
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+        return wait_time
+
+
+def _mbps_to_bytes(mbps):
+    """
+    :param mbps: Rate in megabits per second
+    :returns: Rate in bytes per second
+    """
+    return mbps * 1000 * 1000 / 8
@@ -0,0 +1,182 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import fcntl
+import json
+
+import sgtk
+
+class WorkJournal(object):
+    """
+    Persistent record of the progress of a backburner job which processes a list
+    of items from a session manifest.
+
+    Each time a step of an item is completed, a line with the item id and the results
+    of the step (typically the ids of any Shotgun records created) is appended to
+    a journal file next to the manifest. If the job fails and is retried by backburner,
+    the journal is read back so that completed items can be skipped and partially
+    completed items can pick up where they left off, rather than creating duplicate
+    records in Shotgun.
+
+    Several jobs may process items from the same manifest at the same time, so
+    writes to the journal are serialized with a file lock. Jobs which need to act on
+    the state of the journal without other jobs changing it in the meantime can hold
+    the lock across several calls, see lock().
+    """
+
+    def __init__(self, manifest_path, name):
+        """
+        Constructor
+
+        :param manifest_path: Path to the SessionManifest file the items belong to
+        :param name: Name of the journal, e.g. 'publishes'. Each kind of work
+                     should use its own journal.
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._path = "%s.%s.journal" % (os.path.splitext(manifest_path)[0], name)
+        self._records = {}
+        # handle to the journal file while the lock is held, see lock()
+        self._lock_fh = None
+
+        if os.path.exists(self._path):
+            self.__load()
+
+    @property
+    def path(self):
+        """
+        The path to the journal file
+        """
+        return self._path
+
+    def get_record(self, item_id):
+        """
+        Returns all data recorded for an item.
+
+        :param item_id: Id of the item
+        :returns: Dictionary with the recorded data, empty if nothing has been recorded.
+        """
+        return self._records.get(item_id, {})
+
+    def is_done(self, item_id):
+        """
+        :param item_id: Id of the item
+        :returns: True if the item has been completed in this or a previous run.
+        """
+        return self.get_record(item_id).get("done", False)
+
+    def record(self, item_id, **data):
+        """
+        Records progress for an item. The data is merged with anything
+        previously recorded for the item.
+
+        :param item_id: Id of the item
+        :param data: Values to record, e.g. publish={"type": "PublishedFile", "id": 123}
+        """
+        line = "%s\n" % json.dumps({"item": item_id, "data": data}, separators=(",", ":"))
+
+        if self._lock_fh is not None:
+            # the lock is already held through this handle. Taking it again through
+            # a second handle would block forever.
+            self.__append(self._lock_fh, line)
+        else:
+            fh = open(self._path, "a+")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    self.__append(fh, line)
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+            finally:
+                fh.close()
+
+        self._records.setdefault(item_id, {}).update(data)
+
+    def mark_done(self, item_id, **data):
+        """
+        Records that an item has been completed.
+
+        :param item_id: Id of the item
+        :param data: Additional values to record
+        """
+        data["done"] = True
+        self.record(item_id, **data)
+
+    def lock(self):
+        """
+        Takes an exclusive lock on the journal, blocking other jobs from writing to it
+        until unlock() is called, and reads back the journal so that the records include
+        everything written by other jobs so far.
+        """
+        fh = open(self._path, "a+")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        except:
+            fh.close()
+            raise
+        self._lock_fh = fh
+        self._records = {}
+        self.__load()
+
+    def unlock(self):
+        """
+        Releases the lock taken by lock().
+        """
+        fh = self._lock_fh
+        self._lock_fh = None
+        try:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+    def __append(self, fh, line):
+        """
+        Appends a line to the journal file. The caller must hold the lock.
+
+        :param fh: Handle to the journal file
+        :param line: Line to append
+        """
+        # if a previous run died half way through writing a line, terminate
+        # that line so that it doesn't swallow this one.
+        fh.seek(0, os.SEEK_END)
+        if fh.tell() > 0:
+            fh.seek(-1, os.SEEK_END)
+            if fh.read(1) != "\n":
+                line = "\n%s" % line
+        fh.write(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def __load(self):
+        """
+        Reads back the journal file.
+        """
+        fh = open(self._path, "rt")
+        try:
+            lines = fh.readlines()
+        finally:
+            fh.close()
+
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line may be incomplete if the job died while writing it.
+                # The step it describes will simply be carried out again.
+                self._app.log_debug("Ignoring incomplete line in journal '%s'." % self._path)
+                continue
+            self._records.setdefault(entry["item"], {}).update(entry["data"])
+
+        self._app.log_debug("Loaded journal '%s' with %s items, "
+                            "%s completed." % (self._path,
+                                               len(self._records),
+                                               len([x for x in self._records.values() if x.get("done")])))
@@ -0,0 +1,346 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+import time
+import errno
+import socket
+import hashlib
+import tempfile
+import threading
+import traceback
+import json
+
+import sgtk
+from sgtk import TankError
+
+class WorkerDaemon(object):
+    """
+    Long lived worker which executes app backburner callbacks on behalf of other
+    backburner jobs on the same node.
+
+    The first job on a node which finds no daemon running forks one off in the
+    background (see spawn()), so the daemon starts out with toolkit and the engine
+    already loaded, and the pipeline configuration, hooks and the Shotgun connection
+    are kept warm between invocations. The daemon runs outside of backburner, so it 
+    doesn't take up a backburner slot. Other jobs connect to it via a local socket
+    (see WorkerClient) and hand over the callback they were asked to run rather
+    than running it themselves.
+
+    There is one daemon per node and pipeline configuration, see get_socket_path().
+    The daemon shuts down once it has been idle for a given amount of time. Clients
+    probing whether the daemon is available don't count as activity.
+
+    The daemon's standard output and error are discarded, so errors which stop the
+    daemon are written to a log file in the local temp folder, see get_log_path().
+    """
+
+    def __init__(self, idle_timeout, concurrency):
+        """
+        Constructor
+
+        :param idle_timeout: Number of seconds without any requests after which the daemon exits.
+        :param concurrency: Number of requests to process concurrently.
+        """
+        self._app = sgtk.platform.current_bundle()
+        self._idle_timeout = idle_timeout
+        self._semaphore = threading.Semaphore(max(1, concurrency))
+
+        # number of requests being processed and time of the last request
+        self._lock = threading.Lock()
+        self._num_active = 0
+        self._last_activity = time.time()
+
+    @classmethod
+    def spawn(cls, idle_timeout, concurrency):
+        """
+        Starts a daemon in a background process forked off the current process. The
+        background process is detached from the current process and its backburner 
+        job, so it keeps running once the job has completed.
+
+        :param idle_timeout: Number of seconds without any requests after which the daemon exits.
+        :param concurrency: Number of requests to process concurrently.
+        """
+        app = sgtk.platform.current_bundle()
+
+        pid = os.fork()
+        if pid > 0:
+            # wait for the intermediate process, which exits straight away
+            os.waitpid(pid, 0)
+            app.log_debug("Started a worker daemon for this node in the background.")
+            return
+
+        # double fork, so that the daemon is neither a child of the job nor part 
+        # of its session and process group.
+        try:
+            os.setsid()
+            if os.fork() > 0:
+                os._exit(0)
+
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            os.close(devnull)
+            sys.stdout = sys.stderr = open(os.devnull, "w")
+
+            # the Shotgun connection is shared with the job - open a new one
+            if hasattr(app.shotgun, "close"):
+                app.shotgun.close()
+
+            cls(idle_timeout, concurrency).run()
+        except:
+            # nobody is watching our output, so leave a trace on disk
+            try:
+                fh = open(get_log_path(), "a")
+                try:
+                    fh.write("%s Worker daemon %s failed:\n%s\n" % (time.ctime(), 
+                                                                   os.getpid(), 
+                                                                   traceback.format_exc()))
+                finally:
+                    fh.close()
+            except:
+                pass
+        # never return into the job's code
+        os._exit(0)
+
+    def run(self):
+        """
+        Serves requests until the daemon has been idle for longer than the idle timeout.
+        If another daemon is already serving requests on this node, returns straight away.
+        """
+        socket_path = get_socket_path()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(socket_path)
+        except socket.error, e:
+            if e.errno != errno.EADDRINUSE:
+                raise
+            if WorkerClient().is_available():
+                self._app.log_debug("A worker daemon is already running on this node. Exiting.")
+                server.close()
+                return
+            # left behind by a daemon which didn't shut down cleanly
+            self._app.log_debug("Removing stale worker socket '%s'." % socket_path)
+            os.remove(socket_path)
+            server.bind(socket_path)
+
+        self._app.log_debug("Worker daemon listening on '%s'." % socket_path)
+
+        try:
+            server.listen(16)
+            server.settimeout(1.0)
+
+            while True:
+                try:
+                    (connection, _) = server.accept()
+                except socket.timeout:
+                    if self.__is_idle():
+                        self._app.log_debug("Worker daemon idle for %s seconds. "
+                                            "Shutting down." % self._idle_timeout)
+                        break
+                    continue
+
+                self.__begin_connection()
+                thread = threading.Thread(target=self.__handle_connection, args=(connection,))
+                thread.start()
+        finally:
+            server.close()
+            try:
+                os.remove(socket_path)
+            except OSError:
+                pass
+
+        # let any requests still running complete before exiting
+        while self._num_active > 0:
+            time.sleep(0.5)
+
+    def __begin_connection(self):
+        """
+        Registers that a client has connected. The daemon doesn't shut down while
+        connections are open, but only requests count as activity.
+        """
+        self._lock.acquire()
+        try:
+            self._num_active += 1
+        finally:
+            self._lock.release()
+
+    def __end_connection(self, was_request):
+        """
+        Registers that a client connection has been closed.
+
+        :param was_request: True if the client sent a request, False if it was 
+                            only probing whether the daemon is available.
+        """
+        self._lock.acquire()
+        try:
+            self._num_active -= 1
+            if was_request:
+                self._last_activity = time.time()
+        finally:
+            self._lock.release()
+
+    def __is_idle(self):
+        """
+        :returns: True if no requests have been processed for longer than the idle timeout.
+        """
+        self._lock.acquire()
+        try:
+            return self._num_active == 0 and (time.time() - self._last_activity) > self._idle_timeout
+        finally:
+            self._lock.release()
+
+    def __handle_connection(self, connection):
+        """
+        Processes a single request and sends back the result.
+
+        :param connection: Socket for the client connection
+        """
+        line = None
+        try:
+            line = _read_line(connection)
+            if not line:
+                # availability probe from a WorkerClient
+                return
+            request = json.loads(line)
+            method_name = request["method_name"]
+            # json gives us unicode keys, so convert them before passing them as keyword args
+            kwargs = dict((str(k), v) for (k, v) in request["args"].iteritems())
+
+            self._app.log_debug("Worker daemon executing %s..." % method_name)
+            self._semaphore.acquire()
+            try:
+                getattr(self._app, method_name)(**kwargs)
+                response = {"success": True, "error": None}
+            except Exception, e:
+                self._app.log_exception("Worker daemon request %s failed." % method_name)
+                response = {"success": False, "error": "%s" % e}
+            finally:
+                self._semaphore.release()
+
+            connection.sendall("%s\n" % json.dumps(response))
+
+        except Exception, e:
+            self._app.log_warning("Worker daemon could not process request: %s" % e)
+
+        finally:
+            connection.close()
+            self.__end_connection(bool(line))
+
+
+class WorkerClient(object):
+    """
+    Hands over app callbacks to a WorkerDaemon running on the same node.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._app = sgtk.platform.current_bundle()
+
+    def is_available(self):
+        """
+        :returns: True if a worker daemon is accepting requests on this node.
+        """
+        connection = self.__connect()
+        if connection is None:
+            return False
+        connection.close()
+        return True
+
+    def invoke(self, method_name, args):
+        """
+        Executes an app method in the worker daemon and waits for it to complete.
+
+        :param method_name: Name of the app method to run
+        :param args: Dictionary of arguments to pass to the method
+        :returns: True if the request was handled by the daemon, False if no daemon
+                  is available, in which case the caller should run the method itself.
+        :raises: TankError if the method failed in the daemon.
+        """
+        connection = self.__connect()
+        if connection is None:
+            return False
+
+        self._app.log_debug("Handing %s over to the worker daemon..." % method_name)
+        try:
+            connection.sendall("%s\n" % json.dumps({"method_name": method_name, "args": args}))
+            line = _read_line(connection)
+        finally:
+            connection.close()
+
+        if not line:
+            raise TankError("The worker daemon exited before completing %s." % method_name)
+
+        response = json.loads(line)
+        if not response["success"]:
+            raise TankError("Worker daemon failed to execute %s: %s" % (method_name, response["error"]))
+
+        self._app.log_debug("...worker daemon completed %s." % method_name)
+        return True
+
+    def __connect(self):
+        """
+        :returns: Connected socket or None if no daemon is available
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(get_socket_path())
+        except socket.error:
+            connection.close()
+            return None
+        return connection
+
+
+def get_socket_path():
+    """
+    Returns the path to the worker daemon socket. The socket is node local, so
+    it lives in the local temp folder rather than in the backburner temp location.
+
+    A daemon executes callbacks with the pipeline configuration and project it was
+    started with, so each configuration and project gets a daemon of its own.
+
+    :returns: path to socket file
+    """
+    app = sgtk.platform.current_bundle()
+    project_id = app.context.project["id"] if app.context.project else None
+    config_key = "%s:%s" % (app.sgtk.pipeline_configuration.get_path(), project_id)
+    return os.path.join(tempfile.gettempdir(), "tk_flame_export_%s_%s_%s.sock" % (app.instance_name,
+                                                                                  os.getuid(),
+                                                                                  hashlib.md5(config_key).hexdigest()[:12]))
+
+def get_log_path():
+    """
+    Returns the path to the file which worker daemons write fatal errors to.
+
+    :returns: path to log file
+    """
+    return os.path.join(tempfile.gettempdir(), "tk_flame_export_worker_daemon_%s.log" % os.getuid())
+
+def _read_line(connection):
+    """
+    Reads a newline terminated message from a socket.
+
+    :param connection: Socket to read from
+    :returns: message without the newline, empty string if the connection was closed.
+    """
+    chunks = []
+    while True:
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        if "\n" in chunk:
+            chunks.append(chunk[:chunk.index("\n")])
+            break
+        chunks.append(chunk)
+    return "".join(chunks)